@@ -1,90 +1,18 @@
 import sys
 import time
 from client import ConsiditionClient
+from recommender import Recommender
 import os
 
 def should_move_on_to_next_tick(response):
     return True
 
+_recommender = Recommender()
+
 def generate_customer_recommendations(map_obj, current_tick):
     """Generate recommendations for each customer with their charging stops"""
-    
-    recommendations = []
-    nodes = map_obj.get("nodes", []) or []
-    # Collect charging stations with simple score (speed + availability)
-    stations = []
-    for node in nodes:
-        target = node.get("target") or {}
-        # print(f"Target: {node.get('target')}")
-        if target.get("Type") == "ChargingStation":
-            speed = float(target.get("chargeSpeedPerCharger", 0) or 0)
-            # print(f"Speed: {speed}")
-            avail = int(target.get("amountOfAvailableChargers", 0) or 0)
-            # print(f"Avail: {avail}")
-            stations.append({
-                "nodeId": node.get("id"),
-                "speed": speed,
-                "available": avail
-            })
-
-    if not stations:
-        return recommendations
-
-    # sort stations by speed and availability (best first)
-    stations.sort(key=lambda s: (s["speed"], s["available"]), reverse=True)
-
-    def make_targets(current_frac: float):
-        # progressive target fractions (0..1), only keep those > current_frac
-        candidate = [0.33, 0.6, 0.95]
-        targets = [t for t in candidate if t > current_frac + 1e-6]
-        return targets[:3]
-
-    # For each customer, build chargingRecommendations (nodeId + chargeTo (float))
-    for node in nodes:
-        for customer in node.get("customers", []) or []:
-            cust_id = customer.get("id")
-            # protect against malformed values
-            current_charge = float(customer.get("chargeRemaining", 0) or 0)
-            max_charge = float(customer.get("maxCharge", 1) or 1)
-            # current fraction of charge (0..1)
-            current_frac = current_charge / max_charge if max_charge > 0 else 0.0
-
-            # only recommend if below threshold (tweakable)
-            if current_frac >= 0.8:
-                continue
-
-            targets = make_targets(current_frac)
-            if not targets:
-                continue
-
-            # choose top stations (one per target) but skip stations with no available chargers
-            chosen = []
-            si = 0
-            for target in targets:
-                # find next station with available chargers (rotate through list)
-                found = None
-                for _ in range(len(stations)):
-                    s = stations[si % len(stations)]
-                    si += 1
-                    if s["available"] > 0:
-                        found = s
-                        break
-                if not found:
-                    # if no station currently available, still offer the best station (can be 0 available)
-                    found = stations[0]
-                # append recommendation (chargeTo as fraction)
-                chosen.append({
-                    "nodeId": found["nodeId"],
-                    "chargeTo": float(round(target, 6))
-                })
-
-            if chosen:
-                recommendations.append({
-                    "customerId": cust_id,
-                    "chargingRecommendations": chosen
-                })
-
-    return recommendations
+    # Customer x station cost matrix and capacity-aware assignment, see recommender.py
+    return _recommender.recommend(map_obj)
 
 
 def generate_tick(map_obj, current_tick):
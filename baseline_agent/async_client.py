@@ -0,0 +1,113 @@
+# async_client.py
+import asyncio
+import time
+import httpx
+import orjson
+from baseline_agent.client import BACKOFF, JSON_OPTIONS, POST_RETRY_STATUS, RETRIES, RETRY_STATUS
+
+CONCURRENCY = 8   # samtidiga anrop mot servern
+RATE_LIMIT = 20.0  # anrop per sekund, None = obegränsat
+
+class RateLimiter:
+    """
+    Token bucket: upp till burst anrop direkt, därefter rate anrop per sekund.
+    Ersätter fasta sleep-anrop mellan ticks.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1.0:
+                    self.tokens -= 1.0
+                    return
+                await asyncio.sleep((1.0 - self.tokens) / self.rate)
+
+class AsyncConsiditionClient:
+    """
+    Asynkron motsvarighet till ConsiditionClient för att spela många spel samtidigt:
+    - en httpx.AsyncClient med delad anslutningspool
+    - högst concurrency anrop i luften samtidigt och en gemensam rate limit
+    - anslutningsfel och 429 görs om med exponentiell backoff, för GET även 5xx
+    - eftersom flera spel delar klienten fylls tider (ms) och bytes i en timing-dict per anrop
+      i stället för last_timing
+    """
+
+    def __init__(self, base_url: str, api_key: str, concurrency=CONCURRENCY, rate=RATE_LIMIT,
+                 retries=RETRIES, timeout=None):
+        self.base_url = base_url
+        self.api_key = api_key
+        self.headers = {"x-api-key": self.api_key, "Content-Type": "application/json"}
+        if self.api_key is None:
+            # requests hoppar över None-headers, httpx kräver att de utelämnas
+            del self.headers["x-api-key"]
+        self.retries = retries
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.limiter = RateLimiter(rate) if rate else None
+        self.client = httpx.AsyncClient(
+            base_url=base_url,
+            headers=self.headers,
+            verify=False,
+            timeout=timeout,
+            # Med egen transport ignorerar httpx klientens limits, så poolgränsen sätts här.
+            transport=httpx.AsyncHTTPTransport(
+                retries=retries,
+                verify=False,
+                limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            ),
+        )
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
+
+    async def post_game(self, data: object, timing=None):
+        if not isinstance(data, (bytes, bytearray)):
+            data = orjson.dumps(data, option=JSON_OPTIONS)
+        return await self.request("POST", "/api/game", timing, content=data)
+
+    async def get_map(self, map_name: str, seed=None, timing=None):
+        return await self.request("GET", "/api/map", timing, params={"mapName": map_name})
+
+    async def request(self, method: str, endpoint: str, timing=None, **kwargs):
+        for attempt in range(self.retries + 1):
+            if self.limiter is not None:
+                await self.limiter.acquire()
+            async with self.semaphore:
+                start = time.perf_counter()
+                response = await self.client.request(method, endpoint, **kwargs)
+                received = time.perf_counter()
+            retry_status = POST_RETRY_STATUS if method == "POST" else RETRY_STATUS
+            if response.status_code in retry_status and attempt < self.retries:
+                await asyncio.sleep(BACKOFF * 2 ** attempt)
+                continue
+            response.raise_for_status()
+            content = response.content
+            try:
+                result = orjson.loads(content)
+            except orjson.JSONDecodeError:
+                result = {"__raw_text__": response.text}
+            if timing is not None:
+                done = time.perf_counter()
+                timing.update({
+                    "server_ms": (received - start) * 1000,
+                    "decode_ms": (done - received) * 1000,
+                    "total_ms": (done - start) * 1000,
+                    "request_bytes": len(kwargs.get("content") or b""),
+                    "response_bytes": len(content),
+                })
+            return result
@@ -1,28 +1,138 @@
 # client.py
+import threading
+import time
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+POOL_SIZE = 4
+RETRIES = 3
+BACKOFF = 0.2  # sekunder, fördubblas per nytt försök
+RETRY_STATUS = (429, 502, 503, 504)
+POST_RETRY_STATUS = (429,)  # POST är inte idempotent: bara svar där servern inte tagit emot anropet
+TIMING_FIELDS = ("connect_ms", "server_ms", "download_ms", "decode_ms", "total_ms", "request_bytes", "response_bytes")
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY
+
+# Uppkopplingstid per tråd, skrivs av de tidtagande anslutningarna nedan
+_connect_timing = threading.local()
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connect_timing.ms = getattr(_connect_timing, "ms", 0.0) + (time.perf_counter() - start) * 1000
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.perf_counter()
+        super().connect()
+        _connect_timing.ms = getattr(_connect_timing, "ms", 0.0) + (time.perf_counter() - start) * 1000
+
+class _TimedHTTPPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+class _TimedHTTPSPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+class _TimedAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPPool, "https": _TimedHTTPSPool}
+
+class _Retry(Retry):
+    """
+    Retry där statusbaserade omförsök gäller GET (allowed_methods) men POST bara görs om vid
+    POST_RETRY_STATUS. Anslutningsfel görs om för alla metoder, lästimeouts bara för GET.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method.upper() == "POST":
+            return status_code in POST_RETRY_STATUS
+        return super().is_retry(method, status_code, has_retry_after)
 
 class ConsiditionClient:
-    def __init__(self, base_url: str, api_key: str):
+    """
+    Klient mot Considition-API:t med en beständig keep-alive-session:
+    - anslutningar återanvänds mellan ticks via en HTTPAdapter-pool
+    - anslutningsfel och 429 görs om med exponentiell backoff, för GET även 5xx och lästimeouts
+      (ett POST som kan ha nått servern skickas inte igen)
+    - JSON kodas och avkodas med orjson
+    - last_timing innehåller tider (ms) och bytes för senaste anropet (TIMING_FIELDS):
+      connect_ms (0 vid återanvänd anslutning), server_ms, download_ms, decode_ms, total_ms,
+      request_bytes, response_bytes
+    """
+
+    def __init__(self, base_url: str, api_key: str, pool_size=POOL_SIZE, retries=RETRIES, timeout=None):
         self.base_url = base_url
         self.api_key = api_key
         self.headers = {"x-api-key": self.api_key, "Content-Type": "application/json"}
-    
+        self.timeout = timeout
+        self.last_timing = {}
+
+        retry = _Retry(
+            total=retries,
+            backoff_factor=BACKOFF,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset(["GET"]),
+            raise_on_status=False,
+        )
+        adapter = _TimedAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.verify = False
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
     def post_game(self, data: object):
-        return self.request("POST", "/api/game", json=data)
+        # Förkodad JSON (bytes) skickas som den är, annars kodas den med orjson
+        if not isinstance(data, (bytes, bytearray)):
+            data = orjson.dumps(data, option=JSON_OPTIONS)
+        return self.request("POST", "/api/game", data=data)
 
     def get_map(self, map_name: str, seed=None):
         return self.request("GET", "/api/map", params={"mapName": map_name})
 
     def request(self, method: str, endpoint: str, **kwargs):
         url = f"{self.base_url}{endpoint}"
+        kwargs.setdefault("timeout", self.timeout)
+        _connect_timing.ms = 0.0
+        start = time.perf_counter()
         try:
-            response = requests.request(method, url, headers=self.headers, verify=False, **kwargs)
+            response = self.session.request(method, url, **kwargs)
+            received = time.perf_counter()
             response.raise_for_status()
+            content = response.content
             # Try to parse JSON, but fall back to text if not JSON
+            decode_start = time.perf_counter()
             try:
-                return response.json()
-            except Exception:
-                return {"__raw_text__": response.text}
+                result = orjson.loads(content)
+            except orjson.JSONDecodeError:
+                result = {"__raw_text__": response.text}
+            done = time.perf_counter()
+            connect_ms = _connect_timing.ms
+            headers_ms = response.elapsed.total_seconds() * 1000
+            self.last_timing = {
+                "connect_ms": connect_ms,
+                "server_ms": max(headers_ms - connect_ms, 0.0),
+                "download_ms": max((received - start) * 1000 - headers_ms, 0.0),
+                "decode_ms": (done - decode_start) * 1000,
+                "total_ms": (done - start) * 1000,
+                "request_bytes": len(kwargs.get("data") or b""),
+                "response_bytes": len(content),
+            }
+            return result
         except requests.exceptions.HTTPError as e:
             # Log helpful debug info: status + body
             body = None
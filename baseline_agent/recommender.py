@@ -0,0 +1,230 @@
+# recommender.py
+import heapq
+import numpy as np
+
+CHARGE_THRESHOLD = 0.8            # kunder med högre laddningsgrad får ingen rekommendation
+CHARGE_TARGETS = (0.33, 0.6, 0.95)
+TRAVEL_KMH = 120.0                # omvandlar omväg i km till timmar i kostnaden
+MAX_ROUNDS = 32                   # kapacitetsrundor innan kvoten per runda börjar dubblas
+UNREACHABLE_COST = 1e6            # kostnad för en station som inte nås längs kanterna
+FINISHED_STATES = ("DestinationReached", "RanOutOfJuice")
+
+def _dijkstra(adj, src, num_nodes):
+    dist = np.full(num_nodes, np.inf)
+    dist[src] = 0.0
+    heap = [(0.0, src)]
+    while heap:
+        du, u = heapq.heappop(heap)
+        if du > dist[u]:
+            continue
+        for v, length in adj[u]:
+            nd = du + length
+            if nd < dist[v]:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+class StationGraph:
+    """
+    Den statiska delen av kartan, byggd en gång per kartlayout:
+    - nodindex och stationernas nodindex
+    - to_station[n, s]: grafavstånd från nod n till station s (Dijkstra på omvänd graf)
+    - from_station[s, n]: grafavstånd från station s till nod n
+    """
+
+    def __init__(self, nodes, edges):
+        self.node_ids = [n["id"] for n in nodes]
+        self.node_index = {nid: i for i, nid in enumerate(self.node_ids)}
+        self.station_nodes = np.array(
+            [i for i, n in enumerate(nodes) if (n.get("target") or {}).get("Type") == "ChargingStation"],
+            dtype=np.int64,
+        )
+        self.station_ids = [self.node_ids[i] for i in self.station_nodes]
+        num_nodes = len(nodes)
+        forward = [[] for _ in range(num_nodes)]
+        backward = [[] for _ in range(num_nodes)]
+        for a, b, length in self.edge_list(edges):
+            forward[a].append((b, length))
+            backward[b].append((a, length))
+        self.to_station = np.zeros((num_nodes, len(self.station_nodes)))
+        self.from_station = np.zeros((len(self.station_nodes), num_nodes))
+        for k, s in enumerate(self.station_nodes):
+            self.to_station[:, k] = _dijkstra(backward, s, num_nodes)
+            self.from_station[k] = _dijkstra(forward, s, num_nodes)
+
+    def edge_list(self, edges):
+        index = self.node_index
+        return [
+            (index[e["fromNode"]], index[e["toNode"]], float(e.get("length", 0) or 0))
+            for e in edges or []
+            if e.get("fromNode") in index and e.get("toNode") in index
+        ]
+
+    @staticmethod
+    def layout_key(nodes, edges):
+        return (
+            tuple(n.get("id") for n in nodes),
+            tuple((e.get("fromNode"), e.get("toNode"), e.get("length")) for e in edges or []),
+        )
+
+class Recommender:
+    """
+    Batchad, kapacitetsmedveten laddrekommendation för alla kunder i ett tick:
+    - kostnadsmatris kund x station i timmar: omväg längs kanterna (kund -> station -> mål,
+      jämfört med kundens bästa station), laddtid (behov / chargeSpeedPerCharger) och kötid,
+      där kötiden är redan tilldelad energi per station delat med stationens totala laddeffekt
+    - girig tilldelning i rundor: varje runda väljer alla kvarvarande kunder sin billigaste
+      station och varje station tar emot högst sina fungerande laddare, billigast först;
+      därefter räknas kötiden om, så att senare kunder ser lasten från tidigare
+    - stops > 1 lägger till de näst billigaste stationerna med stegvisa chargeTo
+    Grafavstånden byggs bara om när kartans noder eller kanter ändras.
+    """
+
+    def __init__(self, threshold=CHARGE_THRESHOLD, targets=CHARGE_TARGETS, stops=1, travel_kmh=TRAVEL_KMH,
+                 max_rounds=MAX_ROUNDS):
+        self.threshold = threshold
+        self.targets = tuple(sorted(targets))
+        self.stops = stops
+        self.travel_kmh = travel_kmh
+        self.max_rounds = max_rounds
+        self.graph = None
+        self._layout = None
+        self._edges = None
+
+    def _graph_for(self, nodes, edges):
+        # Samma kantlista som förra ticket behöver inte jämföras fält för fält.
+        if self.graph is None or edges is not self._edges:
+            key = StationGraph.layout_key(nodes, edges)
+            if key != self._layout:
+                self.graph = StationGraph(nodes, edges)
+                self._layout = key
+            self._edges = edges
+        return self.graph
+
+    def _stations(self, nodes, graph):
+        """Laddhastighet, lediga och fungerande laddare per station som arrayer."""
+        targets = [nodes[i].get("target") or {} for i in graph.station_nodes]
+        speed = np.array([float(t.get("chargeSpeedPerCharger", 0) or 0) for t in targets])
+        available = np.array([int(t.get("amountOfAvailableChargers", 0) or 0) for t in targets])
+        total = np.array([int(t.get("totalAmountOfChargers", 0) or 0) for t in targets])
+        broken = np.array([int(t.get("totalAmountOfBrokenChargers", 0) or 0) for t in targets])
+        working = np.maximum(total - broken, available)
+        return speed, available, working
+
+    def _customers(self, nodes, graph):
+        """Kunder som behöver laddning: id, nod, mål, laddningsgrad och maxCharge."""
+        index = graph.node_index
+        ids, node, goal, frac, max_charge = [], [], [], [], []
+        for i, n in enumerate(nodes):
+            for c in n.get("customers", []) or []:
+                if c.get("state") in FINISHED_STATES:
+                    continue
+                m = float(c.get("maxCharge", 1) or 1)
+                f = float(c.get("chargeRemaining", 0) or 0) / m if m > 0 else 0.0
+                if f >= self.threshold or f >= self.targets[-1] - 1e-6:
+                    continue
+                ids.append(c.get("id"))
+                node.append(i)
+                goal.append(index.get(c.get("toNode"), -1))
+                frac.append(f)
+                max_charge.append(m)
+        return ids, np.array(node, dtype=np.int64), np.array(goal, dtype=np.int64), np.array(frac), np.array(max_charge)
+
+    def cost_matrix(self, graph, node, goal, need, speed, working):
+        """Kostnad (timmar) kund x station utan kötid; onåbara eller trasiga stationer får UNREACHABLE_COST."""
+        detour = graph.to_station[node]                           # (C, S)
+        has_goal = goal >= 0
+        if has_goal.any():
+            # Vägen via stationen till målet, relativt den bästa stationen för kunden.
+            via = detour[has_goal] + graph.from_station[:, goal[has_goal]].T
+            with np.errstate(invalid="ignore"):
+                detour[has_goal] = via - via.min(axis=1, keepdims=True)
+        usable = (speed > 0) & (working > 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            charge_h = need[:, None] / np.where(usable, speed, 1.0)[None, :]
+        cost = detour / self.travel_kmh + charge_h
+        cost[~np.isfinite(cost)] = UNREACHABLE_COST
+        cost[:, ~usable] = UNREACHABLE_COST
+        return cost
+
+    def assign(self, cost, need, speed, available, working):
+        """
+        Kapacitetsmedveten girig tilldelning i rundor (se klassens docstring).
+        Returnerar (station per kund, slutlig kötid per station i timmar).
+        """
+        num_customers, num_stations = cost.shape
+        rate = np.maximum(speed * np.maximum(working, 1), 1e-9)   # kW per station
+        occupied = np.maximum(working - available, 0)
+        mean_need = float(need.mean()) if len(need) else 0.0
+        load = occupied * mean_need                               # kWh som redan laddas
+        # En runda motsvarar en våg av laddare; vid många kunder tar varje runda emot flera
+        # vågor, så att alla hinner fördelas med kapacitet inom max_rounds.
+        waves = max(1, -(-num_customers // (int(np.maximum(working, 1).sum()) * self.max_rounds)))
+        quota = np.maximum(working, 1) * waves
+        assigned = np.full(num_customers, -1, dtype=np.int64)
+        open_ = np.arange(num_customers)
+
+        rounds = 0
+        while len(open_):
+            # Efter max_rounds dubblas kvoten, så att resten fördelas på några få rundor
+            # i stället för att alla väljer samma station på en gång.
+            rounds += 1
+            if rounds > self.max_rounds:
+                quota = quota * 2
+            round_cost = cost[open_]
+            round_cost += load / rate
+            choice = round_cost.argmin(axis=1)
+            best = round_cost[np.arange(len(open_)), choice]
+            order = np.lexsort((best, choice))
+            chosen = choice[order]
+            group_start = np.searchsorted(chosen, chosen, side="left")
+            accept = (np.arange(len(order)) - group_start) < quota[chosen]
+            winners = open_[order[accept]]
+            assigned[winners] = chosen[accept]
+            load += np.bincount(chosen[accept], weights=need[winners], minlength=num_stations)
+            open_ = open_[np.sort(order[~accept])]
+        return assigned, load / rate
+
+    def recommend(self, map_obj):
+        """customerRecommendations med chargingRecommendations för kartans kunder."""
+        nodes = map_obj.get("nodes", []) or []
+        graph = self._graph_for(nodes, map_obj.get("edges", []) or [])
+        if not len(graph.station_nodes):
+            return []
+        ids, node, goal, frac, max_charge = self._customers(nodes, graph)
+        if not ids:
+            return []
+
+        speed, available, working = self._stations(nodes, graph)
+        final_target = self.targets[-1]
+        need = (final_target - frac) * max_charge
+        cost = self.cost_matrix(graph, node, goal, need, speed, working)
+        assigned, wait_h = self.assign(cost, need, speed, available, working)
+
+        station_ids = graph.station_ids
+        charge_to = [float(round(t, 6)) for t in self.targets]
+        if self.stops == 1:
+            top = charge_to[-1]
+            return [
+                {"customerId": cid, "chargingRecommendations": [{"nodeId": station_ids[s], "chargeTo": top}]}
+                for cid, s in zip(ids, assigned.tolist())
+            ]
+
+        # Fler stopp: de näst billigaste stationerna (utom den tilldelade) med stegvisa mål.
+        num_stops = np.minimum(
+            len(self.targets) - np.searchsorted(self.targets, frac + 1e-6, side="right"), self.stops
+        )
+        ranked = np.argsort(cost + wait_h[None, :], axis=1, kind="stable")
+        others = ranked[ranked != assigned[:, None]].reshape(len(ids), -1)[:, :self.stops - 1]
+        stations = np.concatenate([assigned[:, None], others], axis=1).tolist()
+        recommendations = []
+        for cid, row, k in zip(ids, stations, num_stops.tolist()):
+            # Högst ett stopp per station som finns, minst ett; sista stoppet får alltid slutmålet.
+            k = max(1, min(k, len(row)))
+            recommendations.append({
+                "customerId": cid,
+                "chargingRecommendations": [
+                    {"nodeId": station_ids[st], "chargeTo": t} for st, t in zip(row[:k], charge_to[-k:])
+                ],
+            })
+        return recommendations
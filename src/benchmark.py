@@ -0,0 +1,288 @@
+# Benchmarks för miljöernas, replay bufferns och policyns heta vägar.
+
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+import numpy as np
+import torch
+import env_api_simulated
+import env_map_simulated
+from env import ConsiditionEnv
+from train_api_sim_4maps import (
+    BATCH_SIZE, MEMORY_SIZE, DQN, ReplayBuffer, PrioritizedReplayBuffer, optimize_model, push_tick,
+)
+
+MAP_NAMES = ["Batterytown", "Clutchfield", "Turbohill", "Windcity"]
+CUSTOMER_COUNTS = [200, 1000, 5000, 10000]
+REPEATS = 5
+SIM_TICKS = 20           # ticks per mätning av simuleringarnas step
+EPISODE_TICKS = 100      # ticks i end-to-end-episoden
+MIN_SAMPLE_MS = 20.0     # minsta tid per mätning för korta anrop
+THRESHOLD = 0.20         # mer än 20 % långsammare än baseline räknas som regression
+BENCH_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+def scale_customers(map_obj, num_customers, seed=0):
+    """
+    Kopia av kartan med num_customers syntetiska kunder, klonade från kartans egna kunder
+    och utspridda på slumpade noder.
+    """
+    rng = random.Random(seed)
+    scaled = copy.deepcopy(map_obj)
+    nodes = scaled.get("nodes", []) or []
+    templates = [c for n in nodes for c in n.get("customers", []) or []] or [{
+        "type": "Car", "persona": "Neutral", "departureTick": 0, "chargeRemaining": 1,
+        "maxCharge": 100, "energyConsumptionPerKm": 1, "state": "Home",
+    }]
+    for n in nodes:
+        n["customers"] = []
+    node_ids = [n["id"] for n in nodes]
+    for i in range(num_customers):
+        node = rng.choice(nodes)
+        c = dict(rng.choice(templates))
+        c["id"] = f"bench.{i}"
+        c["fromNode"] = node["id"]
+        c["toNode"] = rng.choice(node_ids)
+        c["chargeRemaining"] = round(rng.uniform(0.1, 1.0), 3)
+        node["customers"].append(c)
+    return scaled
+
+def measure(fn, repeats=REPEATS, setup=None, calibrate=True):
+    """
+    Tider i ms per anrop av fn. Korta anrop körs i en loop som kalibreras till minst
+    MIN_SAMPLE_MS per mätning (som timeit.autorange), så att brus från timern inte dominerar.
+    setup körs före varje mätning, utanför tidtagningen.
+    """
+    number = 1
+    while calibrate:
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = (time.perf_counter() - start) * 1000
+        if elapsed >= MIN_SAMPLE_MS:
+            break
+        number *= 2 if elapsed * 2 >= MIN_SAMPLE_MS else 10
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        times.append((time.perf_counter() - start) * 1000 / number)
+    return {"median_ms": float(np.median(times)), "min_ms": float(np.min(times)), "number": number}
+
+def per_tick(result, ticks=SIM_TICKS):
+    return {**result, "median_ms": result["median_ms"] / ticks, "min_ms": result["min_ms"] / ticks}
+
+# Enskilda benchmarks. Var och en tar (map_name, map_obj, num_customers, repeats) och
+# returnerar en dict med tider; map_obj är redan skalad till num_customers.
+
+def bench_features(map_name, map_obj, num_customers, repeats):
+    env = ConsiditionEnv(None, None, map_name, map_obj=map_obj)
+    return measure(env.get_customer_features, repeats)
+
+def bench_nearest_station(map_name, map_obj, num_customers, repeats):
+    env = ConsiditionEnv(None, None, map_name, map_obj=map_obj)
+    customer_nodes = [n for n in map_obj["nodes"] for _ in n.get("customers", []) or []]
+    return measure(lambda: [env._find_nearest_station(n) for n in customer_nodes], repeats)
+
+def bench_build_tick(map_name, map_obj, num_customers, repeats):
+    env = ConsiditionEnv(None, None, map_name, map_obj=map_obj)
+    actions = np.random.default_rng(0).integers(0, 4, num_customers)
+    return measure(lambda: env.build_tick(actions), repeats, setup=env.ticks_sent.clear)
+
+def bench_map_sim_step(map_name, map_obj, num_customers, repeats):
+    env = env_map_simulated.ConsiditionEnv(map_name, map_obj=map_obj)
+    rng = np.random.default_rng(0)
+
+    def run():
+        for _ in range(SIM_TICKS):
+            env.step(rng.integers(0, 4, len(env.present())))
+
+    return per_tick(measure(run, repeats, setup=env.reset, calibrate=False))
+
+def bench_api_sim_step(map_name, map_obj, num_customers, repeats):
+    env = env_api_simulated.ConsiditionEnv([map_name], seed=0, num_customers=num_customers)
+    rng = np.random.default_rng(0)
+
+    def run():
+        for _ in range(SIM_TICKS):
+            env.step(rng.integers(0, 4, num_customers))
+
+    return per_tick(measure(run, repeats, setup=env.reset, calibrate=False))
+
+def bench_dqn_forward(map_name, map_obj, num_customers, repeats):
+    policy_net = DQN(5, 4)
+    states = torch.rand(num_customers, 5)
+    return measure(lambda: policy_net.act(states), repeats)
+
+def bench_replay_push(map_name, map_obj, num_customers, repeats):
+    memory = ReplayBuffer(MEMORY_SIZE, 5)
+    s = np.random.rand(num_customers, 5).astype(np.float32)
+    a = np.random.randint(0, 4, num_customers)
+    r = np.random.rand(num_customers).astype(np.float32)
+    d = np.zeros(num_customers, dtype=np.float32)
+    return measure(lambda: memory.push_batch(s, a, r, s, d), repeats)
+
+def bench_replay_sample(map_name, map_obj, num_customers, repeats):
+    memory = ReplayBuffer(MEMORY_SIZE, 5)
+    s = np.random.rand(MEMORY_SIZE, 5).astype(np.float32)
+    memory.push_batch(s, np.zeros(MEMORY_SIZE, dtype=np.int64), s[:, 0], s, s[:, 1])
+    return measure(lambda: [memory.sample(BATCH_SIZE) for _ in range(100)], repeats)
+
+def bench_per_sample(map_name, map_obj, num_customers, repeats):
+    """Prioriterad sampling plus prioritetsuppdatering, 100 minibatcher."""
+    memory = PrioritizedReplayBuffer(MEMORY_SIZE, 5)
+    s = np.random.rand(MEMORY_SIZE, 5).astype(np.float32)
+    memory.push_batch(s, np.zeros(MEMORY_SIZE, dtype=np.int64), s[:, 0], s, s[:, 1])
+    td = np.random.rand(BATCH_SIZE)
+
+    def run():
+        for _ in range(100):
+            memory.update_priorities(memory.sample(BATCH_SIZE)[-1], td)
+
+    return measure(run, repeats)
+
+def bench_episode(map_name, map_obj, num_customers, repeats):
+    """En träningsepisod end to end på den simulerade miljön: act, step, push och gradientsteg."""
+    env = env_api_simulated.ConsiditionEnv([map_name], max_ticks=EPISODE_TICKS, seed=0, num_customers=num_customers)
+    policy_net, target_net = DQN(5, 4), DQN(5, 4)
+    optimizer = torch.optim.Adam(policy_net.parameters())
+    memory = ReplayBuffer(MEMORY_SIZE, 5)
+
+    def run():
+        state = env.reset()
+        done = False
+        while not done:
+            actions = policy_net.act(state, 0.1).numpy()
+            next_state, reward, done = env.step(actions)
+            push_tick(memory, state, actions, reward, next_state, done)
+            state = next_state
+            optimize_model(policy_net, target_net, optimizer, memory)
+
+    return measure(run, max(1, repeats // 2), calibrate=False)
+
+# (namn, funktion, kartberoende). Kartoberoende benchmarks körs bara en gång per kundantal.
+BENCHMARKS = [
+    ("features", bench_features, True),
+    ("nearest_station", bench_nearest_station, True),
+    ("build_tick", bench_build_tick, True),
+    ("map_sim_step", bench_map_sim_step, True),
+    ("api_sim_step", bench_api_sim_step, False),
+    ("dqn_forward", bench_dqn_forward, False),
+    ("replay_push", bench_replay_push, False),
+    ("replay_sample", bench_replay_sample, False),
+    ("per_sample", bench_per_sample, False),
+    ("episode", bench_episode, False),
+]
+
+def run_benchmarks(map_names=MAP_NAMES, counts=CUSTOMER_COUNTS, only=None, repeats=REPEATS):
+    """Kör alla (eller de valda) benchmarks för varje karta och kundantal."""
+    torch.manual_seed(0)
+    np.random.seed(0)
+    base_maps = {m: env_map_simulated.load_map_dump(m) for m in map_names}
+    results = []
+    for count in counts:
+        scaled = {m: scale_customers(base_maps[m], count) for m in map_names}
+        for name, fn, per_map in BENCHMARKS:
+            if only and name not in only:
+                continue
+            for map_name in (map_names if per_map else map_names[:1]):
+                timing = fn(map_name, scaled[map_name], count, repeats)
+                entry = {"name": name, "map": map_name if per_map else "-", "customers": count, **timing}
+                results.append(entry)
+                print(f"{name:<16} {entry['map']:<12} {count:>6}  {timing['median_ms']:10.3f} ms")
+    return results
+
+def environment_info():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                         stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "torch_threads": torch.get_num_threads(),
+    }
+
+def _key(entry):
+    return (entry["name"], entry["map"], entry["customers"])
+
+def compare(results, baseline, threshold=THRESHOLD, metric="min_ms"):
+    """
+    Jämför mot baseline. Standardmåttet är min_ms, som störs minst av andra processer på
+    maskinen. Returnerar (regressioner, förbättringar) som listor av
+    (nyckel, baseline_ms, nu_ms, kvot) där kvoten är nu / baseline.
+    """
+    before = {_key(e): e[metric] for e in baseline.get("results", [])}
+    regressions, improvements = [], []
+    for entry in results:
+        key = _key(entry)
+        if key not in before or before[key] <= 0:
+            continue
+        ratio = entry[metric] / before[key]
+        row = (key, before[key], entry[metric], ratio)
+        if ratio > 1 + threshold:
+            regressions.append(row)
+        elif ratio < 1 - threshold:
+            improvements.append(row)
+    return regressions, improvements
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks för de heta vägarna i env, simulering, buffer och policy.")
+    parser.add_argument("--maps", nargs="+", default=MAP_NAMES)
+    parser.add_argument("--counts", type=int, nargs="+", default=CUSTOMER_COUNTS, help="antal kunder per karta")
+    parser.add_argument("--only", nargs="+", choices=[b[0] for b in BENCHMARKS], help="kör bara dessa benchmarks")
+    parser.add_argument("--repeats", type=int, default=REPEATS)
+    parser.add_argument("--out", help="resultatfil (standard benchmarks/results-<tid>.json)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline att jämföra mot")
+    parser.add_argument("--save-baseline", action="store_true", help="spara resultatet som ny baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="tillåten försämring, t.ex. 0.1 = 10 %%")
+    parser.add_argument("--metric", default="min_ms", choices=["min_ms", "median_ms"], help="mått att jämföra")
+    args = parser.parse_args()
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        # Baseline är maskinberoende och checkas inte in; utan den finns inget att jämföra mot.
+        parser.exit(1, f"Ingen baseline i {os.path.normpath(args.baseline)}. Spela in en först på den här "
+                       f"maskinen med: python benchmark.py --save-baseline\n")
+
+    results = run_benchmarks(args.maps, args.counts, args.only, args.repeats)
+    report = {"env": environment_info(), "results": results}
+
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    out = args.out or os.path.join(BENCH_DIR, f"results-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Resultat sparade till {out}")
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline sparad till {args.baseline}")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions, improvements = compare(results, baseline, args.threshold, args.metric)
+    for label, rows in (("Förbättring", improvements), ("Regression", regressions)):
+        for (name, map_name, count), before, now, ratio in rows:
+            print(f"{label}: {name} {map_name} {count}: {before:.3f} -> {now:.3f} ms ({ratio:.2f}x)")
+    if regressions:
+        raise SystemExit(1)
+    print("Inga regressioner över tröskeln.")
+
+if __name__ == "__main__":
+    main()
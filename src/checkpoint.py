@@ -0,0 +1,208 @@
+# Fullständiga checkpoints för träningen: skrivs i en bakgrundstråd, atomiskt och med retention.
+
+import copy
+import os
+import queue
+import random
+import shutil
+import threading
+import time
+import numpy as np
+import torch
+
+CHECKPOINT_DIR = "checkpoints"
+CHECKPOINT_EVERY = 25   # episoder mellan checkpoints
+KEEP_LAST = 3           # antal checkpoints som behålls på disk
+PREFIX = "ckpt-"
+LATEST_FILE = "latest"
+
+def capture_rng():
+    """Slumptillståndet för random, numpy och torch (simuleringarna och epsilon-greedy använder alla tre)."""
+    return {"python": random.getstate(), "numpy": np.random.get_state(), "torch": torch.get_rng_state()}
+
+def restore_rng(state):
+    random.setstate(state["python"])
+    np.random.set_state(state["numpy"])
+    torch.set_rng_state(state["torch"])
+
+def _clone_state_dict(state_dict):
+    return {k: v.detach().clone() for k, v in state_dict.items()}
+
+def training_state(episode, policy_net, target_net, optimizer, memory, epsilon, rewards, **extra):
+    """
+    Ögonblicksbild av hela träningstillståndet, tagen på träningstråden. Tensorer och
+    replay-arrayer kopieras, så att träningen kan fortsätta medan bakgrundstråden skriver.
+    """
+    return {
+        "episode": episode,
+        "policy": _clone_state_dict(policy_net.state_dict()),
+        "target": _clone_state_dict(target_net.state_dict()),
+        "optimizer": copy.deepcopy(optimizer.state_dict()),
+        "memory": memory.state_dict(),
+        "epsilon": epsilon,
+        "rewards": list(rewards),
+        "rng": capture_rng(),
+        **extra,
+    }
+
+def restore_training_state(state, policy_net, target_net, optimizer, memory):
+    """
+    Återställer näten, optimizern, replay buffern och slumptillståndet från en checkpoint.
+    Returnerar (nästa episod, epsilon, rewards).
+    """
+    policy_net.load_state_dict(state["policy"])
+    target_net.load_state_dict(state["target"])
+    optimizer.load_state_dict(state["optimizer"])
+    memory.load_state_dict(state["memory"])
+    restore_rng(state["rng"])
+    return state["episode"] + 1, state["epsilon"], list(state["rewards"])
+
+class Checkpointer:
+    """
+    Skriver checkpoints i directory/ckpt-<episod>/ från en bakgrundstråd:
+    - save(episod, state) köar en ögonblicksbild (se training_state) och returnerar direkt;
+      bara om förra skrivningen fortfarande pågår väntar anropet på den
+    - varje checkpoint skrivs till en tillfällig katalog och döps om atomiskt, och filen
+      "latest" pekar ut den senaste kompletta; en avbruten skrivning lämnar inget halvfärdigt
+    - bara keep_last senaste checkpoints behålls
+    - med model_path skrivs även policy-vikterna dit (som den tidigare torch.save-exporten)
+    Fel i skrivtråden kastas vid nästa save eller close.
+    """
+
+    def __init__(self, directory=CHECKPOINT_DIR, every=CHECKPOINT_EVERY, keep_last=KEEP_LAST, model_path=None):
+        self.directory = directory
+        self.every = every
+        self.keep_last = keep_last
+        self.model_path = model_path
+        self._queue = queue.Queue(maxsize=1)
+        self._error = None
+        self._thread = None
+        self.write_times = []
+
+    def due(self, episode):
+        return self.every > 0 and (episode + 1) % self.every == 0
+
+    def save(self, episode, state):
+        self._raise_error()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="checkpoint-writer", daemon=True)
+            self._thread.start()
+        self._queue.put((episode, state))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                start = time.perf_counter()
+                self._write(*item)
+                self.write_times.append(time.perf_counter() - start)
+            except Exception as e:  # rapporteras på träningstråden
+                self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _write(self, episode, state):
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{PREFIX}{episode:06d}"
+        final = os.path.join(self.directory, name)
+        tmp = os.path.join(self.directory, f".{name}.{os.getpid()}.tmp")
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+
+        # Replay buffern som .npy-filer, resten med torch.save.
+        memory = dict(state["memory"])
+        arrays = memory.pop("arrays")
+        for k, v in arrays.items():
+            np.save(os.path.join(tmp, f"replay_{k}.npy"), v)
+        torch.save({**state, "memory": memory}, os.path.join(tmp, "state.pt"))
+
+        if os.path.exists(final):
+            shutil.rmtree(final)
+        os.replace(tmp, final)
+        _atomic_text(os.path.join(self.directory, LATEST_FILE), name)
+        if self.model_path:
+            model_tmp = f"{self.model_path}.{os.getpid()}.tmp"
+            torch.save(state["policy"], model_tmp)
+            os.replace(model_tmp, self.model_path)
+        self._prune()
+
+    def _prune(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith(PREFIX))
+        for name in names[:-self.keep_last] if self.keep_last > 0 else []:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    def wait(self):
+        """Väntar tills köade checkpoints är skrivna."""
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        self._raise_error()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise RuntimeError("checkpoint kunde inte skrivas") from error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _atomic_text(path, text):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+def latest(directory=CHECKPOINT_DIR):
+    """Sökvägen till senaste kompletta checkpoint i directory, eller None."""
+    try:
+        with open(os.path.join(directory, LATEST_FILE)) as f:
+            path = os.path.join(directory, f.read().strip())
+    except OSError:
+        return None
+    return path if os.path.isdir(path) else None
+
+def load(path):
+    """
+    Läser en checkpoint (katalog, eller en checkpoints-katalog med "latest").
+    Checkpoints innehåller pickle-data (slumptillstånd) och ska bara läsas från egna körningar.
+    """
+    if not os.path.exists(os.path.join(path, "state.pt")):
+        resolved = latest(path)
+        if resolved is None:
+            raise FileNotFoundError(f"ingen checkpoint i {path}")
+        path = resolved
+    state = torch.load(os.path.join(path, "state.pt"), map_location="cpu", weights_only=False)
+    state["memory"]["arrays"] = {
+        f[len("replay_"):-len(".npy")]: np.load(os.path.join(path, f))
+        for f in os.listdir(path) if f.startswith("replay_") and f.endswith(".npy")
+    }
+    state["path"] = path
+    return state
+
+def add_arguments(parser, every=CHECKPOINT_EVERY):
+    """Lägger till de gemensamma checkpoint-flaggorna i ett argparse-kommando."""
+    parser.add_argument("--checkpoint-dir", default=CHECKPOINT_DIR, help="katalog för fullständiga checkpoints")
+    parser.add_argument("--checkpoint-every", type=int, default=every, help="episoder mellan checkpoints (0 = av)")
+    parser.add_argument("--keep-checkpoints", type=int, default=KEEP_LAST, help="antal checkpoints att behålla")
+    parser.add_argument("--resume", nargs="?", const="latest", metavar="PATH",
+                        help="fortsätt från en checkpoint (utan PATH: senaste i --checkpoint-dir)")
+    return parser
+
+def from_args(args, model_path=None):
+    """Returnerar (Checkpointer, checkpoint att återuppta eller None)."""
+    checkpointer = Checkpointer(args.checkpoint_dir, args.checkpoint_every, args.keep_checkpoints, model_path)
+    state = None
+    if args.resume:
+        state = load(args.checkpoint_dir if args.resume == "latest" else args.resume)
+        print(f"Återupptar från {state['path']} (episod {state['episode']})")
+    return checkpointer, state
@@ -0,0 +1,231 @@
+# Q-nät med delade vikter per kund och en poolad stationslastkontext per tick, med replay av hela ticks.
+
+import numpy as np
+import torch
+import torch.nn as nn
+from map_index import STATION_LOAD_FEATURES
+
+HIDDEN = 128
+CONTEXT_MEMORY = 2000   # antal ticks i replay buffern
+CONTEXT_BATCH = 8       # ticks per minibatch (varje tick innehåller alla dess kunder)
+
+def _pool(e, mask):
+    """
+    Medel och max över dim 1 av inbäddningarna e (B, N, H), bara över platser där mask (B, N)
+    är sann. Inbäddningarna är >= 0 efter ReLU, så nollade platser påverkar inte max och en
+    tom mängd ger 0.
+    """
+    if mask is None:
+        if e.shape[1] == 0:
+            return e.new_zeros(e.shape[0], 2 * e.shape[2])
+        return torch.cat([e.mean(dim=1), e.amax(dim=1)], dim=-1)
+    m = mask.unsqueeze(-1).to(e.dtype)
+    e_valid = e * m
+    mean = e_valid.sum(dim=1) / m.sum(dim=1).clamp(min=1)
+    peak = e_valid.amax(dim=1) if e.shape[1] else torch.zeros_like(mean)
+    return torch.cat([mean, peak], dim=-1)
+
+class ContextDQN(nn.Module):
+    """
+    Q-värden för alla kunder i ett tick i ett enda forward-pass:
+    - encoder: samma MLP för varje kund (delade vikter), (N, F) -> (N, H)
+    - stationslast: varje stations lastvektor (map_index.station_load: upptagna laddare, kö,
+      kunder på väg dit och lediga laddare per fungerande laddare) kodas av en delad MLP och
+      poolas med medel och max, en gång per tick
+    - kontext: stationspoolningen och medel/max av kundernas inbäddningar, projicerat till H
+    - head: Q-värden per kund ur [kundens inbäddning, tickets kontext]
+    forward tar ett tick (N, F) med stationer (S, Fs), eller en batch av ticks (B, N, F) och
+    (B, S, Fs) med maskerna (B, N) och (B, S) över giltiga platser. Utan stationer blir
+    stationsdelen av kontexten 0.
+    """
+
+    def __init__(self, input_dim, output_dim, hidden=HIDDEN, station_dim=STATION_LOAD_FEATURES):
+        super().__init__()
+        self.output_dim = output_dim
+        self.station_dim = station_dim
+        self.encoder = nn.Sequential(
+            nn.Linear(input_dim, hidden),
+            nn.ReLU(),
+            nn.Linear(hidden, hidden),
+            nn.ReLU(),
+        )
+        self.station_encoder = nn.Sequential(nn.Linear(station_dim, hidden), nn.ReLU())
+        self.context = nn.Sequential(nn.Linear(4 * hidden, hidden), nn.ReLU())
+        self.head = nn.Sequential(
+            nn.Linear(2 * hidden, hidden),
+            nn.ReLU(),
+            nn.Linear(hidden, output_dim),
+        )
+
+    def forward(self, x, mask=None, stations=None, station_mask=None):
+        single = x.dim() == 2
+        if single:
+            x = x.unsqueeze(0)
+            mask = None if mask is None else mask.unsqueeze(0)
+            stations = None if stations is None else stations.unsqueeze(0)
+            station_mask = None if station_mask is None else station_mask.unsqueeze(0)
+        if stations is None:
+            stations = x.new_zeros(x.shape[0], 0, self.station_dim)
+        e = self.encoder(x)                                      # (B, N, H)
+        load = _pool(self.station_encoder(stations), station_mask)  # (B, 2H)
+        ctx = self.context(torch.cat([_pool(e, mask), load], dim=-1))  # (B, H)
+        q = self.head(torch.cat([e, ctx.unsqueeze(1).expand_as(e)], dim=-1))
+        return q[0] if single else q
+
+    @torch.no_grad()
+    def act(self, states, epsilon=0.0, generator=None, stations=None):
+        """
+        Som DQN.act: actions för alla kunder i ett tick, med kontexten från samma ticks
+        kunder och stationslast (env.station_load()).
+        """
+        if len(states) == 0:
+            return torch.zeros(0, dtype=torch.int64)
+        x = torch.as_tensor(states, dtype=torch.float32)
+        stations = None if stations is None else torch.as_tensor(stations, dtype=torch.float32)
+        actions = self.forward(x, stations=stations).argmax(dim=1)
+        if epsilon > 0:
+            explore = torch.rand(actions.shape[0], generator=generator) < epsilon
+            actions[explore] = torch.randint(0, self.output_dim, (int(explore.sum()),), generator=generator)
+        return actions
+
+def align_next(ids, next_ids):
+    """
+    Parar ihop kunderna i ids med raderna i nästa ticks observation via stabila kund-id.
+    Returnerar (rows, present): kunden ids[j] finns kvar om present[j], och då på rad rows[j]
+    i nästa ticks state.
+    """
+    ids = np.asarray(ids)
+    next_ids = np.asarray(next_ids)
+    if len(next_ids) == 0 or len(ids) == 0:
+        return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+    order = np.argsort(next_ids, kind="stable")
+    pos = np.minimum(np.searchsorted(next_ids, ids, sorter=order), len(next_ids) - 1)
+    rows = order[pos]
+    return rows, next_ids[rows] == ids
+
+class TickReplayBuffer:
+    """
+    Ringbuffert med ett helt tick per plats, paddat till max_customers kunder:
+    s och s2 (capacity, M, F), a och r (capacity, M), mask och next_mask (capacity, M) samt d.
+    Rad j i s2 är samma kund som rad j i s (ihopparade via stabila kund-id) och
+    next_mask anger om kunden finns kvar nästa tick. r är rewarden per kund.
+    Stationslasten före och efter ticket ligger i st och st2 (capacity, S, Fs), paddat till
+    max_stations med st_mask över stationerna (samma stationer i båda).
+    """
+    FIELDS = ("s", "a", "r", "s2", "mask", "next_mask", "st", "st2", "st_mask", "d")
+
+    def __init__(self, capacity, max_customers, state_dim=5, max_stations=0, station_dim=STATION_LOAD_FEATURES):
+        self.capacity = capacity
+        self.max_customers = max_customers
+        self.state_dim = state_dim
+        self.max_stations = max_stations
+        self.station_dim = station_dim
+        m = max_customers
+        self.arrays = {
+            "s": np.zeros((capacity, m, state_dim), dtype=np.float32),
+            "a": np.zeros((capacity, m), dtype=np.int64),
+            "r": np.zeros((capacity, m), dtype=np.float32),
+            "s2": np.zeros((capacity, m, state_dim), dtype=np.float32),
+            "mask": np.zeros((capacity, m), dtype=bool),
+            "next_mask": np.zeros((capacity, m), dtype=bool),
+            "st": np.zeros((capacity, max_stations, station_dim), dtype=np.float32),
+            "st2": np.zeros((capacity, max_stations, station_dim), dtype=np.float32),
+            "st_mask": np.zeros((capacity, max_stations), dtype=bool),
+            "d": np.zeros(capacity, dtype=np.float32),
+        }
+        self.tensors = {k: torch.from_numpy(v) for k, v in self.arrays.items()}
+        self.pos = 0
+        self.size = 0
+
+    def push(self, state, ids, actions, rewards, next_state, next_ids, done, stations=None, next_stations=None):
+        """
+        Lägger in ett tick: state, actions och rewards har en rad per kund i ids, next_state
+        en rad per kund i next_ids. stations och next_stations är stationslasten före och
+        efter ticket. Kunder utöver max_customers och stationer utöver max_stations tas inte med.
+        """
+        n = min(len(ids), self.max_customers)
+        rows, present = align_next(ids[:n], next_ids)
+        row = {k: v[self.pos] for k, v in self.arrays.items() if k != "d"}
+        for v in row.values():
+            v[:] = 0
+        if n:
+            row["s"][:n] = np.asarray(state, dtype=np.float32)[:n]
+            row["a"][:n] = np.asarray(actions, dtype=np.int64)[:n]
+            row["r"][:n] = np.asarray(rewards, dtype=np.float32)[:n]
+            # Kunder som lämnat spelet behåller nollor i s2 och maskas bort via next_mask.
+            row["s2"][:n][present] = np.asarray(next_state, dtype=np.float32)[rows[present]]
+            row["mask"][:n] = True
+            row["next_mask"][:n] = present
+        k = 0 if stations is None else min(len(stations), self.max_stations)
+        if k:
+            row["st"][:k] = np.asarray(stations, dtype=np.float32)[:k]
+            row["st2"][:k] = np.asarray(next_stations, dtype=np.float32)[:k]
+            row["st_mask"][:k] = True
+        self.arrays["d"][self.pos] = float(done)
+        self.pos = (self.pos + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size):
+        """
+        batch_size slumpade ticks, beskurna till det största kund- och stationsantalet i minibatchen.
+        """
+        idx = torch.randint(0, self.size, (batch_size,))
+        width = max(1, int(self.tensors["mask"][idx].sum(dim=1).max()))
+        stations = int(self.tensors["st_mask"][idx].sum(dim=1).max()) if self.max_stations else 0
+        return tuple(
+            self.tensors[k][idx] if k == "d"
+            else self.tensors[k][idx, :stations] if k.startswith("st")
+            else self.tensors[k][idx, :width]
+            for k in self.FIELDS
+        )
+
+    def __len__(self):
+        return self.size
+
+    def state_dict(self):
+        """Kopia av hela tillståndet för checkpoints, som ReplayBuffer.state_dict."""
+        return {
+            "capacity": self.capacity,
+            "max_customers": self.max_customers,
+            "state_dim": self.state_dim,
+            "max_stations": self.max_stations,
+            "station_dim": self.station_dim,
+            "pos": self.pos,
+            "size": self.size,
+            "arrays": {k: np.array(v) for k, v in self.arrays.items()},
+        }
+
+    def load_state_dict(self, state):
+        shape = (
+            state["capacity"], state.get("max_customers"), state["state_dim"],
+            state.get("max_stations"), state.get("station_dim"),
+        )
+        own = (self.capacity, self.max_customers, self.state_dim, self.max_stations, self.station_dim)
+        if shape != own:
+            raise ValueError(f"tick-buffert har formen {own}, checkpointen {shape}")
+        for k, v in state["arrays"].items():
+            self.arrays[k][:] = v
+        self.pos = int(state["pos"])
+        self.size = int(state["size"])
+
+def optimize_context(policy_net, target_net, optimizer, memory, batch_size=CONTEXT_BATCH, gamma=0.95):
+    """
+    Ett gradientsteg på batch_size hela ticks. Målet för varje kund använder samma kunds
+    nästa state och nästa ticks kontext (kunder och stationslast); kunder som lämnat spelet
+    (eller episodens slut) bootstrappas inte. Returnerar lossen, eller None om bufferten inte
+    räcker än.
+    """
+    if len(memory) < batch_size:
+        return None
+    s_b, a_b, r_b, s2_b, mask_b, next_mask_b, st_b, st2_b, st_mask_b, d_b = memory.sample(batch_size)
+    q_val = policy_net(s_b, mask_b, st_b, st_mask_b).gather(2, a_b.unsqueeze(2)).squeeze(2)
+    with torch.no_grad():
+        next_q = target_net(s2_b, next_mask_b, st2_b, st_mask_b).max(2)[0]
+        alive = next_mask_b & (d_b == 0).unsqueeze(1)
+        target = r_b + gamma * next_q * alive
+    valid = mask_b.to(q_val.dtype)
+    loss = ((q_val - target).pow(2) * valid).sum() / valid.sum().clamp(min=1)
+    optimizer.zero_grad()
+    loss.backward()
+    optimizer.step()
+    return loss
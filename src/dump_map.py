@@ -1,9 +1,11 @@
 # Script för att dumpa kartdata från Considition API till JSON-fil.
 
-from env import ConsiditionEnv
+import argparse
 import json
 import os
 from dotenv import load_dotenv
+from baseline_agent.client import ConsiditionClient
+from map_cache import default_cache
 
 load_dotenv()
 
@@ -11,14 +13,24 @@ BASE_URL = os.getenv("BASE_URL")
 API_KEY = os.getenv("API_KEY")
 MAP_NAME = "Windcity"  # Välj karta att dumpa.
 
-# Hämtar kartdata från Considition API
-env = ConsiditionEnv(BASE_URL, API_KEY, MAP_NAME)
+parser = argparse.ArgumentParser(description="Dumpar en karta till JSON via kartcachen.")
+parser.add_argument("--map", default=MAP_NAME)
+parser.add_argument("--seed", type=int)
+parser.add_argument("--refresh", action="store_true", help="hämta från API:t även om kartan redan är cachad")
+args = parser.parse_args()
 
-map_data = env.map_obj
+# Hämtar kartdata från cachen (minne, cache/maps, maps/) och bara vid behov från Considition API
+client = ConsiditionClient(BASE_URL, API_KEY)
+cache = default_cache()
+map_data = cache.get_or_fetch(
+    args.map, args.seed, lambda name, seed: client.get_map(name, seed) if seed else client.get_map(name),
+    refresh=args.refresh,
+)
+source = "API" if cache.stats["fetch"] else "cachen"
 
 # Sparar kartdata till JSON-fil
-out_file = f"map_dump_{MAP_NAME}.json"
+out_file = f"map_dump_{args.map}.json" if args.seed is None else f"map_dump_{args.map}_{args.seed}.json"
 with open(out_file, "w") as f:
     json.dump(map_data, f, indent=2)
 
-print(f"Sparad {out_file}")
+print(f"Sparad {out_file} (från {source})")
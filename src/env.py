@@ -1,9 +1,11 @@
 # Enviroment wrapper för Considition API
 
-import copy
-import math
-from baseline_agent.client import ConsiditionClient
-from math import hypot
+import time
+import orjson
+from baseline_agent.client import JSON_OPTIONS, ConsiditionClient
+from map_cache import default_cache
+from map_index import CustomerStore, MapArrays, StationIndex, node_coords, euclid
+from routing import RouteTable
 
 class ConsiditionEnv:
     """
@@ -13,106 +15,120 @@ class ConsiditionEnv:
     - ger sammansatt reward med server-score-delta, laddningsdelta och bonus när kund försvinner
     """
 
-    def __init__(self, base_url, api_key, map_name, seed=None):
+    def __init__(self, base_url, api_key, map_name, seed=None, submit_mode="full", map_obj=None, map_cache=False):
+        """
+        submit_mode styr hur tickhistoriken skickas till /api/game:
+        - "full": hela historiken som ett dict varje tick (ursprungligt beteende)
+        - "delta": försöker starta en session och skickar sedan bara nya ticks sedan senast
+          kvitterade tick; saknar servern sessionsstöd faller den tillbaka på "checkpoint"
+        - "checkpoint": full omspelning från servern, men varje ticks JSON kodas bara en gång
+        map_obj kan ges om kartan redan är hämtad (t.ex. av den asynkrona klienten i evaluate.py).
+        map_cache=False (standard) hämtar alltid kartan från servern, så att live-spel aldrig får
+        en inaktuell kopia. True hämtar via processens map_cache (minne, disk, maps/), och en
+        MapCache-instans används som den är; slå på det för simulering och utvärdering.
+        """
         self.client = ConsiditionClient(base_url, api_key)
         self.map_name = map_name
         self.seed = seed
-        self.reset()
+        self.submit_mode = submit_mode
+        self.map_cache = default_cache() if map_cache is True else (map_cache or None)
+        self.reset(map_obj=map_obj)
 
-    def reset(self, seed_offset=0):
+    def reset(self, seed_offset=0, map_obj=None):
         effective_seed = self.seed + seed_offset if self.seed is not None else None
-        self.map_obj = self.client.get_map(self.map_name, effective_seed) if effective_seed else self.client.get_map(self.map_name)
+        if map_obj is None:
+            map_obj = self._load_map(effective_seed or None)
+        self.map_obj = map_obj
         self.total_ticks = int(self.map_obj.get("ticks", 0))
         self.ticks_sent = []
+        self._encoded_ticks = []
+        self.session_id = None
+        self.acked_ticks = 0
+        self._mode = self.submit_mode
+        self.tick_timings = []
         self.current_tick = 0
         self.last_score = 0.0
-        self.prev_customers = self._flatten_customers(self.map_obj)
         self.node_by_id = {n["id"]: n for n in self.map_obj.get("nodes", [])}
-        return self.get_customer_features()
+        # Stationsindex byggs en gång per reset och synkas sedan mot nya kartversioner.
+        self._indexed_nodes = self.map_obj.get("nodes", []) or []
+        self.station_index = StationIndex(self._indexed_nodes)
+        self.map_arrays = MapArrays(self._indexed_nodes, self.station_index)
+        # Kortaste vägar över kantgrafen, cachade på disk per karta.
+        self.routes = RouteTable.for_map(self.map_obj)
+        # Kundernas laddning/närvaro mellan ticks, för reward-diffen i step.
+        self.customers = CustomerStore()
+        cols = self._customer_columns()
+        self.customers.update(cols)
+        return self.map_arrays.features(cols, self.current_tick, self.total_ticks)
 
-    def _flatten_customers(self, map_obj):
-        d = {}
-        for node in map_obj.get("nodes", []) or []:
-            for c in node.get("customers", []) or []:
-                d[c["id"]] = copy.deepcopy(c)
-        return d
+    def _load_map(self, seed):
+        def fetch(map_name, seed):
+            return self.client.get_map(map_name, seed) if seed else self.client.get_map(map_name)
+        if self.map_cache is None:
+            return fetch(self.map_name, seed)
+        return self.map_cache.get_or_fetch(self.map_name, seed, fetch)
 
     def _node_coords(self, node):
-        if "posX" in node and "posY" in node:
-            return float(node["posX"]), float(node["posY"])
-        if "pos" in node:
-            p = node["pos"]
-            return float(p.get("x", 0.0)), float(p.get("y", 0.0))
-        return None
+        return node_coords(node)
 
     def _euclid(self, a, b):
-        if a is None or b is None:
-            return 999.0
-        return hypot(a[0]-b[0], a[1]-b[1])
+        return euclid(a, b)
 
-    def _find_nearest_station(self, node):
+    def _sync_station_index(self):
+        """
+        Uppdaterar stationsindexet om map_obj har bytts ut sedan senaste uppslaget.
+        """
         nodes = self.map_obj.get("nodes", []) or []
-        pos = self._node_coords(node)
-        stations = []
-        for n in nodes:
-            if n.get("target", {}).get("Type") == "ChargingStation":
-                targ = n.get("target", {})
-                speed = float(targ.get("chargeSpeedPerCharger", 0) or 0)
-                avail = int(targ.get("amountOfAvailableChargers", 0) or 0)
-                stations.append((n, speed, avail))
-        if not stations:
-            return None, None
-        nearest = min(stations, key=lambda t: self._euclid(pos, self._node_coords(t[0])))
-        fastest = max(stations, key=lambda t: (t[1], t[2]))
-        return nearest[0]["id"], fastest[0]["id"]
+        if nodes is not self._indexed_nodes:
+            if self.station_index.update(nodes):
+                self.map_arrays = MapArrays(nodes, self.station_index)
+            self._indexed_nodes = nodes
+
+    def _find_nearest_station(self, node):
+        self._sync_station_index()
+        return self.station_index.lookup(node)
+
+    def graph_distance(self, from_id, to_id):
+        """Avstånd längs kanterna mellan två noder (O(1) tabelluppslag)."""
+        return self.routes.distance(from_id, to_id)
+
+    def route_to(self, node, target_id):
+        """
+        pathTo-lista från noden till target_id längs kortaste vägen.
+        Faller tillbaka på [target_id] om vägen saknas eller noden redan är målet.
+        """
+        path = self.routes.path(node["id"], target_id)
+        return path if path else [target_id]
 
     # Observation/feature-extrahering
     def get_customer_features(self):
         """
         Extraherar kundfeatures i samma format som env.py — 5 features per kund.
+        Returnerar en (N, 5) float32-array som kan skickas direkt till torch.from_numpy.
         """
-        feats = []
-        nodes = self.map_obj.get("nodes", []) or []
-        coords = {n["id"]: self._node_coords(n) for n in nodes}
-        station_nodes = [n for n in nodes if n.get("target", {}).get("Type") == "ChargingStation"]
-        max_dist = 1.0
-        if station_nodes:
-            all_coords = [coords[n["id"]] for n in station_nodes if coords.get(n["id"]) is not None]
-            if all_coords:
-                xs = [c[0] for c in all_coords]; ys = [c[1] for c in all_coords]
-                max_dist = max(1.0, math.hypot(max(xs)-min(xs), max(ys)-min(ys)))
+        return self.map_arrays.features(self._customer_columns(), self.current_tick, self.total_ticks)
 
-        for node in nodes:
-            node_pos = coords.get(node["id"])
-            for c in node.get("customers", []) or []:
-                charge = float(c.get("chargeRemaining", 0) or 0)
-                max_charge = float(c.get("maxCharge", 1) or 1)
-                charge_frac = charge / max_charge if max_charge > 0 else 0.0
-                isAtStation = 1.0 if node.get("target", {}).get("Type") == "ChargingStation" else 0.0
-                dep = int(c.get("departureTick", self.total_ticks))
-                ticks_to_depart = max(0, dep - self.current_tick)
-                nearest_id, _ = self._find_nearest_station(node)
-                nearest_pos = coords.get(nearest_id) if nearest_id else None
-                dist_to_station = self._euclid(node_pos, nearest_pos) / max_dist
-                goal_node = None
-                goal_id = c.get("toNode")
-                if goal_id:
-                    goal_node = coords.get(goal_id)
-                dist_to_goal = self._euclid(node_pos, goal_node) / max_dist
-                feats.append([
-                    float(charge_frac),
-                    float(isAtStation),
-                    float(ticks_to_depart) / max(1, self.total_ticks),
-                    float(dist_to_station),
-                    float(dist_to_goal),
-                ])
-        return feats
+    def _customer_columns(self):
+        self._sync_station_index()
+        return self.map_arrays.customer_columns(self.map_obj.get("nodes", []), self.total_ticks)
 
     # Steg i miljön.
     def step(self, actions):
         """
         Skickar actions till API:et och beräknar reward.
         """
+        self.build_tick(actions)
+        try:
+            game_response = self._submit()
+        except Exception as e:
+            print(f"Error posting game: {e}")
+            return self.get_customer_features(), 0.0, True
+        return self.apply_response(game_response)
+
+    def build_tick(self, actions):
+        """
+        Mappar actions till kundrekommendationer för nuvarande tick och lägger ticket i historiken.
+        """
         nodes = self.map_obj.get("nodes", []) or []
         customers_flat = []
         for node in nodes:
@@ -132,12 +148,12 @@ class ConsiditionEnv:
             if a == 1:
                 nearest_id, _ = self._find_nearest_station(node)
                 if nearest_id:
-                    tick_actions.append({"customerId": str(cust["id"]), "pathTo": [nearest_id]})
+                    tick_actions.append({"customerId": str(cust["id"]), "pathTo": self.route_to(node, nearest_id)})
                 continue
             if a == 2:
                 _, fastest_id = self._find_nearest_station(node)
                 if fastest_id:
-                    tick_actions.append({"customerId": str(cust["id"]), "pathTo": [fastest_id]})
+                    tick_actions.append({"customerId": str(cust["id"]), "pathTo": self.route_to(node, fastest_id)})
                 continue
             if a == 3:
                 if isAtStation:
@@ -145,19 +161,19 @@ class ConsiditionEnv:
                 else:
                     _, fastest_id = self._find_nearest_station(node)
                     if fastest_id:
-                        tick_actions.append({"customerId": str(cust["id"]), "pathTo": [fastest_id]})
+                        tick_actions.append({"customerId": str(cust["id"]), "pathTo": self.route_to(node, fastest_id)})
                 continue
 
         tick_payload = {"tick": self.current_tick, "customerRecommendations": tick_actions}
         self.ticks_sent.append(tick_payload)
-        input_payload = {"mapName": self.map_name, "playToTick": self.current_tick + 1, "ticks": self.ticks_sent}
-
-        try:
-            game_response = self.client.post_game(input_payload)
-        except Exception as e:
-            print(f"Error posting game: {e}")
-            return self.get_customer_features(), 0.0, True
+        if self._mode != "full":
+            self._encoded_ticks.append(orjson.dumps(tick_payload, option=JSON_OPTIONS))
+        return tick_payload
 
+    def apply_response(self, game_response):
+        """
+        Uppdaterar kartan från serverns svar och beräknar reward. Returnerar (features, reward, done).
+        """
         prev_score = self.last_score
         new_score = (
             game_response.get("customerCompletionScore", 0)
@@ -168,33 +184,85 @@ class ConsiditionEnv:
         self.last_score = new_score
 
         new_map = game_response.get("map", self.map_obj) or self.map_obj
-        new_customers = self._flatten_customers(new_map)
-        completed = 0
-        charge_gain_reward = 0.0
-
-        for cid, prev_c in self.prev_customers.items():
-            if cid not in new_customers:
-                completed += 1
-            else:
-                new_c = new_customers[cid]
-                try:
-                    prev_charge = float(prev_c.get("chargeRemaining", 0) or 0)
-                    new_charge = float(new_c.get("chargeRemaining", 0) or 0)
-                    if new_charge > prev_charge:
-                        charge_gain_reward += (new_charge - prev_charge) * 100.0
-                except Exception:
-                    pass
-
-        self.prev_customers = new_customers
-
-        reward = base_delta + charge_gain_reward + completed * 50.0
         self.map_obj = new_map
+        cols = self._customer_columns()
+        completed, charge_gain = self.customers.update(cols)
+
+        reward = base_delta + charge_gain * 100.0 + completed * 50.0
         self.current_tick += 1
         done = self.current_tick >= self.total_ticks
 
-        next_feats = self.get_customer_features()
+        next_feats = self.map_arrays.features(cols, self.current_tick, self.total_ticks)
         return next_feats, float(reward), done
 
+    def _submit(self):
+        """
+        Skickar ticksen enligt submit_mode och registrerar tid och payloadstorlek per tick.
+        En delta som servern avvisar (t.ex. utgången session) spelas om i sin helhet.
+        """
+        mode, body, n_ticks = self.prepare_submission()
+        start = time.perf_counter()
+        try:
+            response = self.client.post_game(body)
+        except Exception:
+            if mode != "delta":
+                raise
+            self.session_id = None
+            return self._submit()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.acknowledge(mode, n_ticks, response, elapsed_ms, self.client.last_timing)
+        return response
+
+    def prepare_submission(self):
+        """
+        Bygger kroppen till /api/game för ticks som inte kvitterats. Returnerar (mode, body, antal ticks).
+        """
+        play_to = self.current_tick + 1
+        if self.session_id is not None:
+            mode = "delta"
+            head = {"mapName": self.map_name, "sessionId": self.session_id,
+                    "fromTick": self.acked_ticks, "playToTick": play_to}
+            body = self._encode(head, self._encoded_ticks[self.acked_ticks:])
+        elif self._mode == "full":
+            mode = "full"
+            body = {"mapName": self.map_name, "playToTick": play_to, "ticks": self.ticks_sent}
+        else:
+            mode = "start" if self._mode == "delta" else "checkpoint"
+            head = {"mapName": self.map_name, "playToTick": play_to}
+            if mode == "start":
+                head["startSession"] = True
+            body = self._encode(head, self._encoded_ticks)
+
+        n_ticks = len(self.ticks_sent) - self.acked_ticks if mode == "delta" else len(self.ticks_sent)
+        return mode, body, n_ticks
+
+    def acknowledge(self, mode, n_ticks, response, elapsed_ms, timing=None):
+        """
+        Registrerar ett lyckat anrop: sessions-id, kvitterade ticks och tider för ticket.
+        """
+        timing = timing or {}
+        if self._mode == "delta":
+            self.session_id = response.get("sessionId")
+            if self.session_id is None:
+                # Servern stöder inte sessioner: fortsätt med checkpointad full omspelning.
+                self._mode = "checkpoint"
+        self.acked_ticks = len(self.ticks_sent)
+
+        self.tick_timings.append({
+            "tick": self.current_tick,
+            "mode": mode,
+            "ticks_in_payload": n_ticks,
+            "payload_bytes": timing.get("request_bytes"),
+            "latency_ms": elapsed_ms,
+            **timing,
+        })
+
+    @staticmethod
+    def _encode(head, encoded_ticks):
+        """Bygger JSON-kroppen av huvudfälten och redan kodade ticks utan att koda om historiken."""
+        prefix = orjson.dumps(head)[:-1]
+        return prefix + b',"ticks":[' + b",".join(encoded_ticks) + b"]}"
+
     def sample_action(self):
         """
         Returnerar slumpmässiga actions för alla kunder i nuvarande tick.
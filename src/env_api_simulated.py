@@ -1,111 +1,176 @@
 # Simulerad miljö som efterliknar Considition API-beteendet.
 import random
+import numpy as np
+from map_index import STATION_LOAD_FEATURES
+
+NUM_CUSTOMERS = 200
+
+def generate_customers(rng, num_customers, max_ticks):
+    """
+    Drar startvärden för kunderna som struct-of-arrays.
+    Slumptalen dras kund för kund i samma ordning som den tidigare dict-versionen,
+    så samma seed ger samma startläge.
+    """
+    rows = [
+        (
+            rng.uniform(0.2, 0.9),
+            rng.random() < 0.2,
+            rng.randint(100, max_ticks),
+            rng.random(),
+            rng.random(),
+        )
+        for _ in range(num_customers)
+    ]
+    charge, at_station, departure, dist_to_station, dist_to_goal = zip(*rows) if rows else ([],) * 5
+    return {
+        "charge": np.array(charge, dtype=np.float64),
+        "at_station": np.array(at_station, dtype=bool),
+        "departureTick": np.array(departure, dtype=np.int64),
+        "dist_to_station": np.array(dist_to_station, dtype=np.float64),
+        "dist_to_goal": np.array(dist_to_goal, dtype=np.float64),
+        "active": np.ones(num_customers, dtype=bool),
+    }
+
+def simulate_step(c, acts, processed):
+    """
+    Tillämpar ett ticks dynamik på alla kunder samtidigt med maskade arrayoperationer.
+    c är en dict av arrayer (valfri form, t.ex. (C,) eller (K, C)) som uppdateras på plats,
+    acts har samma form och processed anger vilka kunder som simuleras detta tick.
+    Returnerar reward per kund.
+    """
+    charge = c["charge"]
+    at_station = c["at_station"]
+    reward = np.zeros(charge.shape, dtype=np.float64)
+
+    # 0: gör inget
+    m = processed & (acts == 0)
+    reward[m] -= 0.05  # ineffektivt att stå still
+
+    # 1: åk till närmaste station.
+    m = processed & (acts == 1)
+    at_station[m] = True
+    c["dist_to_station"][m] = 0.0
+    c["dist_to_goal"][m] *= 0.95
+    reward[m] += 0.2
+
+    # 2: åk till snabbaste station.
+    m = processed & (acts == 2)
+    at_station[m] = True
+    c["dist_to_station"][m] = 0.0
+    charge[m] = np.minimum(1.0, charge[m] + 0.15)
+    reward[m] += 0.4
+
+    # 3: ladda till 95% (om vid station).
+    m = processed & (acts == 3)
+    charging = m & at_station
+    gain = np.maximum(0, 0.95 - charge[charging])
+    charge[charging] += 0.3 * gain
+    reward[charging] += gain * 3.0
+    reward[m & ~at_station] -= 0.2  # försökte ladda men ej vid station
+
+    # Rörelse och avresa.
+    dist_to_goal = c["dist_to_goal"]
+    dist_to_goal[processed] = np.maximum(0, dist_to_goal[processed] - 0.02 * charge[processed])
+    charge[processed] = np.maximum(0, charge[processed] - 0.03)
+    departure = c["departureTick"]
+    departure[processed] -= 1
+
+    reached = processed & (dist_to_goal < 0.05) & (departure > 0)
+    reward[reached] += 2.0  # bonus för att nå mål
+    missed = processed & ~reached & (departure <= 0)  # missad avgång, ingen reward
+    c["active"][reached | missed] = False
+    return reward
+
+def customer_features(c, max_ticks, mask):
+    """
+    Samma struktur som env.py — 5 features per kund, för kunderna i mask.
+    """
+    feats = np.empty((int(mask.sum()), 5), dtype=np.float32)
+    feats[:, 0] = c["charge"][mask]
+    feats[:, 1] = c["at_station"][mask]
+    feats[:, 2] = c["departureTick"][mask] / max_ticks
+    feats[:, 3] = c["dist_to_station"][mask]
+    feats[:, 4] = c["dist_to_goal"][mask]
+    return feats
 
 class ConsiditionEnv:
     """
     Simulerad miljö som efterliknar Considition API-beteende:
     Använder samma featurestruktur som env.py men kör lokalt utan nätverksanrop.
+    Kunderna lagras som struct-of-arrays och stegas vektoriserat.
     """
 
-    def __init__(self, map_names=None, max_ticks=300):
+    def __init__(self, map_names=None, max_ticks=300, seed=None, num_customers=NUM_CUSTOMERS):
         """
         Initialisera den simulerade miljön.
+        Utan seed används den globala random-modulen.
         """
         self.map_names = map_names or ["Batterytown", "Clutchfield", "Turbohill", "Thunderroad", "Windcity"]
         self.max_ticks = max_ticks
+        self.num_customers = num_customers
+        self.rng = random.Random(seed) if seed is not None else random
         self.reset()
 
     def reset(self):
         """
         Startar om miljön till starttillståndet.
         """
-        self.map_name = random.choice(self.map_names)
+        self.map_name = self.rng.choice(self.map_names)
         self.tick = 0
         self.done = False
 
         # generera kunder
-        self.num_customers = 200
-        self.customers = [
-            {
-                "charge": random.uniform(0.2, 0.9),
-                "max_charge": 1.0,
-                "at_station": random.random() < 0.2,
-                "departureTick": random.randint(100, self.max_ticks),
-                "dist_to_station": random.random(),
-                "dist_to_goal": random.random(),
-                "active": True,
-            }
-            for _ in range(self.num_customers)
-        ]
+        self.customers = generate_customers(self.rng, self.num_customers, self.max_ticks)
+        self.customer_rewards = np.zeros(self.num_customers)
         return self.get_customer_features()
 
     def get_customer_features(self):
         """
-        Samma struktur som env.py — 5 features per kund.
+        Samma struktur som env.py — 5 features per aktiv kund, som en (N, 5) float32-array.
         """
-        feats = []
-        for c in self.customers:
-            if not c["active"]:
-                continue
-            feats.append([
-                c["charge"],
-                float(c["at_station"]),
-                c["departureTick"] / self.max_ticks,
-                c["dist_to_station"],
-                c["dist_to_goal"],
-            ])
-        return feats
-
-    def step(self, actions):
+        return customer_features(self.customers, self.max_ticks, self.customers["active"])
+
+    def active_ids(self):
+        """
+        Stabila kund-id (kundplatsernas index) för raderna i get_customer_features, i samma ordning.
+        """
+        return np.flatnonzero(self.customers["active"])
+
+    def station_load(self):
+        """
+        Lasten per station som i env_map_simulated; simuleringen har inga stationer, så
+        arrayen är tom och ContextDQN får bara kundkontexten.
+        """
+        return np.zeros((0, STATION_LOAD_FEATURES), dtype=np.float32)
+
+    def step(self, actions, customer_ids=None):
         """
         Simulerar kundernas beteende och beräknar reward baserat på actions.
+        Action i hör till kundplats i, precis som när actions zippades mot kundlistan;
+        kunder bortom len(actions) simuleras inte detta tick.
+        Med customer_ids (t.ex. active_ids() för observationen) hör action i i stället till
+        kund customer_ids[i] och bara de kunderna simuleras.
+        Rewarden per kundplats för ticket finns efteråt i customer_rewards.
         """
-        total_reward = 0.0
-
-        for c, act in zip(self.customers, actions):
-            if not c["active"]:
-                continue
-
-            # 0: gör inget
-            if act == 0:
-                total_reward -= 0.05  # ineffektivt att stå still
-
-            # 1: åk till närmaste station.
-            elif act == 1:
-                c["at_station"] = True
-                c["dist_to_station"] = 0.0
-                c["dist_to_goal"] *= 0.95
-                total_reward += 0.2
-
-            # 2: åk till snabbaste station.
-            elif act == 2:
-                c["at_station"] = True
-                c["dist_to_station"] = 0.0
-                c["charge"] = min(1.0, c["charge"] + 0.15)
-                total_reward += 0.4
-
-            # 3: ladda till 95% (om vid station).
-            elif act == 3:
-                if c["at_station"]:
-                    gain = max(0, 0.95 - c["charge"])
-                    c["charge"] += 0.3 * gain
-                    total_reward += gain * 3.0
-                else:
-                    total_reward -= 0.2  # försökte ladda men ej vid station
-
-            # Rörelse och avresa.
-            c["dist_to_goal"] = max(0, c["dist_to_goal"] - 0.02 * c["charge"])
-            c["charge"] = max(0, c["charge"] - 0.03)
-            c["departureTick"] -= 1
-
-            if c["dist_to_goal"] < 0.05 and c["departureTick"] > 0:
-                total_reward += 2.0  # bonus för att nå mål
-                c["active"] = False
-            elif c["departureTick"] <= 0:
-                c["active"] = False  # missad avgång, ingen reward
+        actions = np.asarray(actions, dtype=np.int64).reshape(-1)
+        acts = np.full(self.num_customers, -1, dtype=np.int64)
+        if customer_ids is None:
+            n = min(len(actions), self.num_customers)
+            acts[:n] = actions[:n]
+            processed = self.customers["active"].copy()
+            processed[n:] = False
+        else:
+            ids = np.asarray(customer_ids, dtype=np.int64)[:len(actions)]
+            acts[ids] = actions[:len(ids)]
+            processed = np.zeros(self.num_customers, dtype=bool)
+            processed[ids] = True
+            processed &= self.customers["active"]
+
+        self.customer_rewards = simulate_step(self.customers, acts, processed)
+        total_reward = float(self.customer_rewards.sum())
 
         self.tick += 1
-        done = self.tick >= self.max_ticks or all(not c["active"] for c in self.customers)
+        done = self.tick >= self.max_ticks or not self.customers["active"].any()
         next_state = self.get_customer_features()
 
         return next_state, total_reward, done
@@ -114,5 +179,5 @@ class ConsiditionEnv:
         """
         Slumpmässiga actions för test.
         """
-        num_active = sum(1 for c in self.customers if c["active"])
-        return [random.randint(0, 3) for _ in range(num_active)]
+        num_active = int(self.customers["active"].sum())
+        return [self.rng.randint(0, 3) for _ in range(num_active)]
@@ -0,0 +1,420 @@
+# Kartbaserad lokal simulering av Considition-spelet på de dumpade kartorna i maps/.
+
+import os
+import numpy as np
+from map_cache import MAPS_DIR, MapCache, default_cache
+from map_index import MapArrays, StationIndex, is_station, station_load
+from routing import RouteTable
+
+TICK_HOURS = 24.0 / 288     # 288 ticks per dygn, dvs fem minuter per tick
+SPEED_KM_PER_TICK = 10.0    # körsträcka per tick längs kanterna
+DEFAULT_CHARGE_TO = 0.95
+KWH_PRICE = 0.5             # score per laddad kWh
+COMPLETION_SCORE = 10.0     # score per kund som når sitt mål
+MAX_HOPS_PER_TICK = 16
+
+# Kundtillstånd
+WAITING, TRAVELING, CHARGING, DONE, STRANDED = range(5)
+STATE_NAMES = ["Home", "Traveling", "Charging", "DestinationReached", "RanOutOfJuice"]
+
+def load_map_dump(map_name, maps_dir=MAPS_DIR):
+    """
+    Läser en dumpad karta (maps/map_dump_<namn>.json) via kartcachen, så att den bara tolkas
+    som JSON första gången. Kartan delas mellan anropare och får inte muteras.
+    """
+    cache = default_cache() if os.path.abspath(maps_dir) == os.path.abspath(MAPS_DIR) else MapCache(cache_dir=None, maps_dir=maps_dir)
+    map_obj = cache.get(map_name)
+    if map_obj is None:
+        raise FileNotFoundError(os.path.join(maps_dir, f"map_dump_{map_name}.json"))
+    return map_obj
+
+def available_maps(maps_dir=MAPS_DIR):
+    """Namnen på alla dumpade kartor i maps_dir."""
+    return sorted(
+        f[len("map_dump_"):-len(".json")]
+        for f in os.listdir(maps_dir)
+        if f.startswith("map_dump_") and f.endswith(".json")
+    )
+
+class ConsiditionEnv:
+    """
+    Lokal simulering på en riktig kartgraf:
+    - kunderna följer kortaste vägen längs kanterna (length) och förbrukar
+      energyConsumptionPerKm per kilometer
+    - stationer laddar högst amountOfAvailableChargers kunder samtidigt med
+      chargeSpeedPerCharger kW; övriga köar i ankomstordning
+    - actions och observationer har samma form som env.py (5 features per kund via MapArrays)
+    """
+
+    def __init__(self, map_name="Batterytown", map_obj=None, maps_dir=MAPS_DIR, columns=None):
+        """
+        Kartan tas från map_obj, från columns (en ColumnarMap från map_columns.py, som
+        memory-mappas i stället för att tolkas från JSON) eller från maps_dir.
+        """
+        self.columns = columns
+        self._map_obj = map_obj
+        if columns is not None:
+            self._init_from_columns(columns)
+        else:
+            if map_obj is None:
+                self._map_obj = load_map_dump(map_name, maps_dir)
+            self._init_from_map(self._map_obj, map_name)
+        self.customer_index = {str(cid): i for i, cid in enumerate(self.customer_ids)}
+        self.station_nodes = np.flatnonzero(self.map_arrays.at_station[:-1] > 0)
+        self.reset()
+
+    def _init_from_map(self, map_obj, map_name):
+        self.map_name = map_obj.get("name", map_name)
+        self.total_ticks = int(map_obj.get("ticks", 288))
+
+        nodes = map_obj.get("nodes", []) or []
+        self.station_index = StationIndex(nodes)
+        self.map_arrays = MapArrays(nodes, self.station_index)
+        node_index = self.map_arrays.node_index
+        num_nodes = len(nodes)
+
+        self.routes = RouteTable.for_map(map_obj)
+        self.dist, self.next_hop = self.routes.dist, self.routes.next_hop
+
+        self.chargers = np.zeros(num_nodes, dtype=np.int64)
+        self.charge_speed = np.zeros(num_nodes, dtype=np.float64)
+        for i, node in enumerate(nodes):
+            if is_station(node):
+                target = node.get("target") or {}
+                self.chargers[i] = int(target.get("amountOfAvailableChargers", 0) or 0)
+                self.charge_speed[i] = float(target.get("chargeSpeedPerCharger", 0) or 0)
+        self.nearest_station = np.array(
+            [node_index.get(self.station_index.nearest_by_node.get(nid), -1) for nid in self.map_arrays.node_ids],
+            dtype=np.int64,
+        )
+        self.fastest_station = node_index.get(self.station_index.fastest_id, -1)
+
+        # Kundernas startläge tolkas en gång; reset kopierar bara arrayerna.
+        ids, node, goal, charge, max_charge, consumption, departure = [], [], [], [], [], [], []
+        for n in nodes:
+            for c in n.get("customers", []) or []:
+                ids.append(c["id"])
+                node.append(node_index[n["id"]])
+                goal.append(node_index.get(c.get("toNode"), node_index[n["id"]]))
+                charge.append(float(c.get("chargeRemaining", 0) or 0))
+                max_charge.append(float(c.get("maxCharge", 1) or 1))
+                consumption.append(float(c.get("energyConsumptionPerKm", 0) or 0))
+                departure.append(int(c.get("departureTick", 0) or 0))
+        self.customer_ids = ids
+        self._initial = {
+            "node": np.array(node, dtype=np.int64),
+            "goal": np.array(goal, dtype=np.int64),
+            "charge": np.array(charge, dtype=np.float64),
+            "max_charge": np.array(max_charge, dtype=np.float64),
+            "consumption": np.array(consumption, dtype=np.float64),
+            "departure": np.array(departure, dtype=np.int64),
+        }
+
+    def _init_from_columns(self, columns):
+        self.map_name = columns.name
+        self.total_ticks = int(columns.ticks)
+        self.station_index = None
+        self.map_arrays = MapArrays.from_columns(columns)
+
+        self.routes = RouteTable.for_graph(self.map_arrays.node_ids, columns.graph_edges())
+        self.dist, self.next_hop = self.routes.dist, self.routes.next_hop
+
+        # Skrivskyddade vyer direkt i filerna; simuleringen läser bara dessa.
+        self.chargers = columns.node_chargers
+        self.charge_speed = columns.node_charge_speed
+        self.nearest_station = columns.node_nearest_station
+        self.fastest_station = columns.fastest_station()
+
+        self.customer_ids = columns.customer_id.tolist()
+        self._initial = {
+            "node": columns.customer_node,
+            "goal": np.where(columns.customer_to >= 0, columns.customer_to, columns.customer_node),
+            "charge": columns.customer_charge,
+            "max_charge": columns.customer_max_charge,
+            "consumption": columns.customer_consumption,
+            "departure": columns.customer_departure,
+        }
+
+    @property
+    def base_map(self):
+        """Kartan i API-format; byggs från kolumnerna först när den behövs."""
+        if self._map_obj is None:
+            self._map_obj = self.columns.to_map_obj()
+        return self._map_obj
+
+    def reset(self):
+        """
+        Startar om från kartans startläge (alla kunder hemma). Returnerar features.
+        """
+        initial = self._initial
+        self.node = np.array(initial["node"], dtype=np.int64)
+        self.goal = np.array(initial["goal"], dtype=np.int64)
+        self.dest = self.goal.copy()
+        self.charge = np.array(initial["charge"], dtype=np.float64)  # andel av maxCharge
+        self.max_charge = np.array(initial["max_charge"], dtype=np.float64)
+        self.consumption = np.array(initial["consumption"], dtype=np.float64)
+        self.departure = np.array(initial["departure"], dtype=np.int64)
+        n = len(self.customer_ids)
+        self.state = np.full(n, WAITING, dtype=np.int64)
+        self.to_station = np.zeros(n, dtype=bool)
+        self.charge_to = np.full(n, DEFAULT_CHARGE_TO, dtype=np.float64)
+        self.edge_next = np.full(n, -1, dtype=np.int64)
+        self.edge_left = np.zeros(n, dtype=np.float64)
+        self.queue_seq = np.zeros(n, dtype=np.int64)
+        self._seq = 0
+
+        self.tick = 0
+        self.kwh_revenue = 0.0
+        self.completion_score = 0.0
+        self.customer_rewards = np.zeros(n)
+        return self.get_customer_features()
+
+    @property
+    def score(self):
+        return self.kwh_revenue + self.completion_score
+
+    def present(self):
+        """Index för kunder som fortfarande är med i spelet, i den ordning actions tolkas."""
+        return np.flatnonzero(self.state <= CHARGING)
+
+    def active_ids(self):
+        """Stabila kund-id (index i customer_ids) för raderna i get_customer_features."""
+        return self.present()
+
+    def get_customer_features(self):
+        """
+        Samma 5 features som env.py, beräknade med MapArrays för kunderna i present().
+        Laddningen normeras med maxCharge precis som i env.py (chargeRemaining / maxCharge),
+        så att modellen ser samma skala offline som live.
+        """
+        idx = self.present()
+        cols = {
+            "node": self.node[idx],
+            "charge": self.charge[idx],
+            "max_charge": self.max_charge[idx],
+            "departure": self.departure[idx],
+            "to_node": self.goal[idx],
+        }
+        return self.map_arrays.features(cols, self.tick, self.total_ticks)
+
+    def station_load(self):
+        """
+        Lasten per station i station_nodes (map_index.station_load): laddande och köande kunder
+        ur simuleringens kö samt kunder som är skickade till stationen men inte framme än.
+        """
+        n = len(self.chargers)
+        queue = np.bincount(self.node[self.state == CHARGING], minlength=n)[self.station_nodes]
+        heading = self.to_station & (self.state < CHARGING)
+        incoming = np.bincount(self.dest[heading], minlength=n)[self.station_nodes]
+        working = self.chargers[self.station_nodes]
+        in_use = np.minimum(queue, working)
+        return station_load(working, in_use, queue - in_use, incoming)
+
+    def recommend(self, customers, station, charge_to=DEFAULT_CHARGE_TO):
+        """
+        Skickar kunderna (index-array) till stationsnoden station och laddar till charge_to där.
+        Kunder som redan laddar behåller sin station.
+        """
+        customers = customers[self.state[customers] != CHARGING]
+        if len(customers) == 0 or station is None or station < 0:
+            return
+        self.dest[customers] = station
+        self.to_station[customers] = True
+        self.charge_to[customers] = charge_to
+        # Står kunden redan på stationen börjar laddningen direkt.
+        here = customers[(self.node[customers] == station) & (self.edge_left[customers] <= 0)]
+        self._start_charging(here)
+
+    def _start_charging(self, customers):
+        if len(customers) == 0:
+            return
+        self.state[customers] = CHARGING
+        self.to_station[customers] = False
+        self.queue_seq[customers] = self._seq + np.arange(len(customers))
+        self._seq += len(customers)
+
+    def charge_here(self, customers, charge_to=DEFAULT_CHARGE_TO):
+        """
+        Börjar ladda kunderna (index-array) på noden de står på, om den är en station.
+        """
+        customers = customers[
+            (self.map_arrays.at_station[self.node[customers]] > 0)
+            & (self.edge_left[customers] <= 0)
+            & (self.state[customers] != CHARGING)
+        ]
+        self.dest[customers] = self.node[customers]
+        self.charge_to[customers] = charge_to
+        self._start_charging(customers)
+
+    def step(self, actions, customer_ids=None):
+        """
+        Tolkar actions som i env.py (0 inget, 1 närmaste station, 2 snabbaste station,
+        3 ladda här om vid station annars snabbaste) och simulerar ett tick.
+        Action i hör till kund present()[i], eller customer_ids[i] om customer_ids ges.
+        Rewarden per kund för ticket finns efteråt i customer_rewards.
+        """
+        idx = self.present() if customer_ids is None else np.asarray(customer_ids, dtype=np.int64)
+        acts = np.zeros(len(idx), dtype=np.int64)
+        actions = np.asarray(actions, dtype=np.int64).reshape(-1)[:len(idx)]
+        acts[:len(actions)] = actions
+
+        at_station = self.map_arrays.at_station[self.node[idx]] > 0
+        self.charge_here(idx[(acts == 3) & at_station])
+
+        nearest = idx[acts == 1]
+        for station in np.unique(self.nearest_station[self.node[nearest]]):
+            self.recommend(nearest[self.nearest_station[self.node[nearest]] == station], station)
+        self.recommend(idx[(acts == 2) | ((acts == 3) & ~at_station)], self.fastest_station)
+
+        reward = self.advance()
+        done = self.tick >= self.total_ticks or len(self.present()) == 0
+        return self.get_customer_features(), float(reward), done
+
+    def advance(self):
+        """
+        Simulerar ett tick (avresor, laddning, förflyttning) och returnerar rewarden
+        i samma form som env.py: score-delta + laddningsökning * 100 + avslutade kunder * 50.
+        Samma reward fördelad per kund (laddintäkt, laddningsökning och målbonus) hamnar i
+        customer_rewards.
+        """
+        prev_charge = self.charge.copy()
+        prev_score = self.score
+        prev_done = self.state == DONE
+        self.customer_rewards = np.zeros(len(self.state))
+
+        leaving = (self.state == WAITING) & (self.departure <= self.tick)
+        self.state[leaving] = TRAVELING
+
+        self._charge()
+        completed = self._move()
+
+        gain = np.maximum(0.0, self.charge - prev_charge)
+        self.customer_rewards += gain * 100.0
+        self.customer_rewards[(self.state == DONE) & ~prev_done] += COMPLETION_SCORE + 50.0
+        self.tick += 1
+        return (self.score - prev_score) + gain.sum() * 100.0 + completed * 50.0
+
+    def apply_recommendations(self, recommendations):
+        """
+        Tillämpar API-formaterade customerRecommendations: pathTo (sista noden är målet),
+        chargeTo (ladda på nuvarande station) eller chargingRecommendations (första stationen).
+        """
+        node_index = self.map_arrays.node_index
+        for rec in recommendations or []:
+            ci = self.customer_index.get(str(rec.get("customerId")))
+            if ci is None or self.state[ci] > CHARGING:
+                continue
+            customers = np.array([ci], dtype=np.int64)
+            charging = rec.get("chargingRecommendations") or []
+            if charging:
+                station = node_index.get(str(charging[0].get("nodeId")), -1)
+                self.recommend(customers, station, float(charging[0].get("chargeTo", DEFAULT_CHARGE_TO)))
+            elif rec.get("pathTo"):
+                self.recommend(customers, node_index.get(str(rec["pathTo"][-1]), -1))
+            elif "chargeTo" in rec:
+                self.charge_here(customers, float(rec["chargeTo"]))
+
+    def to_map_obj(self):
+        """
+        Nuvarande läge i samma form som API:ets karta. Kunder som är kvar i spelet ligger
+        på sin senast passerade nod, och stationernas lediga laddare räknas om utifrån kön.
+        """
+        idx = self.present()
+        charging = np.bincount(self.node[self.state == CHARGING], minlength=len(self.chargers))
+        by_node = {}
+        for ci in idx:
+            by_node.setdefault(int(self.node[ci]), []).append({
+                "id": self.customer_ids[ci],
+                "fromNode": self.map_arrays.node_ids[self.node[ci]],
+                "toNode": self.map_arrays.node_ids[self.goal[ci]],
+                "departureTick": int(self.departure[ci]),
+                "chargeRemaining": float(self.charge[ci]),
+                "maxCharge": float(self.max_charge[ci]),
+                "energyConsumptionPerKm": float(self.consumption[ci]),
+                "state": STATE_NAMES[self.state[ci]],
+            })
+        nodes = []
+        for i, node in enumerate(self.base_map.get("nodes", []) or []):
+            out = dict(node)
+            out["customers"] = by_node.get(i, [])
+            if is_station(node):
+                out["target"] = dict(node.get("target") or {})
+                out["target"]["amountOfAvailableChargers"] = int(max(0, self.chargers[i] - charging[i]))
+            nodes.append(out)
+        return {**self.base_map, "nodes": nodes}
+
+    def _charge(self):
+        """
+        Laddar köande kunder: per station får de amountOfAvailableChargers första i kön ladda.
+        """
+        idx = np.flatnonzero(self.state == CHARGING)
+        if len(idx) == 0:
+            return
+        order = np.lexsort((self.queue_seq[idx], self.node[idx]))
+        idx = idx[order]
+        station = self.node[idx]
+        starts = np.r_[True, station[1:] != station[:-1]]
+        group_start = np.maximum.accumulate(np.where(starts, np.arange(len(idx)), 0))
+        plugged = idx[(np.arange(len(idx)) - group_start) < self.chargers[station]]
+
+        kwh = self.charge_speed[self.node[plugged]] * TICK_HOURS
+        room = np.maximum(0.0, self.charge_to[plugged] - self.charge[plugged])
+        frac = np.minimum(room, kwh / self.max_charge[plugged])
+        self.charge[plugged] += frac
+        self.customer_rewards[plugged] += frac * self.max_charge[plugged] * KWH_PRICE
+        self.kwh_revenue += float((frac * self.max_charge[plugged]).sum()) * KWH_PRICE
+
+        finished = idx[self.charge[idx] >= self.charge_to[idx] - 1e-9]
+        self.dest[finished] = self.goal[finished]
+        self.state[finished] = np.where(self.departure[finished] > self.tick, WAITING, TRAVELING)
+
+    def _move(self):
+        """
+        Flyttar resande kunder SPEED_KM_PER_TICK km längs kortaste vägen mot dest.
+        Returnerar antalet kunder som nådde sitt mål.
+        """
+        budget = np.where(self.state == TRAVELING, SPEED_KM_PER_TICK, 0.0)
+        completed = 0
+        for _ in range(MAX_HOPS_PER_TICK):
+            moving = (self.state == TRAVELING) & (budget > 0)
+            if not moving.any():
+                break
+
+            # Kunder som står på en nod: framme, eller välj nästa kant.
+            at_node = moving & (self.edge_left <= 0)
+            arrived = np.flatnonzero(at_node & (self.node == self.dest))
+            if len(arrived):
+                to_station = self.to_station[arrived]
+                home = arrived[~to_station]
+                self._start_charging(arrived[to_station])
+                self.state[home] = DONE
+                completed += len(home)
+                self.completion_score += len(home) * COMPLETION_SCORE
+                budget[arrived] = 0.0
+
+            start = np.flatnonzero(at_node & (self.state == TRAVELING) & (self.node != self.dest))
+            hop = self.next_hop[self.node[start], self.dest[start]]
+            self.state[start[hop < 0]] = STRANDED  # ingen väg till målet
+            start, hop = start[hop >= 0], hop[hop >= 0]
+            self.edge_next[start] = hop
+            self.edge_left[start] = self.dist[self.node[start], hop]
+
+            go = np.flatnonzero((self.state == TRAVELING) & (budget > 0) & (self.edge_left > 0))
+            step = np.minimum(budget[go], self.edge_left[go])
+            self.charge[go] -= step * self.consumption[go] / self.max_charge[go]
+            self.edge_left[go] -= step
+            budget[go] -= step
+
+            empty = go[self.charge[go] <= 0]
+            self.charge[empty] = 0.0
+            self.state[empty] = STRANDED
+
+            reached = go[(self.edge_left[go] <= 0) & (self.state[go] == TRAVELING)]
+            self.node[reached] = self.edge_next[reached]
+        return completed
+
+    def sample_action(self):
+        """
+        Slumpmässiga actions för alla kunder som är kvar i spelet.
+        """
+        return np.random.randint(0, 4, size=len(self.present())).tolist()
@@ -0,0 +1,206 @@
+# Utvärderar en tränad modell på flera kartor och seeds samtidigt mot API:t.
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import torch
+from dotenv import load_dotenv
+from baseline_agent.async_client import CONCURRENCY, RATE_LIMIT, AsyncConsiditionClient
+from env import ConsiditionEnv
+from map_cache import default_cache
+from train_api_sim_4maps import DQN
+
+load_dotenv()
+
+API_KEY = os.getenv("API_KEY")
+BASE_URL = os.getenv("BASE_URL")
+MAP_NAMES = ["Batterytown", "Clutchfield", "Turbohill", "Windcity"]
+MODEL_PATH = "dqn_api_multi_map_finetuned2.pth"
+NUM_ACTIONS = 4
+
+async def play_game(client, policy_net, map_name, seed=0, epsilon=0.0, submit_mode="full",
+                    base_url=BASE_URL, api_key=API_KEY, map_cache=None):
+    """
+    Spelar ett helt spel på map_name med den asynkrona klienten. Miljölogiken (features,
+    actions -> rekommendationer, reward) är densamma som i env.py; bara anropen är asynkrona.
+    seed styr utforskningen när epsilon > 0. Fel i spelet (t.ex. en okänd karta) hamnar i
+    resultatets "error" i stället för att avbryta övriga spel.
+    """
+    start = time.perf_counter()
+    try:
+        return await _play_game(
+            client, policy_net, map_name, seed, epsilon, submit_mode, base_url, api_key, map_cache, start
+        )
+    except Exception as e:
+        return {
+            "map": map_name,
+            "seed": seed,
+            "score": None,
+            "reward": None,
+            "ticks": 0,
+            "seconds": time.perf_counter() - start,
+            "error": f"{type(e).__name__}: {e}",
+        }
+
+async def _play_game(client, policy_net, map_name, seed, epsilon, submit_mode, base_url, api_key, map_cache, start):
+    cache = map_cache or default_cache()
+    map_obj = cache.get(map_name, seed)
+    if map_obj is None:
+        map_obj = await client.get_map(map_name, seed)
+        cache.put(map_name, seed, map_obj)
+    # Kartindex och vägtabeller byggs i en tråd så att andra spel fortsätter under tiden.
+    env = await asyncio.to_thread(
+        ConsiditionEnv, base_url, api_key, map_name, submit_mode=submit_mode, map_obj=map_obj, map_cache=cache
+    )
+    generator = torch.Generator().manual_seed(seed)
+    state = env.get_customer_features()
+    total_reward = 0.0
+    done = env.current_tick >= env.total_ticks
+    error = None
+
+    while not done:
+        with torch.no_grad():
+            actions = policy_net.act(state, epsilon, generator)
+        env.build_tick(actions.numpy())
+        response = None
+        while response is None:
+            mode, body, n_ticks = env.prepare_submission()
+            timing = {}
+            try:
+                response = await client.post_game(body, timing)
+            except Exception as e:
+                if mode != "delta":
+                    error = str(e)
+                    break
+                # Avvisad delta: starta om sessionen med hela historiken.
+                env.session_id = None
+        if response is None:
+            break
+        env.acknowledge(mode, n_ticks, response, timing.get("total_ms", 0.0), timing)
+        state, reward, done = env.apply_response(response)
+        total_reward += reward
+
+    return {
+        "map": map_name,
+        "seed": seed,
+        "score": env.last_score,
+        "reward": total_reward,
+        "ticks": env.current_tick,
+        "seconds": time.perf_counter() - start,
+        "error": error,
+    }
+
+def aggregate(results):
+    """Medel, min och max av slutpoängen per karta samt totalt medel."""
+    summary = {}
+    for map_name in sorted({r["map"] for r in results}):
+        scores = [r["score"] for r in results if r["map"] == map_name and r["error"] is None]
+        summary[map_name] = {
+            "games": len(scores),
+            "mean": sum(scores) / len(scores) if scores else None,
+            "min": min(scores) if scores else None,
+            "max": max(scores) if scores else None,
+        }
+    ok = [r["score"] for r in results if r["error"] is None]
+    summary["total"] = {"games": len(ok), "mean": sum(ok) / len(ok) if ok else None}
+    return summary
+
+async def evaluate(policy_net, map_names=MAP_NAMES, seeds=(0,), base_url=BASE_URL, api_key=API_KEY,
+                   concurrency=CONCURRENCY, rate=RATE_LIMIT, epsilon=0.0, submit_mode="full", map_cache=None):
+    """
+    Spelar alla kombinationer av karta × seed samtidigt. Den totala tiden blir ungefär
+    det långsammaste spelets i stället för summan av alla spel. Spel som misslyckas
+    rapporteras med "error" och räknas inte i sammanfattningen.
+    map_cache (MapCache) ersätter processens gemensamma kartcache, t.ex. mot en mock-server.
+    """
+    async with AsyncConsiditionClient(base_url, api_key, concurrency, rate) as client:
+        games = [
+            play_game(client, policy_net, map_name, seed, epsilon, submit_mode, base_url, api_key, map_cache)
+            for map_name in map_names
+            for seed in seeds
+        ]
+        results = await asyncio.gather(*games)
+    return list(results), aggregate(results)
+
+def check_mock(policy_net=None, submit_mode="delta"):
+    """
+    Automatisk kontroll mot mock_server: 2 kartor × 2 seeds plus en okänd karta. De fyra
+    giltiga spelen ska bli klara och den okända kartan ska bara ge fel för sina egna spel.
+    Kartorna cachas bara i minnet, så att mock-kartorna inte hamnar i cache/maps.
+    """
+    from map_cache import MapCache
+    from mock_server import MockConsiditionServer
+
+    policy_net = policy_net or DQN(5, NUM_ACTIONS).eval()
+    with MockConsiditionServer() as server:
+        results, summary = asyncio.run(evaluate(
+            policy_net, ["Batterytown", "Turbohill", "NoSuchMap"], (0, 1), server.url, "mock",
+            rate=None, submit_mode=submit_mode, map_cache=MapCache(cache_dir=None, maps_dir=None),
+        ))
+    failed = [r for r in results if r["error"]]
+    assert len(results) == 6, results
+    assert {r["map"] for r in failed} == {"NoSuchMap"} and len(failed) == 2, failed
+    assert summary["total"]["games"] == 4, summary
+    for map_name in ("Batterytown", "Turbohill"):
+        assert summary[map_name]["games"] == 2 and summary[map_name]["mean"] is not None, summary
+    assert summary["NoSuchMap"]["games"] == 0, summary
+    print(f"check_mock ok: {summary['total']['games']} spel klara, {len(failed)} fel för NoSuchMap")
+    return results, summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Utvärderar modellen på flera kartor och seeds samtidigt.")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--maps", nargs="+", default=MAP_NAMES)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="samtidiga anrop")
+    parser.add_argument("--rate", type=float, default=RATE_LIMIT, help="anrop per sekund, 0 = obegränsat")
+    parser.add_argument("--epsilon", type=float, default=0.0, help="utforskning under utvärderingen")
+    parser.add_argument("--submit-mode", default="full", choices=["full", "delta", "checkpoint"])
+    parser.add_argument("--mock", action="store_true", help="kör mot en lokal mock_server i stället för BASE_URL")
+    parser.add_argument("--out", help="skriv resultat och sammanfattning som JSON")
+    parser.add_argument("--check", action="store_true",
+                        help="kör den automatiska kontrollen mot mock_server (2 kartor × 2 seeds + okänd karta)")
+    args = parser.parse_args()
+    if args.check:
+        check_mock()
+        return
+
+    policy_net = DQN(5, NUM_ACTIONS)
+    policy_net.load_state_dict(torch.load(args.model, map_location="cpu"))
+    policy_net.eval()
+
+    base_url, server, map_cache = BASE_URL, None, None
+    if args.mock:
+        from map_cache import MapCache
+        from mock_server import MockConsiditionServer
+        server = MockConsiditionServer().start()
+        base_url = server.url
+        map_cache = MapCache(cache_dir=None, maps_dir=None)
+
+    start = time.perf_counter()
+    try:
+        results, summary = asyncio.run(evaluate(
+            policy_net, args.maps, args.seeds, base_url, API_KEY,
+            args.concurrency, args.rate or None, args.epsilon, args.submit_mode, map_cache,
+        ))
+    finally:
+        if server is not None:
+            server.stop()
+    elapsed = time.perf_counter() - start
+
+    for r in results:
+        status = f"fel: {r['error']}" if r["error"] else f"score {r['score']:.2f}"
+        print(f"{r['map']:<12} seed {r['seed']:<4} {status} ({r['ticks']} ticks, {r['seconds']:.1f}s)")
+    for map_name, s in summary.items():
+        if s["mean"] is not None:
+            print(f"{map_name:<12} {s['games']} spel, medel {s['mean']:.2f}")
+    print(f"Totalt {len(results)} spel på {elapsed:.1f}s (längsta spel {max(r['seconds'] for r in results):.1f}s)")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"results": results, "summary": summary}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# Exporterar en tränad .pth-modell till TorchScript, ONNX eller numpy för live-spel.
+
+import argparse
+import os
+import time
+import numpy as np
+import torch
+from train_api_sim_4maps import DQN
+
+INPUT_DIM = 5
+NUM_ACTIONS = 4
+ONNX_OPSET = 17
+FORMATS = {"onnx": ".onnx", "torchscript": ".pt", "numpy": ".npz"}
+
+def load_dqn(model_path, input_dim=INPUT_DIM, num_actions=NUM_ACTIONS):
+    policy_net = DQN(input_dim, num_actions)
+    policy_net.load_state_dict(torch.load(model_path, map_location="cpu"))
+    policy_net.eval()
+    return policy_net
+
+def export_torchscript(policy_net, out_path):
+    """Tracear nätet, fryser vikterna som konstanter och optimerar grafen för inferens."""
+    example = torch.zeros(8, policy_net.net[0].in_features)
+    with torch.no_grad():
+        traced = torch.jit.trace(policy_net, example)
+    frozen = torch.jit.optimize_for_inference(torch.jit.freeze(traced.eval()))
+    frozen.save(out_path)
+
+def export_onnx(policy_net, out_path):
+    """ONNX med dynamisk batchdimension, så att ett anrop täcker alla kunder i ett tick."""
+    example = torch.zeros(8, policy_net.net[0].in_features)
+    torch.onnx.export(
+        policy_net, (example,), out_path,
+        input_names=["states"], output_names=["q_values"],
+        dynamic_axes={"states": {0: "customers"}, "q_values": {0: "customers"}},
+        opset_version=ONNX_OPSET, dynamo=False,
+    )
+
+def export_numpy(policy_net, out_path):
+    """Vikterna som (in, ut)-matriser w0, b0, w1, b1, ... för NumpyPolicy."""
+    linears = [m for m in policy_net.net if isinstance(m, torch.nn.Linear)]
+    arrays = {}
+    for i, layer in enumerate(linears):
+        arrays[f"w{i}"] = layer.weight.detach().numpy().T.astype(np.float32).copy()
+        arrays[f"b{i}"] = layer.bias.detach().numpy().astype(np.float32).copy()
+    np.savez(out_path, **arrays)
+
+EXPORTERS = {"onnx": export_onnx, "torchscript": export_torchscript, "numpy": export_numpy}
+
+def export(model_path, fmt="onnx", out_path=None):
+    """
+    Exporterar model_path i formatet fmt och kontrollerar att den exporterade modellen ger
+    samma Q-värden och actions som originalet. Returnerar sökvägen till artefakten.
+    """
+    from inference import load_policy
+
+    out_path = out_path or os.path.splitext(model_path)[0] + FORMATS[fmt]
+    policy_net = load_dqn(model_path)
+    EXPORTERS[fmt](policy_net, out_path)
+
+    states = torch.rand(1000, INPUT_DIM)
+    with torch.no_grad():
+        expected = policy_net(states).numpy()
+    start = time.perf_counter()
+    policy = load_policy(out_path)
+    load_ms = (time.perf_counter() - start) * 1000
+    got = policy.q_values(states.numpy())
+    max_diff = float(np.abs(got - expected).max())
+    agreement = float((got.argmax(1) == expected.argmax(1)).mean())
+    if max_diff > 1e-4:
+        raise RuntimeError(f"exporten avviker från originalet (max diff {max_diff:.2e})")
+    print(f"Exporterade {model_path} -> {out_path} ({os.path.getsize(out_path) / 1024:.0f} kB, "
+          f"laddas på {load_ms:.0f} ms, max diff {max_diff:.1e}, samma action {agreement:.1%})")
+    return out_path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporterar en DQN-modell för slimmad inferens.")
+    parser.add_argument("model", help=".pth-fil, t.ex. ../models/dqn_api_multi_map_finetuned2.pth")
+    parser.add_argument("--format", choices=list(FORMATS), default="onnx")
+    parser.add_argument("--out", help="utfil (standard: samma namn med formatets filändelse)")
+    args = parser.parse_args()
+    export(args.model, args.format, args.out)
@@ -1,12 +1,16 @@
 # Finetuning av DQN-modell på tävlingskartan "Pistonia".
 
 import torch
-import torch.nn as nn
-import torch.optim as optim
-import random
+import os
+import argparse
 from tqdm import trange
 from env_api_simulated import ConsiditionEnv
-from train_api_sim_4maps import DQN, ReplayBuffer
+from train_api_sim_4maps import (
+    TRAIN_COUNTERS, TRAIN_PHASES, DQN, ReplayBuffer, PrioritizedReplayBuffer, push_tick
+)
+import checkpoint
+import instrumentation
+import learner
 
 # Finetuning-hyperparametrar
 BATCH_SIZE = 64
@@ -20,82 +24,113 @@ MEMORY_SIZE = 10000
 NUM_EPISODES = 300 
 BASE_MODEL_PATH = "dqn_api_multi_map.pth"
 FINE_TUNED_MODEL_PATH = "dqn_api_multi_map_finetuned2.pth"
+WARM_START_BUFFER_PATH = "replay_api_multi_map"  # Replay buffer från förträningen, om den finns
+CHECKPOINT_DIR = "checkpoints_finetune"
 
-def fine_tune():
+def fine_tune(metrics=None, checkpointer=None, resume=None, prioritized=False, learner_options=None):
     """
     Finetuning av DQN-modell på tävlingskartan "Pistonia".
     Tar den förtränade modellen från train_api_sim_4maps.py och finjusterar den här.
     Sparar den finjusterade modellen som en ny fil.
+    resume (en inläst checkpoint) fortsätter en avbruten finetuning i stället för att börja
+    om från basmodellen. prioritized=True samplar ur en PrioritizedReplayBuffer.
+    learner_options (se learner.from_args) styr batchstorlek, uppdateringar per tick och kompilering.
     """
+    metrics = metrics or instrumentation.Metrics(phases=TRAIN_PHASES, counters=TRAIN_COUNTERS)
+    checkpointer = checkpointer or checkpoint.Checkpointer(CHECKPOINT_DIR)
     env = ConsiditionEnv(map_names="Pistonia")
     input_dim = 5
     num_actions = 4
 
     # Laddar tränad modell
     policy_net = DQN(input_dim, num_actions)
-    policy_net.load_state_dict(torch.load(BASE_MODEL_PATH, map_location=torch.device("cpu")))
+    if resume is None:
+        policy_net.load_state_dict(torch.load(BASE_MODEL_PATH, map_location=torch.device("cpu")))
 
     target_net = DQN(input_dim, num_actions)
     target_net.load_state_dict(policy_net.state_dict())
 
-    optimizer = optim.Adam(policy_net.parameters(), lr=LR)
-    memory = ReplayBuffer(MEMORY_SIZE)
+    optimizer = learner.adam(policy_net.parameters(), LR)
+    # Warm start från förträningens replay buffer i stället för att fylla på från noll.
+    buffer_cls = PrioritizedReplayBuffer if prioritized else ReplayBuffer
+    if resume is None and os.path.isdir(WARM_START_BUFFER_PATH):
+        memory = buffer_cls.load(WARM_START_BUFFER_PATH, capacity=MEMORY_SIZE)
+        print(f"Laddade replay buffer med {len(memory)} transitioner från {WARM_START_BUFFER_PATH}")
+    else:
+        memory = buffer_cls(MEMORY_SIZE, input_dim)
+    trainer = learner.Learner(
+        policy_net, target_net, optimizer, memory, **{"batch_size": BATCH_SIZE, "gamma": GAMMA, **(learner_options or {})}
+    )
     epsilon = EPS_START
 
     rewards_per_ep = []
-    progress = trange(NUM_EPISODES, desc="Finetuning DQN", ncols=100)
+    start_episode = 0
+    if resume is not None:
+        start_episode, epsilon, rewards_per_ep = checkpoint.restore_training_state(
+            resume, policy_net, target_net, optimizer, memory
+        )
+    progress = trange(start_episode, NUM_EPISODES, desc="Finetuning DQN", ncols=100)
 
     for episode in progress:
+        metrics.begin(episode)
         state = env.reset()
         total_reward = 0
         done = False
 
         while not done:
-            actions = []
-            for s in state:
-                if random.random() < epsilon:
-                    actions.append(random.randint(0, num_actions - 1))
-                else:
-                    with torch.no_grad():
-                        q_vals = policy_net(torch.tensor(s, dtype=torch.float32))
-                        actions.append(int(torch.argmax(q_vals).item()))
-
-            next_state, reward, done = env.step(actions)
+            with metrics.phase("act"):
+                actions = policy_net.act(state, epsilon).tolist()
+
+            with metrics.phase("env_step"):
+                next_state, reward, done = env.step(actions)
             total_reward += reward
 
-            for s, a in zip(state, actions):
-                s2 = random.choice(next_state) if len(next_state) > 0 else s
-                memory.push(s, a, reward / len(actions), s2, done)
+            with metrics.phase("push"):
+                push_tick(memory, state, actions, reward, next_state, done)
 
             state = next_state
 
             # Träna minibatch
-            if len(memory) >= BATCH_SIZE:
-                s_b, a_b, r_b, s2_b, d_b = memory.sample(BATCH_SIZE)
-                q_vals = policy_net(s_b)
-                q_val = q_vals.gather(1, a_b.unsqueeze(1)).squeeze(1)
-                with torch.no_grad():
-                    next_q = target_net(s2_b).max(1)[0]
-                    target = r_b + GAMMA * next_q * (1 - d_b)
-                loss = nn.functional.mse_loss(q_val, target)
-                optimizer.zero_grad()
-                loss.backward()
-                optimizer.step()
+            with metrics.phase("optimize"):
+                loss = trainer.step()
+            metrics.count("env_steps")
+            metrics.count("transitions", len(actions))
+            metrics.count("updates", trainer.updates_per_tick if loss is not None else 0)
 
         epsilon = max(EPS_END, epsilon * EPS_DECAY)
         rewards_per_ep.append(total_reward)
+        metrics.record(episode, reward=total_reward, epsilon=epsilon)
 
         if episode % TARGET_UPDATE == 0:
             target_net.load_state_dict(policy_net.state_dict())
 
         progress.set_postfix({
             "reward": f"{total_reward:.2f}",
-            "eps": f"{epsilon:.2f}"
+            "eps": f"{epsilon:.2f}",
+            "upd/s": f"{trainer.updates_per_sec:.0f}"
         })
 
+        if checkpointer.due(episode):
+            checkpointer.save(episode, checkpoint.training_state(
+                episode, policy_net, target_net, optimizer, memory, epsilon, rewards_per_ep
+            ))
+
     # Spara den finjusterade modellen.
+    checkpointer.close()
     torch.save(policy_net.state_dict(), FINE_TUNED_MODEL_PATH)
+    metrics.close()
     print(f"\nFinetuning klar! Sparad som {FINE_TUNED_MODEL_PATH}")
+    print(trainer.summary())
 
 if __name__ == "__main__":
-    fine_tune()
+    parser = argparse.ArgumentParser(description="Finetunar DQN-modellen på tävlingskartan.")
+    parser.add_argument("--prioritized", action="store_true", help="prioriterad replay (summaträd, IS-vikter)")
+    instrumentation.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    learner.add_arguments(parser)
+    parser.set_defaults(checkpoint_dir=CHECKPOINT_DIR)
+    args = parser.parse_args()
+    learner_options = learner.from_args(args)
+    checkpointer, resume = checkpoint.from_args(args)
+    fine_tune(instrumentation.from_args(args, TRAIN_PHASES, TRAIN_COUNTERS), checkpointer, resume, args.prioritized,
+              learner_options)
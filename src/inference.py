@@ -0,0 +1,108 @@
+# Slimmad inferens för live-spel: laddar en exporterad modell utan träningskoden.
+
+import os
+import numpy as np
+
+NUM_THREADS = 1  # fast trådantal så att latensen per tick blir förutsägbar
+
+class OnnxPolicy:
+    """ONNX-modell via onnxruntime. Startar utan att importera torch."""
+
+    def __init__(self, path, threads=NUM_THREADS):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        # Halvprecisionsmodeller (quantize_model.py) tar float16 in.
+        self.input_dtype = np.float16 if model_input.type == "tensor(float16)" else np.float32
+        self.output_dim = self.session.get_outputs()[0].shape[-1]
+
+    def q_values(self, states):
+        q = self.session.run(None, {self.input_name: states.astype(self.input_dtype, copy=False)})[0]
+        return q.astype(np.float32, copy=False)
+
+class TorchScriptPolicy:
+    """Fryst TorchScript-modell; importerar torch men inte train_api_sim_4maps."""
+
+    def __init__(self, path, threads=NUM_THREADS):
+        import torch
+
+        torch.set_num_threads(threads)
+        self.torch = torch
+        self.module = torch.jit.load(path, map_location="cpu")
+        self.module.eval()
+        self.output_dim = None
+
+    def q_values(self, states):
+        with self.torch.inference_mode():
+            return self.module(self.torch.from_numpy(states)).numpy()
+
+class NumpyPolicy:
+    """
+    MLP:n som rena numpy-matriser (.npz med w0, b0, w1, b1, ...). Snabbast att starta,
+    och för de små nät som används här ofta lika snabb som de andra.
+    """
+
+    def __init__(self, path, threads=NUM_THREADS):
+        with np.load(path) as data:
+            n = len([k for k in data.files if k.startswith("w")])
+            self.layers = [(data[f"w{i}"], data[f"b{i}"]) for i in range(n)]
+        self.output_dim = self.layers[-1][0].shape[1]
+
+    def q_values(self, states):
+        x = states
+        for i, (w, b) in enumerate(self.layers):
+            x = x @ w + b
+            if i < len(self.layers) - 1:
+                np.maximum(x, 0, out=x)
+        return x
+
+class EagerPolicy:
+    """Oexporterad .pth via DQN i train_api_sim_4maps, för bakåtkompatibilitet."""
+
+    def __init__(self, path, threads=NUM_THREADS, input_dim=5, output_dim=4):
+        import torch
+        from train_api_sim_4maps import DQN
+
+        torch.set_num_threads(threads)
+        self.torch = torch
+        self.module = DQN(input_dim, output_dim)
+        self.module.load_state_dict(torch.load(path, map_location="cpu"))
+        self.module.eval()
+        self.output_dim = output_dim
+
+    def q_values(self, states):
+        with self.torch.inference_mode():
+            return self.module(self.torch.from_numpy(states)).numpy()
+
+_LOADERS = {".onnx": OnnxPolicy, ".pt": TorchScriptPolicy, ".npz": NumpyPolicy, ".pth": EagerPolicy}
+
+class Policy:
+    """
+    Gemensamt gränssnitt för alla format: act(states) ger greedy actions för alla kunder i
+    ett tick med ett batchat anrop, som DQN.act men som en int64-numpy-array.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def q_values(self, states):
+        return self.backend.q_values(np.ascontiguousarray(states, dtype=np.float32))
+
+    def act(self, states):
+        if len(states) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return self.q_values(states).argmax(axis=1).astype(np.int64)
+
+def load_policy(path, threads=NUM_THREADS):
+    """Laddar en modell utifrån filändelsen: .onnx, .pt (TorchScript), .npz eller .pth."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in _LOADERS:
+        raise ValueError(f"okänt modellformat: {path}")
+    return Policy(_LOADERS[ext](path, threads))
@@ -0,0 +1,230 @@
+# Instrumentering av träning och live-spel: fastider, räknare, profilering och export.
+
+import cProfile
+import csv
+import json
+import os
+import pstats
+import time
+
+PROFILE_DIR = "profiles"
+PROFILE_WINDOW = (1, 3)  # profilera steg [start, stop), t.ex. episod 1 och 2
+
+class _Phase:
+    """Återanvänd context manager per fas, så att varje mätning bara kostar två perf_counter."""
+
+    __slots__ = ("metrics", "name", "start", "record")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+        self.record = None
+
+    def __enter__(self):
+        if self.metrics._torch_profiler is not None:
+            import torch
+            self.record = torch.profiler.record_function(self.name)
+            self.record.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        phase_times = self.metrics._phase_times
+        phase_times[self.name] = phase_times.get(self.name, 0.0) + elapsed
+        if self.record is not None:
+            self.record.__exit__(*exc)
+            self.record = None
+
+class Metrics:
+    """
+    Gemensam instrumentering för train_api_sim_4maps, fine_tune_competition_map och play_model:
+    - phase(namn) summerar tiden per fas (faserna ska inte nästlas)
+    - count(namn, n) räknar händelser, t.ex. env_steps, transitions och updates
+    - record(steg, **fält) skriver en rad med tid per fas (ms), räknare och takt per sekund
+      sedan förra raden, till path som CSV eller JSONL beroende på filändelsen
+    - CSV-huvudet är unionen av alla rader: deklarerade fält (fields), faser och räknare får
+      kolumner från början, och dyker ett nytt fält upp skrivs filen om med det tillagt
+    - profile="torch" eller "cprofile" fångar ett fönster av steg [start, stop) i profile_dir
+    begin(steg) anropas i början av varje steg och record(steg) i slutet.
+    Utan path och profile kostar mätningen bara några perf_counter-anrop per steg.
+    """
+
+    def __init__(self, path=None, profile=None, profile_window=PROFILE_WINDOW, profile_dir=PROFILE_DIR,
+                 phases=(), counters=(), fields=()):
+        if profile not in (None, "torch", "cprofile"):
+            raise ValueError(f"okänd profiler: {profile}")
+        self.path = path
+        self.profile = profile
+        self.profile_window = tuple(profile_window)
+        self.profile_dir = profile_dir
+        # Deklarerade faser och räknare får alltid en kolumn, även innan de använts.
+        self._declared_phases = list(phases)
+        self._declared_counters = list(counters)
+        self._declared_fields = list(fields)
+        self._phases = {}
+        self._phase_times = {}
+        self._counts = {}
+        self._totals = {}
+        self._phase_totals = {}
+        self._torch_profiler = None
+        self._cprofile = None
+        self._file = None
+        self._writer = None
+        self._columns = None
+        self._rows = []
+        self._started = False
+        self.start_time = self._last = time.perf_counter()
+
+    def phase(self, name):
+        phase = self._phases.get(name)
+        if phase is None:
+            phase = self._phases[name] = _Phase(self, name)
+        return phase
+
+    def count(self, name, n=1):
+        self._counts[name] = self._counts.get(name, 0) + n
+
+    def begin(self, step):
+        """
+        Markerar början av ett steg: startar klockan vid första steget (så att uppstart inte
+        räknas in) och startar eller stoppar profileringsfönstret.
+        """
+        if not self._started:
+            self._started = True
+            self.start_time = self._last = time.perf_counter()
+        if self.profile is None:
+            return
+        start, stop = self.profile_window
+        if step == start:
+            self._start_profile()
+        elif step == stop:
+            self._stop_profile(start, stop)
+
+    def _start_profile(self):
+        if self.profile == "torch":
+            import torch
+            self._torch_profiler = torch.profiler.profile(activities=[torch.profiler.ProfilerActivity.CPU])
+            self._torch_profiler.__enter__()
+        else:
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    def _stop_profile(self, start, stop):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        base = os.path.join(self.profile_dir, f"{self.profile}_{start}_{stop}")
+        if self._torch_profiler is not None:
+            prof, self._torch_profiler = self._torch_profiler, None
+            prof.__exit__(None, None, None)
+            prof.export_chrome_trace(f"{base}.json")
+            with open(f"{base}.txt", "w") as f:
+                f.write(prof.key_averages().table(sort_by="self_cpu_time_total", row_limit=30))
+        elif self._cprofile is not None:
+            prof, self._cprofile = self._cprofile, None
+            prof.disable()
+            prof.dump_stats(f"{base}.prof")
+            with open(f"{base}.txt", "w") as f:
+                pstats.Stats(prof, stream=f).sort_stats("cumulative").print_stats(30)
+        else:
+            return
+        print(f"Profil för steg {start}-{stop - 1} sparad till {base}.*")
+        # Exporten ska inte räknas in i nästa stegs tid.
+        self._last = time.perf_counter()
+
+    def record(self, step, **fields):
+        """
+        Avslutar ett mätintervall (t.ex. en episod eller ett tick) och returnerar raden.
+        """
+        now = time.perf_counter()
+        elapsed = now - self._last
+        self._last = now
+
+        row = {"step": step, "time_s": round(now - self.start_time, 4), "elapsed_ms": elapsed * 1000}
+        row.update(fields)
+        phase_sum = 0.0
+        for name in self._declared_phases + [p for p in self._phase_times if p not in self._declared_phases]:
+            t = self._phase_times.get(name, 0.0)
+            phase_sum += t
+            row[f"{name}_ms"] = t * 1000
+            self._phase_totals[name] = self._phase_totals.get(name, 0.0) + t
+        row["other_ms"] = max(elapsed - phase_sum, 0.0) * 1000
+        for name in self._declared_counters + [c for c in self._counts if c not in self._declared_counters]:
+            n = self._counts.get(name, 0)
+            row[name] = n
+            row[f"{name}_per_s"] = n / elapsed if elapsed > 0 else 0.0
+            self._totals[name] = self._totals.get(name, 0) + n
+        self._phase_times = {}
+        self._counts = {}
+
+        if self.path:
+            self._write(row)
+        return row
+
+    def _write(self, row):
+        if self._file is None:
+            dirname = os.path.dirname(self.path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            self._file = open(self.path, "w", newline="")
+            if self.path.endswith(".csv"):
+                # step, time_s och elapsed_ms först, sedan deklarerade fält och resten av raden.
+                self._columns = list(dict.fromkeys(list(row)[:3] + self._declared_fields + list(row)))
+                self._open_csv()
+        if self._columns is not None:
+            self._rows.append(row)
+            new = [c for c in row if c not in self._columns]
+            if new:
+                # Nya kolumner: skriv om filen med det utökade huvudet i stället för att tappa fälten.
+                self._columns += new
+                self._open_csv()
+            else:
+                self._writer.writerow(row)
+        else:
+            self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+
+    def _open_csv(self):
+        """Skriver huvudet och alla rader hittills; saknade fält lämnas tomma."""
+        self._file.seek(0)
+        self._file.truncate()
+        self._writer = csv.DictWriter(self._file, fieldnames=self._columns)
+        self._writer.writeheader()
+        self._writer.writerows(self._rows)
+
+    def summary(self):
+        """Totala räknare, takt per sekund och andel tid per fas över hela körningen."""
+        wall = time.perf_counter() - self.start_time
+        out = {"wall_s": wall}
+        for name, n in self._totals.items():
+            out[name] = n
+            out[f"{name}_per_s"] = n / wall if wall > 0 else 0.0
+        for name, t in self._phase_totals.items():
+            out[f"{name}_share"] = t / wall if wall > 0 else 0.0
+        return out
+
+    def close(self):
+        if self._torch_profiler is not None or self._cprofile is not None:
+            self._stop_profile(*self.profile_window)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            rates = {k: v for k, v in self.summary().items() if k.endswith(("_per_s", "_share"))}
+            print("Mätvärden: " + ", ".join(f"{k} {v:.2f}" for k, v in rates.items()))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def add_arguments(parser):
+    """Lägger till de gemensamma instrumenteringsflaggorna i ett argparse-kommando."""
+    parser.add_argument("--metrics", help="skriv mätvärden per steg till denna .csv- eller .jsonl-fil")
+    parser.add_argument("--profile", choices=["torch", "cprofile"], help="profilera ett fönster av steg")
+    parser.add_argument("--profile-window", type=int, nargs=2, default=list(PROFILE_WINDOW),
+                        metavar=("START", "STOP"), help="steg [START, STOP) att profilera")
+    return parser
+
+def from_args(args, phases=(), counters=(), fields=()):
+    return Metrics(args.metrics, args.profile, args.profile_window, phases=phases, counters=counters,
+                   fields=fields)
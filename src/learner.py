@@ -0,0 +1,187 @@
+# Optimerat uppdateringssteg för DQN-träningen: förallokerade batcher, valfri kompilering och trådinställningar.
+
+import argparse
+import itertools
+import time
+import numpy as np
+import torch
+import torch.optim as optim
+
+UPDATES_PER_TICK = 1
+COMPILE_MODES = ("off", "compile", "script")
+SWEEP_BATCH_SIZES = (64, 128, 256)
+SWEEP_UPDATES = 200      # uppdateringar per mätpunkt i sweep
+SWEEP_MEMORY = 20000
+
+def configure_threads(num_threads=None, interop_threads=None):
+    """
+    Sätter torch:s intra-op- och inter-op-trådar (None = behåll standard). Inter-op kan bara
+    sättas innan torch har startat parallellt arbete, så anropet ska göras tidigt.
+    Returnerar (intra, inter) som gäller efteråt.
+    """
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    if interop_threads and interop_threads != torch.get_num_interop_threads():
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            print(f"Kunde inte sätta inter-op-trådar: {e}")
+    return torch.get_num_threads(), torch.get_num_interop_threads()
+
+def adam(params, lr):
+    """Adam med den fused implementationen (ett kernel-anrop för alla parametrar)."""
+    return optim.Adam(params, lr=lr, fused=True)
+
+class Learner:
+    """
+    Uppdateringssteget i träningen, samma matematik som optimize_model men:
+    - minibatcherna samplas in i förallokerade tensorer (index_select med out=) som återanvänds
+      varje steg, i pinned minne när CUDA finns
+    - lossen kan köras kompilerad: compile="compile" (torch.compile) eller "script" (TorchScript-nät)
+    - step() tar updates_per_tick gradientsteg per anrop
+    - updates och update_time räknas, så att updates_per_sec kan rapporteras per värd
+    Fungerar med ReplayBuffer och PrioritizedReplayBuffer (IS-vikter och prioritetsuppdatering).
+    """
+
+    def __init__(self, policy_net, target_net, optimizer, memory, batch_size, gamma,
+                 updates_per_tick=UPDATES_PER_TICK, compile="off"):
+        if compile not in COMPILE_MODES:
+            raise ValueError(f"okänt compile-läge: {compile}")
+        self.policy_net = policy_net
+        self.target_net = target_net
+        self.optimizer = optimizer
+        self.memory = memory
+        self.batch_size = batch_size
+        self.gamma = gamma
+        self.updates_per_tick = updates_per_tick
+        self.compile = compile
+        self.prioritized = hasattr(memory, "update_priorities")
+        self.updates = 0
+        self.update_time = 0.0
+
+        pin = torch.cuda.is_available()
+        self.batch = {
+            k: torch.empty((batch_size, *t.shape[1:]), dtype=t.dtype, pin_memory=pin)
+            for k, t in memory.tensors.items()
+        }
+        self.weights = torch.ones(batch_size, pin_memory=pin)
+
+        # TorchScript-versionerna delar parametrar med originalnäten, så optimizern och
+        # target-uppdateringarna (load_state_dict) gäller även dem.
+        self._policy = torch.jit.script(policy_net) if compile == "script" else policy_net
+        self._target = torch.jit.script(target_net) if compile == "script" else target_net
+        self._loss_fn = torch.compile(self._loss, dynamic=False) if compile == "compile" else self._loss
+
+    def _loss(self, s, a, r, s2, d, weights):
+        q_val = self._policy(s).gather(1, a.unsqueeze(1)).squeeze(1)
+        with torch.no_grad():
+            next_q = self._target(s2).max(1)[0]
+            target = r + self.gamma * next_q * (1 - d)
+        td = q_val - target
+        if weights is None:
+            return td.pow(2).mean(), td.detach()
+        return (weights * td.pow(2)).mean(), td.detach()
+
+    def _sample(self):
+        idx, weights = self.memory.sample_indices(self.batch_size)
+        for k in self.memory.FIELDS:
+            torch.index_select(self.memory.tensors[k], 0, idx, out=self.batch[k])
+        if weights is not None:
+            self.weights.copy_(weights)
+            weights = self.weights
+        return idx, weights
+
+    def step(self):
+        """
+        updates_per_tick gradientsteg (hoppas över tills bufferten räcker).
+        Returnerar sista lossen, eller None om inget steg togs.
+        """
+        if len(self.memory) < self.batch_size:
+            return None
+        start = time.perf_counter()
+        b = self.batch
+        for _ in range(self.updates_per_tick):
+            idx, weights = self._sample()
+            loss, td = self._loss_fn(b["s"], b["a"], b["r"], b["s2"], b["d"], weights)
+            self.optimizer.zero_grad()
+            loss.backward()
+            self.optimizer.step()
+            if self.prioritized:
+                self.memory.update_priorities(idx.numpy(), td.numpy())
+        self.updates += self.updates_per_tick
+        self.update_time += time.perf_counter() - start
+        return loss
+
+    @property
+    def updates_per_sec(self):
+        return self.updates / self.update_time if self.update_time > 0 else 0.0
+
+    def summary(self):
+        return (
+            f"Learner: {self.updates} uppdateringar, {self.updates_per_sec:.0f}/s "
+            f"({self.updates_per_sec * self.batch_size:.0f} samples/s; batch {self.batch_size}, "
+            f"{self.updates_per_tick} per tick, compile={self.compile}, "
+            f"trådar {torch.get_num_threads()}/{torch.get_num_interop_threads()})"
+        )
+
+def add_arguments(parser):
+    """Lägger till learner-flaggorna i ett argparse-kommando."""
+    parser.add_argument("--batch-size", type=int, help="minibatchstorlek (standard: skriptets BATCH_SIZE)")
+    parser.add_argument("--updates-per-tick", type=int, default=UPDATES_PER_TICK, help="gradientsteg per env-tick")
+    parser.add_argument("--compile", choices=COMPILE_MODES, default="off",
+                        help="kör lossen via torch.compile eller TorchScript")
+    parser.add_argument("--threads", type=int, help="torch intra-op-trådar")
+    parser.add_argument("--interop-threads", type=int, help="torch inter-op-trådar")
+    return parser
+
+def from_args(args):
+    """
+    Sätter trådarna och returnerar Learner-argumenten ur flaggorna (batch_size bara om den angavs).
+    """
+    configure_threads(args.threads, args.interop_threads)
+    options = {"updates_per_tick": args.updates_per_tick, "compile": args.compile}
+    if args.batch_size:
+        options["batch_size"] = args.batch_size
+    return options
+
+def sweep(batch_sizes=SWEEP_BATCH_SIZES, thread_counts=(None,), compile_modes=("off",), updates=SWEEP_UPDATES):
+    """
+    Mäter uppdateringar per sekund för varje kombination av batchstorlek, trådantal och
+    compile-läge på en syntetisk replay buffer. Returnerar en lista med resultat.
+    """
+    from train_api_sim_4maps import GAMMA, LR, DQN, ReplayBuffer
+
+    memory = ReplayBuffer(SWEEP_MEMORY, 5)
+    s = np.random.rand(SWEEP_MEMORY, 5).astype(np.float32)
+    memory.push_batch(s, np.random.randint(0, 4, SWEEP_MEMORY), s[:, 0], s, np.zeros(SWEEP_MEMORY))
+    results = []
+    for threads, mode, batch_size in itertools.product(thread_counts, compile_modes, batch_sizes):
+        configure_threads(threads)
+        policy_net, target_net = DQN(5, 4), DQN(5, 4)
+        learner = Learner(policy_net, target_net, adam(policy_net.parameters(), LR), memory,
+                          batch_size, GAMMA, compile=mode)
+        for _ in range(10):  # uppvärmning (och kompilering)
+            learner.step()
+        learner.updates, learner.update_time = 0, 0.0
+        for _ in range(updates):
+            learner.step()
+        result = {
+            "threads": torch.get_num_threads(), "compile": mode, "batch_size": batch_size,
+            "updates_per_sec": learner.updates_per_sec,
+            "samples_per_sec": learner.updates_per_sec * batch_size,
+        }
+        results.append(result)
+        print(f"trådar {result['threads']:>2}  {mode:<8} batch {batch_size:>5}  "
+              f"{result['updates_per_sec']:8.0f} upd/s  {result['samples_per_sec']:10.0f} samples/s")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mäter learnerns uppdateringar per sekund för olika inställningar.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=list(SWEEP_BATCH_SIZES))
+    parser.add_argument("--threads", type=int, nargs="+", default=[None], help="intra-op-trådar att prova")
+    parser.add_argument("--compile", choices=COMPILE_MODES, nargs="+", default=["off"])
+    parser.add_argument("--interop-threads", type=int, help="torch inter-op-trådar")
+    parser.add_argument("--updates", type=int, default=SWEEP_UPDATES, help="uppdateringar per mätpunkt")
+    args = parser.parse_args()
+    configure_threads(interop_threads=args.interop_threads)
+    sweep(args.batch_sizes, args.threads, args.compile, args.updates)
@@ -0,0 +1,144 @@
+# Beständig kartcache: tolkade kartor på disk (pickle) och i minnet (LRU), nycklade på karta och seed.
+
+import hashlib
+import json
+import os
+import pickle
+from collections import OrderedDict
+import orjson
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+CACHE_DIR = os.path.join(ROOT_DIR, "cache", "maps")
+MAPS_DIR = os.path.join(ROOT_DIR, "maps")
+INDEX_FILE = "index.json"
+MAX_ENTRIES = 16            # kartor i minnet; en karta är runt 1 MB som Python-objekt
+PICKLE_PROTOCOL = 5
+
+def map_key(map_name, seed=None):
+    return f"{map_name}@{seed if seed is not None else 'default'}"
+
+def content_hash(map_obj):
+    """Hash av kartans kanoniska JSON, så att samma karta under flera nycklar lagras en gång."""
+    return hashlib.sha1(orjson.dumps(map_obj, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+def _atomic_write(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+class MapCache:
+    """
+    Kartor i tre nivåer:
+    - LRU i minnet (max_entries kartor), så att upprepade reset inte kostar något
+    - diskcachen: <hash>.pkl med den tolkade kartan och <hash>.json bredvid, adresserade på
+      innehållet; index.json pekar "karta@seed" -> hash
+    - maps/map_dump_<karta>.json för anrop utan seed; tolkas en gång och sparas sedan som pickle,
+      och läses om ifall dumpfilen ändrats
+    Returnerade kartor delas mellan anropare och får inte muteras.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, maps_dir=MAPS_DIR, max_entries=MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.maps_dir = maps_dir
+        self.max_entries = max_entries
+        self._memory = OrderedDict()
+        self._index = None
+        self.stats = {"memory": 0, "disk": 0, "dump": 0, "fetch": 0}
+
+    def _load_index(self):
+        if self._index is None and not self.cache_dir:
+            self._index = {}
+        if self._index is None:
+            try:
+                with open(os.path.join(self.cache_dir, INDEX_FILE), encoding="utf-8") as f:
+                    self._index = json.load(f)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _remember(self, key, map_obj):
+        self._memory[key] = map_obj
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _dump_path(self, map_name):
+        return os.path.join(self.maps_dir, f"map_dump_{map_name}.json") if self.maps_dir else None
+
+    def get(self, map_name, seed=None):
+        """Kartan från minnet, diskcachen eller maps/ (bara utan seed); annars None."""
+        key = map_key(map_name, seed)
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self.stats["memory"] += 1
+            return self._memory[key]
+
+        entry = self._load_index().get(key)
+        dump_path = self._dump_path(map_name) if seed is None else None
+        dump_stat = None
+        if dump_path and os.path.exists(dump_path):
+            st = os.stat(dump_path)
+            dump_stat = [st.st_mtime_ns, st.st_size]
+
+        if entry is not None and (dump_stat is None or entry.get("source") in (None, dump_stat)):
+            try:
+                with open(os.path.join(self.cache_dir, f"{entry['hash']}.pkl"), "rb") as f:
+                    map_obj = pickle.load(f)
+            except (OSError, pickle.UnpicklingError, EOFError):
+                map_obj = None
+            if map_obj is not None:
+                self.stats["disk"] += 1
+                self._remember(key, map_obj)
+                return map_obj
+
+        if dump_stat is not None:
+            with open(dump_path, "rb") as f:
+                map_obj = orjson.loads(f.read())
+            self.stats["dump"] += 1
+            self.put(map_name, seed, map_obj, source=dump_stat)
+            return map_obj
+        return None
+
+    def put(self, map_name, seed, map_obj, source=None):
+        """Sparar kartan i minnet och på disk. Returnerar innehållshashen."""
+        digest = content_hash(map_obj)
+        key = map_key(map_name, seed)
+        self._remember(key, map_obj)
+        if not self.cache_dir:
+            return digest
+        os.makedirs(self.cache_dir, exist_ok=True)
+        pkl_path = os.path.join(self.cache_dir, f"{digest}.pkl")
+        if not os.path.exists(pkl_path):
+            _atomic_write(os.path.join(self.cache_dir, f"{digest}.json"), orjson.dumps(map_obj))
+            _atomic_write(pkl_path, pickle.dumps(map_obj, protocol=PICKLE_PROTOCOL))
+        index = self._load_index()
+        index[key] = {"hash": digest, "source": source}
+        _atomic_write(os.path.join(self.cache_dir, INDEX_FILE), json.dumps(index, indent=2).encode("utf-8"))
+        return digest
+
+    def get_or_fetch(self, map_name, seed, fetch, refresh=False):
+        """
+        Som get, men hämtar kartan med fetch(map_name, seed) och cachar den om den saknas.
+        refresh=True hoppar över cachen och hämtar alltid.
+        """
+        map_obj = None if refresh else self.get(map_name, seed)
+        if map_obj is None:
+            map_obj = fetch(map_name, seed)
+            self.stats["fetch"] += 1
+            if map_obj:
+                self.put(map_name, seed, map_obj)
+        return map_obj
+
+    def clear_memory(self):
+        self._memory.clear()
+        self._index = None
+
+_default = None
+
+def default_cache():
+    """Processens gemensamma cache, så att alla miljöer delar samma LRU."""
+    global _default
+    if _default is None:
+        _default = MapCache()
+    return _default
@@ -0,0 +1,350 @@
+# Kolumnformat för kartor: en .npy-fil per kolumn som öppnas med np.memmap i stället för att tolka JSON.
+
+import argparse
+import json
+import os
+import shutil
+import time
+import numpy as np
+from map_cache import CACHE_DIR as MAP_CACHE_DIR, MAPS_DIR
+from map_index import is_station, node_coords
+
+COLUMNS_DIR = os.path.join(os.path.dirname(MAP_CACHE_DIR), "columns")
+FORMAT_VERSION = 1
+META_FILE = "meta.json"
+STATION_FIELDS = ("amountOfAvailableChargers", "totalAmountOfBrokenChargers", "totalAmountOfChargers")
+STORAGE_FIELDS = ("capacityMWh", "efficiency", "maxChargePowerMw", "maxDischargePowerMw")
+
+def _categorical(values):
+    """Strängar -> (tabell, int16-koder), för kundtyp, persona, tillstånd och liknande."""
+    table = sorted(set(values))
+    index = {v: i for i, v in enumerate(table)}
+    return table, np.array([index[v] for v in values], dtype=np.int16)
+
+def _strings(values):
+    # Fast bredd (<U), så att även id-kolumnerna kan memory-mappas.
+    return np.array(values, dtype=str) if values else np.zeros(0, dtype="<U1")
+
+def to_columns(map_obj):
+    """
+    Plattar ut en karta i API-format till kolumner. Returnerar (arrays, meta).
+    - noder: id, koordinater (NaN om de saknas), zon, stationsfält och närmaste station
+    - kanter: CSR sorterad på från-nod (edge_indptr, edge_to, edge_length) med edge_order som
+      pekar ut kantens plats i kartans lista; kanter till okända noder tas inte med
+    - kunder: grupperade per nod som i kartan (customer_indptr), med samma normalisering av
+      saknade fält som simuleringen gör
+    - zoner: id, hörn och energikällor/lager som CSR
+    """
+    nodes = map_obj.get("nodes", []) or []
+    num_nodes = len(nodes)
+    node_ids = [n["id"] for n in nodes]
+    node_index = {nid: i for i, nid in enumerate(node_ids)}
+    zones = map_obj.get("zones", []) or []
+    zone_index = {z["id"]: i for i, z in enumerate(zones)}
+
+    xy = np.full((num_nodes, 2), np.nan, dtype=np.float64)
+    station = np.zeros(num_nodes, dtype=bool)
+    station_fields = np.zeros((len(STATION_FIELDS), num_nodes), dtype=np.int64)
+    charge_speed = np.zeros(num_nodes, dtype=np.float64)
+    for i, n in enumerate(nodes):
+        pos = node_coords(n)
+        if pos is not None:
+            xy[i] = pos
+        if is_station(n):
+            station[i] = True
+            target = n.get("target") or {}
+            for k, field in enumerate(STATION_FIELDS):
+                station_fields[k, i] = int(target.get(field, 0) or 0)
+            charge_speed[i] = float(target.get("chargeSpeedPerCharger", 0) or 0)
+    target_types, target_type = _categorical([(n.get("target") or {}).get("Type", "Null") for n in nodes])
+
+    # Närmaste station per nod med samma avstånd och första-träff-regel som StationIndex.
+    nearest = np.full(num_nodes, -1, dtype=np.int64)
+    station_idx = np.flatnonzero(station)
+    if len(station_idx):
+        for start in range(0, num_nodes, 1024):
+            block = xy[start:start + 1024]
+            d = np.hypot(block[:, None, 0] - xy[station_idx, 0], block[:, None, 1] - xy[station_idx, 1])
+            d = np.where(np.isnan(d), 999.0, d)
+            nearest[start:start + 1024] = station_idx[d.argmin(axis=1)]
+
+    edges = [
+        (k, node_index[e["fromNode"]], node_index[e["toNode"]], float(e.get("length", 0) or 0), e.get("id", ""))
+        for k, e in enumerate(map_obj.get("edges", []) or [])
+        if e.get("fromNode") in node_index and e.get("toNode") in node_index
+    ]
+    edge_from = np.array([e[1] for e in edges], dtype=np.int64)
+    order = np.argsort(edge_from, kind="stable")
+    edge_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(edge_from, minlength=num_nodes), out=edge_indptr[1:])
+
+    customers = [(i, c) for i, n in enumerate(nodes) for c in n.get("customers", []) or []]
+    customer_indptr = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum([len(n.get("customers", []) or []) for n in nodes], out=customer_indptr[1:])
+    customer_node = np.array([i for i, _ in customers], dtype=np.int64)
+    customer_types, customer_type = _categorical([c.get("type", "") for _, c in customers])
+    personas, persona = _categorical([c.get("persona", "") for _, c in customers])
+    states, state = _categorical([c.get("state", "Home") for _, c in customers])
+
+    sources = [(zi, s) for zi, z in enumerate(zones) for s in z.get("energySources", []) or []]
+    storages = [(zi, s) for zi, z in enumerate(zones) for s in z.get("energyStorages", []) or []]
+    source_types, source_type = _categorical([s.get("type", "") for _, s in sources])
+
+    arrays = {
+        "node_id": _strings(node_ids),
+        "node_x": xy[:, 0].copy(),
+        "node_y": xy[:, 1].copy(),
+        "node_zone": np.array([zone_index.get(n.get("zoneId"), -1) for n in nodes], dtype=np.int64),
+        "node_target_type": target_type,
+        "node_station": station,
+        "node_chargers": station_fields[0],
+        "node_broken_chargers": station_fields[1],
+        "node_total_chargers": station_fields[2],
+        "node_charge_speed": charge_speed,
+        "node_nearest_station": nearest,
+        "edge_indptr": edge_indptr,
+        "edge_from": edge_from[order],
+        "edge_to": np.array([e[2] for e in edges], dtype=np.int64)[order],
+        "edge_length": np.array([e[3] for e in edges], dtype=np.float64)[order],
+        "edge_id": _strings([e[4] for e in edges])[order],
+        "edge_order": np.array([e[0] for e in edges], dtype=np.int64)[order],
+        "customer_indptr": customer_indptr,
+        "customer_id": _strings([c["id"] for _, c in customers]),
+        "customer_node": customer_node,
+        "customer_to": np.array(
+            [node_index.get(c.get("toNode"), -1) if c.get("toNode") else -1 for _, c in customers], dtype=np.int64
+        ),
+        "customer_departure": np.array([int(c.get("departureTick", 0) or 0) for _, c in customers], dtype=np.int64),
+        "customer_charge": np.array([float(c.get("chargeRemaining", 0) or 0) for _, c in customers]),
+        "customer_max_charge": np.array([float(c.get("maxCharge", 1) or 1) for _, c in customers]),
+        "customer_consumption": np.array([float(c.get("energyConsumptionPerKm", 0) or 0) for _, c in customers]),
+        "customer_type": customer_type,
+        "customer_persona": persona,
+        "customer_state": state,
+        "zone_id": _strings([z["id"] for z in zones]),
+        "zone_bbox": np.array(
+            [[z.get(k, 0) for k in ("topLeftX", "topLeftY", "bottomRightX", "bottomRightY")] for z in zones],
+            dtype=np.float64,
+        ).reshape(len(zones), 4),
+        "zone_source_indptr": np.searchsorted([zi for zi, _ in sources], np.arange(len(zones) + 1)).astype(np.int64),
+        "zone_source_type": source_type,
+        "zone_source_capacity": np.array([float(s.get("generationCapacity", 0) or 0) for _, s in sources]),
+        "zone_storage_indptr": np.searchsorted([zi for zi, _ in storages], np.arange(len(zones) + 1)).astype(np.int64),
+        "zone_storage": np.array(
+            [[float(s.get(k, 0) or 0) for k in STORAGE_FIELDS] for _, s in storages], dtype=np.float64
+        ).reshape(len(storages), len(STORAGE_FIELDS)),
+    }
+    meta = {
+        "version": FORMAT_VERSION,
+        "name": map_obj.get("name", ""),
+        "dimX": map_obj.get("dimX"),
+        "dimY": map_obj.get("dimY"),
+        "ticks": int(map_obj.get("ticks", 288)),
+        "tables": {
+            "target_type": target_types,
+            "customer_type": customer_types,
+            "persona": personas,
+            "state": states,
+            "source_type": source_types,
+        },
+        "columns": sorted(arrays),
+    }
+    return arrays, meta
+
+def write_columns(map_obj, out_dir, source=None):
+    """
+    Skriver kolumnerna till out_dir (en .npy per kolumn plus meta.json). Katalogen byts ut
+    atomiskt, så att processer som redan har den gamla versionen mappad kan läsa vidare.
+    """
+    arrays, meta = to_columns(map_obj)
+    meta["source"] = source
+    tmp = f"{out_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp, f"{name}.npy"), np.ascontiguousarray(arr))
+    with open(os.path.join(tmp, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    old = None
+    if os.path.exists(out_dir):
+        old = f"{out_dir}.{os.getpid()}.old"
+        os.replace(out_dir, old)
+    os.replace(tmp, out_dir)
+    if old:
+        shutil.rmtree(old, ignore_errors=True)
+    return out_dir
+
+class ColumnarMap:
+    """
+    En karta i kolumnformat. Varje kolumn är en skrivskyddad np.memmap, så att öppna kartan
+    bara kostar en läsning av meta.json och filhuvudena, och flera processer som öppnar samma
+    karta delar sidorna via OS:ets sidcache i stället för att hålla egna kopior.
+    Kolumnnamnen blir attribut, t.ex. node_x, edge_indptr och customer_charge.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: kolumnformat version {self.meta.get('version')}, väntade {FORMAT_VERSION}")
+        for name in self.meta["columns"]:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        self.name = self.meta["name"]
+        self.ticks = self.meta["ticks"]
+        self.tables = self.meta["tables"]
+
+    @property
+    def num_nodes(self):
+        return len(self.node_id)
+
+    @property
+    def num_edges(self):
+        return len(self.edge_to)
+
+    @property
+    def num_customers(self):
+        return len(self.customer_id)
+
+    def neighbors(self, node):
+        """(grannoder, kantlängder) ut från nodindex node, som vyer i CSR-arrayerna."""
+        s = slice(self.edge_indptr[node], self.edge_indptr[node + 1])
+        return self.edge_to[s], self.edge_length[s]
+
+    def customers_at(self, node):
+        """Kundindex som står på nodindex node i kartans startläge."""
+        return np.arange(self.customer_indptr[node], self.customer_indptr[node + 1])
+
+    def graph_edges(self):
+        """(från, till, längd)-kanter i kartans ursprungliga ordning, som RouteTable vill ha dem."""
+        order = np.argsort(self.edge_order, kind="stable")
+        return list(zip(self.edge_from[order].tolist(), self.edge_to[order].tolist(), self.edge_length[order].tolist()))
+
+    def fastest_station(self):
+        """Stationen med högst laddhastighet, sedan flest lediga laddare (som StationIndex); -1 om ingen."""
+        stations = np.flatnonzero(self.node_station)
+        if not len(stations):
+            return -1
+        return int(max(stations, key=lambda i: (self.node_charge_speed[i], self.node_chargers[i])))
+
+    def to_map_obj(self):
+        """Bygger tillbaka kartan i API-format (för env.py och API-formaterade svar)."""
+        node_ids = self.node_id.tolist()
+        zone_ids = self.zone_id.tolist()
+        t = self.tables
+        customers = [{
+            "id": cid,
+            "type": t["customer_type"][ctype],
+            "persona": t["persona"][persona],
+            "fromNode": node_ids[node],
+            "toNode": node_ids[to] if to >= 0 else None,
+            "departureTick": dep,
+            "chargeRemaining": charge,
+            "maxCharge": max_charge,
+            "energyConsumptionPerKm": consumption,
+            "state": t["state"][state],
+        } for cid, ctype, persona, node, to, dep, charge, max_charge, consumption, state in zip(
+            self.customer_id.tolist(), self.customer_type.tolist(), self.customer_persona.tolist(),
+            self.customer_node.tolist(), self.customer_to.tolist(), self.customer_departure.tolist(),
+            self.customer_charge.tolist(), self.customer_max_charge.tolist(),
+            self.customer_consumption.tolist(), self.customer_state.tolist(),
+        )]
+        nodes = []
+        cptr = self.customer_indptr.tolist()
+        for i, nid in enumerate(node_ids):
+            target = {"Type": t["target_type"][self.node_target_type[i]]}
+            if self.node_station[i]:
+                target["amountOfAvailableChargers"] = int(self.node_chargers[i])
+                target["totalAmountOfBrokenChargers"] = int(self.node_broken_chargers[i])
+                target["chargeSpeedPerCharger"] = float(self.node_charge_speed[i])
+                target["totalAmountOfChargers"] = int(self.node_total_chargers[i])
+            x, y = float(self.node_x[i]), float(self.node_y[i])
+            node = {"id": nid}
+            if not (np.isnan(x) or np.isnan(y)):
+                node["posX"], node["posY"] = x, y
+            zone = int(self.node_zone[i])
+            node["zoneId"] = zone_ids[zone] if zone >= 0 else None
+            node["customers"] = customers[cptr[i]:cptr[i + 1]]
+            node["target"] = target
+            nodes.append(node)
+
+        order = np.argsort(self.edge_order, kind="stable")
+        edges = [
+            {"id": eid, "fromNode": node_ids[a], "toNode": node_ids[b], "length": length, "customers": []}
+            for eid, a, b, length in zip(
+                self.edge_id[order].tolist(), self.edge_from[order].tolist(),
+                self.edge_to[order].tolist(), self.edge_length[order].tolist(),
+            )
+        ]
+        zones = []
+        for zi, zid in enumerate(zone_ids):
+            s = slice(self.zone_source_indptr[zi], self.zone_source_indptr[zi + 1])
+            g = slice(self.zone_storage_indptr[zi], self.zone_storage_indptr[zi + 1])
+            x0, y0, x1, y1 = self.zone_bbox[zi].tolist()
+            zones.append({
+                "id": zid, "topLeftX": x0, "topLeftY": y0, "bottomRightX": x1, "bottomRightY": y1,
+                "energySources": [
+                    {"type": t["source_type"][k], "generationCapacity": cap}
+                    for k, cap in zip(self.zone_source_type[s].tolist(), self.zone_source_capacity[s].tolist())
+                ],
+                "energyStorages": [dict(zip(STORAGE_FIELDS, row)) for row in self.zone_storage[g].tolist()],
+            })
+        return {
+            "name": self.name, "dimX": self.meta["dimX"], "dimY": self.meta["dimY"],
+            "nodes": nodes, "edges": edges, "zones": zones, "ticks": self.ticks,
+        }
+
+def columns_path(map_name, columns_dir=COLUMNS_DIR):
+    return os.path.join(columns_dir, map_name)
+
+def convert(map_name, maps_dir=MAPS_DIR, columns_dir=COLUMNS_DIR):
+    """Konverterar maps/map_dump_<karta>.json till kolumnformat. Returnerar katalogen."""
+    src = os.path.join(maps_dir, f"map_dump_{map_name}.json")
+    st = os.stat(src)
+    with open(src, encoding="utf-8") as f:
+        map_obj = json.load(f)
+    os.makedirs(columns_dir, exist_ok=True)
+    return write_columns(map_obj, columns_path(map_name, columns_dir), source=[st.st_mtime_ns, st.st_size])
+
+def open_map(map_name, maps_dir=MAPS_DIR, columns_dir=COLUMNS_DIR):
+    """
+    Öppnar kartan i kolumnformat och konverterar den först om kolumnerna saknas, har ett
+    äldre format eller är äldre än dumpfilen.
+    """
+    path = columns_path(map_name, columns_dir)
+    src = os.path.join(maps_dir, f"map_dump_{map_name}.json")
+    try:
+        with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        stale = meta.get("version") != FORMAT_VERSION
+        if not stale and os.path.exists(src):
+            st = os.stat(src)
+            stale = meta.get("source") != [st.st_mtime_ns, st.st_size]
+    except (OSError, ValueError):
+        stale = True
+    if stale:
+        convert(map_name, maps_dir, columns_dir)
+    return ColumnarMap(path)
+
+def main():
+    from env_map_simulated import available_maps
+
+    parser = argparse.ArgumentParser(description="Konverterar dumpade kartor till memory-mappat kolumnformat.")
+    parser.add_argument("maps", nargs="*", help="kartor att konvertera (standard: alla i maps/)")
+    parser.add_argument("--maps-dir", default=MAPS_DIR)
+    parser.add_argument("--out", default=COLUMNS_DIR, help="katalog för kolumnerna")
+    args = parser.parse_args()
+
+    for map_name in args.maps or available_maps(args.maps_dir):
+        start = time.perf_counter()
+        path = convert(map_name, args.maps_dir, args.out)
+        convert_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        cols = ColumnarMap(path)
+        open_ms = (time.perf_counter() - start) * 1000
+        size_kb = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path)) / 1024
+        print(f"{map_name}: {cols.num_nodes} noder, {cols.num_edges} kanter, {cols.num_customers} kunder, "
+              f"{size_kb:.0f} kB -> {path} (konvertering {convert_ms:.0f} ms, öppning {open_ms:.1f} ms)")
+
+if __name__ == "__main__":
+    main()
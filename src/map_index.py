@@ -0,0 +1,266 @@
+# Förberäknade kartindex för snabba uppslag i miljöerna.
+
+from math import hypot
+import numpy as np
+
+def node_coords(node):
+    """Returnerar (x, y) för en nod, eller None om positionen saknas."""
+    if "posX" in node and "posY" in node:
+        return float(node["posX"]), float(node["posY"])
+    if "pos" in node:
+        p = node["pos"]
+        return float(p.get("x", 0.0)), float(p.get("y", 0.0))
+    return None
+
+def euclid(a, b):
+    """Euklidiskt avstånd, 999.0 om någon position saknas."""
+    if a is None or b is None:
+        return 999.0
+    return hypot(a[0]-b[0], a[1]-b[1])
+
+def is_station(node):
+    return (node.get("target") or {}).get("Type") == "ChargingStation"
+
+STATION_LOAD_FEATURES = 4
+
+def station_load(working, in_use, queued, incoming=0):
+    """
+    Lasten per station som en (S, 4) float32-array: upptagna laddare, kö, kunder på väg dit
+    och lediga laddare, alla delade med antalet fungerande laddare (minst 1).
+    """
+    working = np.asarray(working, dtype=np.float64)
+    in_use = np.asarray(in_use, dtype=np.float64)
+    per_charger = 1.0 / np.maximum(working, 1.0)
+    out = np.empty((len(working), STATION_LOAD_FEATURES), dtype=np.float32)
+    out[:, 0] = in_use * per_charger
+    out[:, 1] = np.asarray(queued) * per_charger
+    out[:, 2] = np.asarray(incoming) * per_charger
+    out[:, 3] = np.maximum(working - in_use, 0.0) * per_charger
+    return out
+
+class StationIndex:
+    """
+    Stationsindex på kartnivå:
+    - närmaste station per nod förberäknas en gång när kartan laddas (O(1) uppslag per kund)
+    - snabbaste station (högst laddhastighet, sedan flest lediga laddare) räknas om
+      bara när någon stations target-fält ändras
+    """
+
+    def __init__(self, nodes):
+        self.build(nodes)
+
+    def build(self, nodes):
+        """
+        Bygger om hela indexet från en nodlista.
+        """
+        nodes = nodes or []
+        self.num_nodes = len(nodes)
+        # (position i nodlistan, nod-id, koordinater) per station
+        self.stations = [
+            (i, n["id"], node_coords(n)) for i, n in enumerate(nodes) if is_station(n)
+        ]
+        self.nearest_by_node = {n["id"]: self._nearest_for(node_coords(n)) for n in nodes}
+        self.targets = [dict(nodes[i].get("target") or {}) for i, _, _ in self.stations]
+        self.fastest_id = self._compute_fastest()
+
+    def update(self, nodes):
+        """
+        Synkar indexet mot en ny kartversion (t.ex. från API-svaret).
+        Stationernas positioner antas vara oförändrade; bara target-fälten jämförs.
+        Faller tillbaka på full ombyggnad om nodlistan inte längre matchar och returnerar då True.
+        """
+        nodes = nodes or []
+        if len(nodes) != self.num_nodes:
+            self.build(nodes)
+            return True
+        changed = False
+        for k, (i, sid, _) in enumerate(self.stations):
+            node = nodes[i]
+            if node.get("id") != sid or not is_station(node):
+                self.build(nodes)
+                return True
+            target = node.get("target") or {}
+            if target != self.targets[k]:
+                self.targets[k] = dict(target)
+                changed = True
+        if changed:
+            self.fastest_id = self._compute_fastest()
+        return False
+
+    def lookup(self, node):
+        """
+        Returnerar (närmaste stations-id, snabbaste stations-id) för en nod.
+        """
+        if not self.stations:
+            return None, None
+        nearest = self.nearest_by_node.get(node.get("id"))
+        if nearest is None:
+            nearest = self._nearest_for(node_coords(node))
+        return nearest, self.fastest_id
+
+    def _nearest_for(self, pos):
+        if not self.stations:
+            return None
+        return min(self.stations, key=lambda t: euclid(pos, t[2]))[1]
+
+    def _compute_fastest(self):
+        if not self.stations:
+            return None
+        def score(k):
+            targ = self.targets[k]
+            speed = float(targ.get("chargeSpeedPerCharger", 0) or 0)
+            avail = int(targ.get("amountOfAvailableChargers", 0) or 0)
+            return speed, avail
+        best = max(range(len(self.stations)), key=score)
+        return self.stations[best][1]
+
+class MapArrays:
+    """
+    Kartan utplattad till sammanhängande NumPy-arrayer för vektoriserad feature-extrahering:
+    - nodkoordinater, stationsflagga och normaliserat avstånd till närmaste station byggs en gång
+    - kundkolumner (nod, laddning, maxCharge, departureTick, toNode) plockas ut per kartversion
+    Sista raden i nodarrayerna är en vaktpost för okända noder (index -1).
+    """
+
+    def __init__(self, nodes, station_index):
+        nodes = nodes or []
+        self.node_ids = [n["id"] for n in nodes]
+        self.node_index = {nid: i for i, nid in enumerate(self.node_ids)}
+
+        xy = np.full((len(nodes) + 1, 2), np.nan, dtype=np.float64)
+        for i, n in enumerate(nodes):
+            pos = node_coords(n)
+            if pos is not None:
+                xy[i] = pos
+        at_station = np.zeros(len(nodes) + 1, dtype=np.float64)
+        at_station[:-1] = [1.0 if is_station(n) else 0.0 for n in nodes]
+        nearest_idx = np.array(
+            [self.node_index.get(station_index.nearest_by_node.get(nid), -1) for nid in self.node_ids] + [-1],
+            dtype=np.int64,
+        )
+        self._build(xy, at_station, nearest_idx)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """
+        Samma arrayer direkt från en ColumnarMap (map_columns.py), utan nod-dicts och utan
+        StationIndex: närmaste station finns redan förberäknad i kolumnerna.
+        """
+        self = cls.__new__(cls)
+        self.node_ids = columns.node_id.tolist()
+        self.node_index = {nid: i for i, nid in enumerate(self.node_ids)}
+        n = len(self.node_ids)
+        xy = np.full((n + 1, 2), np.nan, dtype=np.float64)
+        xy[:-1, 0] = columns.node_x
+        xy[:-1, 1] = columns.node_y
+        at_station = np.zeros(n + 1, dtype=np.float64)
+        at_station[:-1] = columns.node_station
+        nearest_idx = np.append(columns.node_nearest_station, -1)
+        self._build(xy, at_station, nearest_idx)
+        return self
+
+    def _build(self, xy, at_station, nearest_idx):
+        self.xy = xy
+        self.at_station = at_station
+
+        # Normaliseringsavstånd: diagonalen av stationernas bounding box.
+        self.max_dist = 1.0
+        station_xy = xy[:-1][self.at_station[:-1] > 0]
+        station_xy = station_xy[~np.isnan(station_xy).any(axis=1)]
+        if len(station_xy):
+            span = station_xy.max(axis=0) - station_xy.min(axis=0)
+            self.max_dist = max(1.0, float(np.hypot(span[0], span[1])))
+
+        # Saknad position eller station ger NaN, som _dist översätter till 999 precis som euclid.
+        self.station_dist = self._dist(xy, xy[nearest_idx]) / self.max_dist
+
+    @staticmethod
+    def _dist(a, b):
+        d = np.hypot(a[:, 0] - b[:, 0], a[:, 1] - b[:, 1])
+        return np.where(np.isnan(d), 999.0, d)
+
+    def customer_columns(self, nodes, default_departure=0):
+        """
+        Plockar ut kundernas numeriska fält i kartans ordning (nod för nod) som arrayer.
+        """
+        ids, node_idx, charge, max_charge, departure, to_node = [], [], [], [], [], []
+        node_index = self.node_index
+        for node in nodes or []:
+            customers = node.get("customers") or []
+            if not customers:
+                continue
+            ni = node_index.get(node.get("id"), -1)
+            for c in customers:
+                ids.append(c["id"])
+                node_idx.append(ni)
+                charge.append(float(c.get("chargeRemaining", 0) or 0))
+                max_charge.append(float(c.get("maxCharge", 1) or 1))
+                departure.append(int(c.get("departureTick", default_departure)))
+                goal = c.get("toNode")
+                to_node.append(node_index.get(goal, -1) if goal else -1)
+        return {
+            "ids": ids,
+            "node": np.array(node_idx, dtype=np.int64),
+            "charge": np.array(charge, dtype=np.float64),
+            "max_charge": np.array(max_charge, dtype=np.float64),
+            "departure": np.array(departure, dtype=np.int64),
+            "to_node": np.array(to_node, dtype=np.int64),
+        }
+
+    def features(self, cols, current_tick, total_ticks):
+        """
+        Beräknar de 5 kundfeatures som en (N, 5) float32-array, redo för torch.from_numpy utan kopiering.
+        """
+        node = cols["node"]
+        max_charge = cols["max_charge"]
+        out = np.empty((len(node), 5), dtype=np.float32)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            out[:, 0] = np.where(max_charge > 0, cols["charge"] / max_charge, 0.0)
+        out[:, 1] = self.at_station[node]
+        out[:, 2] = np.maximum(0, cols["departure"] - current_tick) / max(1, total_ticks)
+        out[:, 3] = self.station_dist[node]
+        out[:, 4] = self._dist(self.xy[node], self.xy[cols["to_node"]]) / self.max_dist
+        return out
+
+class CustomerStore:
+    """
+    Kompakt kundtillstånd mellan två kartversioner:
+    - kund-id:n internas till fasta index en gång
+    - laddning och närvaro lagras i arrayer, så avslutade kunder och laddningsökningar
+      räknas fram med vektoriserade jämförelser i stället för att djupkopiera kund-dicts
+    """
+
+    def __init__(self):
+        self.index = {}
+        self.charge = np.zeros(0, dtype=np.float64)
+        self.present = np.zeros(0, dtype=bool)
+
+    def intern(self, ids):
+        """Returnerar index för id:na och lägger till nya id:n vid behov."""
+        index = self.index
+        for cid in ids:
+            if cid not in index:
+                index[cid] = len(index)
+        if len(index) > len(self.charge):
+            grow = len(index) - len(self.charge)
+            self.charge = np.concatenate([self.charge, np.zeros(grow)])
+            self.present = np.concatenate([self.present, np.zeros(grow, dtype=bool)])
+        return np.fromiter((index[cid] for cid in ids), dtype=np.int64, count=len(ids))
+
+    def update(self, cols):
+        """
+        Jämför nya kundkolumner (från MapArrays.customer_columns) mot föregående snapshot.
+        Returnerar (antal kunder som försvunnit, summerad laddningsökning) och sparar det nya läget.
+        """
+        idx = self.intern(cols["ids"])
+        present = np.zeros(len(self.present), dtype=bool)
+        present[idx] = True
+        completed = int((self.present & ~present).sum())
+
+        delta = cols["charge"] - self.charge[idx]
+        gained = self.present[idx] & (delta > 0)
+        charge_gain = float(delta[gained].sum())
+
+        self.charge[idx] = cols["charge"]
+        self.present = present
+        return completed, charge_gain
@@ -0,0 +1,379 @@
+# Lokal mock av Considition-API:t (/api/map och /api/game) för test och mätning offline.
+
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+import requests
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from env_map_simulated import MAPS_DIR, ConsiditionEnv as MapSimEnv, load_map_dump
+
+MAX_SESSIONS = 256      # äldst använda sessionen släpps när fler startas
+SESSION_TTL_S = 600.0   # sessioner som inte använts på så här länge släpps
+
+def _play_to(payload):
+    """Ticket som anropet spelar fram till: playToTick, annars ticket efter det sista i listan."""
+    if payload.get("playToTick") is not None:
+        return int(payload["playToTick"])
+    ticks = [int(t.get("tick", 0)) for t in payload.get("ticks") or []]
+    return max(ticks) + 1 if ticks else 0
+
+def load_recording(path):
+    """
+    Läser en inspelning (JSONL med mapName, tick, response och status för felsvar) till
+    {(karta, tick): (status, svar)}.
+    """
+    responses = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                responses[(entry["mapName"], int(entry["tick"]))] = (entry.get("status", 200), entry["response"])
+    return responses
+
+class MockConsiditionServer:
+    """
+    Lokal ersättare för Considition-servern:
+    - GET /api/map?mapName=X serverar maps/map_dump_X.json
+    - POST /api/game spelar ticks med den kartbaserade simuleringen (env_map_simulated)
+      * utan session spelas hela tickhistoriken om från tick 0 vid varje anrop, som mot det riktiga API:t
+      * med "startSession": true svarar servern med ett sessionId, och efterföljande anrop med
+        sessionId och fromTick behöver bara innehålla de nya ticksen; högst max_sessions
+        sessioner hålls (LRU) och oanvända släpps efter session_ttl sekunder
+    - replay: svarar med inspelade svar per (karta, tick) i stället för att simulera
+    - upstream: vidarebefordrar anropen till en riktig server, t.ex. för att spela in svar
+    - record: skriver varje /api/game-svar (även felsvar, med status) till en JSONL-fil som replay kan läsa
+    - latency_ms/jitter_ms och failure_rate lägger på fördröjning och slumpade 503-fel
+    Fel från upstream skickas vidare med upstreams status och body; svarar inte upstream blir det 502.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, maps_dir=MAPS_DIR, sessions=True, replay=None,
+                 upstream=None, api_key=None, record=None, latency_ms=0.0, jitter_ms=0.0,
+                 failure_rate=0.0, seed=None, max_sessions=MAX_SESSIONS, session_ttl=SESSION_TTL_S):
+        self.maps_dir = maps_dir
+        self.sessions_enabled = sessions and replay is None and upstream is None
+        self.sessions = OrderedDict()  # session-id -> {"sim", "lock", "used"}, äldst använd först
+        self.max_sessions = max_sessions
+        self.session_ttl = session_ttl
+        self._maps = {}
+        self._lock = threading.Lock()
+        self.replay = load_recording(replay) if isinstance(replay, str) else replay
+        if self.replay is not None:
+            # Inspelningar som dict får innehålla bara svaren; de räknas då som status 200.
+            self.replay = {k: v if isinstance(v, tuple) else (200, v) for k, v in self.replay.items()}
+        self.upstream = None
+        if upstream:
+            from baseline_agent.client import ConsiditionClient
+            self.upstream = ConsiditionClient(upstream, api_key)
+        self.record_path = record
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+        self.stats = {"requests": 0, "failures_injected": 0}
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Startar servern i en bakgrundstråd."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _base_map(self, map_name):
+        with self._lock:
+            map_obj = self._maps.get(map_name)
+        if map_obj is not None:
+            return map_obj
+        # Hämtningen görs utan låset, så att ett långsamt upstream-anrop inte blockerar
+        # andra sessioner; hämtar två trådar samma karta behålls den första.
+        if self.upstream is not None:
+            map_obj = self.upstream.get_map(map_name)
+        else:
+            map_obj = load_map_dump(map_name, self.maps_dir)
+        with self._lock:
+            return self._maps.setdefault(map_name, map_obj)
+
+    def _get_session(self, session_id):
+        """Sessionen för session_id (markerad som senast använd), eller None."""
+        with self._lock:
+            self._evict_sessions()
+            session = self.sessions.get(session_id)
+            if session is not None:
+                session["used"] = time.monotonic()
+                self.sessions.move_to_end(session_id)
+            return session
+
+    def _add_session(self, sim):
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self.sessions[session_id] = {"sim": sim, "lock": threading.Lock(), "used": time.monotonic()}
+            self._evict_sessions()
+        return session_id
+
+    def _evict_sessions(self):
+        """Släpper utgångna sessioner och de äldst använda över max_sessions (anropas med låset)."""
+        expired = time.monotonic() - self.session_ttl
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session["used"] >= expired and len(self.sessions) <= self.max_sessions:
+                break
+            del self.sessions[session_id]
+
+    def inject(self):
+        """
+        Fördröjning och felinjektion före varje anrop. Returnerar (status, body) för ett
+        injicerat fel, annars None.
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+            delay = self.latency_ms + (self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+            fail = self.failure_rate > 0 and self.rng.random() < self.failure_rate
+            if fail:
+                self.stats["failures_injected"] += 1
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if fail:
+            return 503, {"error": "injicerat fel"}
+        return None
+
+    @staticmethod
+    def _from_upstream(call):
+        """
+        Kör call() mot upstream och returnerar (status, body). HTTP-fel skickas vidare med
+        upstreams status och body, och anslutningsfel blir 502.
+        """
+        try:
+            return 200, call()
+        except requests.HTTPError as e:
+            try:
+                body = e.response.json()
+            except ValueError:
+                body = {"error": e.response.text}
+            return e.response.status_code, body
+        except requests.RequestException as e:
+            return 502, {"error": f"upstream svarar inte: {e}"}
+
+    def handle_map(self, params):
+        map_name = (params.get("mapName") or [""])[0]
+        if self.upstream is not None:
+            return self._from_upstream(lambda: self._base_map(map_name))
+        try:
+            return 200, self._base_map(map_name)
+        except FileNotFoundError:
+            return 404, {"error": f"okänd karta {map_name}"}
+
+    def handle_game(self, payload):
+        if self.replay is not None:
+            recorded = self.replay.get((payload.get("mapName", ""), _play_to(payload)))
+            if recorded is None:
+                return 404, {"error": "inget inspelat svar för ticket"}
+            return recorded
+        if self.upstream is not None:
+            return self._from_upstream(lambda: self.upstream.post_game(payload))
+        return self._simulate_game(payload)
+
+    def record(self, payload, response, status=200):
+        """Lägger till ett svar i inspelningen, nycklat på karta och tick."""
+        # sessionId hör till den inspelade körningen och ska inte följa med vid replay
+        if isinstance(response, dict):
+            response = {k: v for k, v in response.items() if k != "sessionId"}
+        entry = {"mapName": payload.get("mapName", ""), "tick": _play_to(payload), "response": response}
+        if status != 200:
+            entry["status"] = status
+        line = json.dumps(entry) + "\n"
+        with self._lock:
+            with open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def _simulate_game(self, payload):
+        ticks = sorted(payload.get("ticks") or [], key=lambda t: int(t.get("tick", 0)))
+        by_tick = {int(t.get("tick", 0)): t.get("customerRecommendations") or [] for t in ticks}
+        play_to = _play_to(payload)
+
+        session_id = payload.get("sessionId")
+        if session_id is not None:
+            session = self._get_session(session_id)
+            if session is None:
+                return 404, {"error": "okänd session"}
+            with session["lock"]:
+                sim = session["sim"]
+                if int(payload.get("fromTick", -1)) != sim.tick:
+                    return 409, {"error": f"sessionen står på tick {sim.tick}"}
+                self._play(sim, by_tick, play_to)
+                return 200, self._response(sim, session_id)
+
+        try:
+            sim = MapSimEnv(map_obj=self._base_map(payload.get("mapName", "")))
+        except FileNotFoundError:
+            return 404, {"error": "okänd karta"}
+        self._play(sim, by_tick, play_to)
+
+        if payload.get("startSession") and self.sessions_enabled:
+            session_id = self._add_session(sim)
+            return 200, self._response(sim, session_id)
+        return 200, self._response(sim)
+
+    @staticmethod
+    def _play(sim, by_tick, play_to):
+        while sim.tick < min(play_to, sim.total_ticks):
+            sim.apply_recommendations(by_tick.get(sim.tick))
+            sim.advance()
+
+    @staticmethod
+    def _response(sim, session_id=None):
+        response = {
+            "mapName": sim.map_name,
+            "tick": sim.tick,
+            "map": sim.to_map_obj(),
+            "kwhRevenue": sim.kwh_revenue,
+            "customerCompletionScore": sim.completion_score,
+            "totalScore": sim.score,
+        }
+        if session_id is not None:
+            response["sessionId"] = session_id
+        return response
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _send(self, status, body):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path != "/api/map":
+                    return self._send(404, {"error": "not found"})
+                injected = server.inject()
+                if injected is not None:
+                    return self._send(*injected)
+                self._send(*server.handle_map(parse_qs(url.query)))
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                length = int(self.headers.get("Content-Length", 0) or 0)
+                body = self.rfile.read(length)
+                if url.path != "/api/game":
+                    return self._send(404, {"error": "not found"})
+                try:
+                    payload = json.loads(body or b"{}")
+                except ValueError:
+                    return self._send(400, {"error": "ogiltig JSON"})
+                injected = server.inject()
+                if injected is not None:
+                    return self._send(*injected)
+                status, response = server.handle_game(payload)
+                if server.record_path:
+                    server.record(payload, response, status)
+                self._send(status, response)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+def measure_client(url, map_name="Batterytown", ticks=50, submit_mode="full", seed=0):
+    """
+    Mäter klientstacken end-to-end (env.py + ConsiditionClient) mot en server på url med
+    slumpade actions. Returnerar ticks per sekund, latenspercentiler och tidsfördelning.
+    """
+    import numpy as np
+    from env import ConsiditionEnv
+
+    rng = np.random.default_rng(seed)
+    env = ConsiditionEnv(url, os.getenv("API_KEY"), map_name, submit_mode=submit_mode)
+    step_ms = []
+    for _ in range(min(ticks, env.total_ticks)):
+        state = env.get_customer_features()
+        actions = rng.integers(0, 4, len(state))
+        start = time.perf_counter()
+        _, _, done = env.step(actions)
+        step_ms.append((time.perf_counter() - start) * 1000)
+        if done:
+            break
+
+    timings = env.tick_timings
+    latency = np.array([t["latency_ms"] for t in timings])
+    step = np.array(step_ms)
+
+    def mean_of(key):
+        values = [t[key] for t in timings if t.get(key) is not None]
+        return float(np.mean(values)) if values else None
+
+    return {
+        "map": map_name,
+        "submit_mode": submit_mode,
+        "ticks": len(step),
+        "ticks_per_second": float(len(step) / (step.sum() / 1000)) if len(step) else 0.0,
+        "step_ms_p50": float(np.percentile(step, 50)),
+        "latency_ms_p50": float(np.percentile(latency, 50)),
+        "latency_ms_p95": float(np.percentile(latency, 95)),
+        "latency_ms_p99": float(np.percentile(latency, 99)),
+        "server_ms_mean": mean_of("server_ms"),
+        "decode_ms_mean": mean_of("decode_ms"),
+        "client_ms_mean": float(np.mean(step - latency[:len(step)])),
+        "request_bytes_mean": mean_of("request_bytes"),
+        "response_bytes_mean": mean_of("response_bytes"),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokal mock av Considition-API:t.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--no-sessions", action="store_true", help="stäng av delta-sessioner (bara full omspelning)")
+    parser.add_argument("--replay", help="svara med inspelade svar från denna JSONL-fil")
+    parser.add_argument("--upstream", help="vidarebefordra till denna server (API_KEY från miljön)")
+    parser.add_argument("--record", help="spela in /api/game-svar till denna JSONL-fil")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="fördröjning per anrop")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="slumpad variation kring fördröjningen")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="andel anrop som får 503")
+    parser.add_argument("--seed", type=int, help="seed för fördröjning och fel")
+    parser.add_argument("--bench", metavar="MAP", help="mät klientens ticks/s mot servern och avsluta")
+    parser.add_argument("--ticks", type=int, default=50, help="antal ticks i --bench")
+    parser.add_argument("--submit-mode", default="full", choices=["full", "delta", "checkpoint"])
+    args = parser.parse_args()
+
+    server = MockConsiditionServer(
+        args.host, 0 if args.bench else args.port, sessions=not args.no_sessions,
+        replay=args.replay, upstream=args.upstream, api_key=os.getenv("API_KEY"), record=args.record,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, failure_rate=args.failure_rate, seed=args.seed,
+    )
+    if args.bench:
+        with server:
+            result = measure_client(server.url, args.bench, args.ticks, args.submit_mode)
+        print(json.dumps({**result, **server.stats}, indent=2))
+    else:
+        print(f"Mock-server på {server.url}")
+        try:
+            server.httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
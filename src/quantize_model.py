@@ -0,0 +1,176 @@
+# Kvantiserade (int8) och halvprecisions (float16) varianter av DQN-modellen med noggrannhetskontroll.
+
+import argparse
+import copy
+import json
+import os
+import time
+import numpy as np
+import torch
+import env_map_simulated
+from export_model import export_onnx, load_dqn
+from inference import load_policy
+
+MAP_NAMES = ["Batterytown", "Clutchfield", "Turbohill", "Windcity"]
+STATE_TICKS = 150          # ticks per karta att samla states från
+LATENCY_BATCHES = (200, 10000)
+LATENCY_REPEATS = 50
+MIN_AGREEMENT = 0.99       # andel samma action som krävs för att rekommendera en variant
+
+def _copy(policy_net):
+    return copy.deepcopy(policy_net).eval()
+
+def build_fp32_onnx(policy_net, out_path):
+    export_onnx(policy_net, out_path)
+
+def build_int8_onnx(policy_net, out_path):
+    """Dynamisk int8-kvantisering av Linear-vikterna i ONNX-grafen (onnxruntime)."""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    fp32_path = out_path + ".fp32.onnx"
+    export_onnx(policy_net, fp32_path)
+    try:
+        quantize_dynamic(fp32_path, out_path, weight_type=QuantType.QInt8)
+    finally:
+        os.remove(fp32_path)
+
+def build_fp16_onnx(policy_net, out_path):
+    """Hela nätet i float16; OnnxPolicy konverterar in- och utdata."""
+    half = _copy(policy_net).half()
+    example = torch.zeros(8, half.net[0].in_features, dtype=torch.float16)
+    torch.onnx.export(
+        half, (example,), out_path,
+        input_names=["states"], output_names=["q_values"],
+        dynamic_axes={"states": {0: "customers"}, "q_values": {0: "customers"}},
+        opset_version=17, dynamo=False,
+    )
+
+def build_int8_torch(policy_net, out_path):
+    """Dynamisk int8-kvantisering av nn.Linear i torch, sparad som TorchScript."""
+    quantized = torch.ao.quantization.quantize_dynamic(_copy(policy_net), {torch.nn.Linear}, dtype=torch.qint8)
+    with torch.no_grad():
+        traced = torch.jit.trace(quantized, torch.zeros(8, policy_net.net[0].in_features))
+    traced.save(out_path)
+
+# namn -> (byggfunktion, filsuffix)
+VARIANTS = {
+    "fp32-onnx": (build_fp32_onnx, ".onnx"),
+    "int8-onnx": (build_int8_onnx, "_int8.onnx"),
+    "fp16-onnx": (build_fp16_onnx, "_fp16.onnx"),
+    "int8-torch": (build_int8_torch, "_int8.pt"),
+}
+
+def collect_states(map_names=MAP_NAMES, ticks=STATE_TICKS, seed=0):
+    """
+    States från de dumpade kartorna: den kartbaserade simuleringen körs med slumpade actions
+    och kundfeatures samlas in varje tick, så att även senare speltillstånd finns med.
+    """
+    rng = np.random.default_rng(seed)
+    states = []
+    for map_name in map_names:
+        env = env_map_simulated.ConsiditionEnv(map_name)
+        state = env.reset()
+        for _ in range(ticks):
+            if len(state):
+                states.append(state)
+            state, _, done = env.step(rng.integers(0, 4, len(state)))
+            if done:
+                break
+    return np.concatenate(states).astype(np.float32)
+
+def latency_ms(policy, batch, repeats=LATENCY_REPEATS):
+    """Median för ett act-anrop på batch states (ms)."""
+    states = np.random.default_rng(0).random((batch, 5), dtype=np.float32)
+    policy.act(states)
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        policy.act(states)
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+def compare_variants(model_path, variants=tuple(VARIANTS), out_dir=None, states=None):
+    """
+    Bygger varje variant, jämför dess actions med float32-modellen på states från kartorna och
+    mäter latens och storlek. Returnerar en lista med en rad per variant plus referensen.
+    """
+    torch.set_num_threads(1)
+    policy_net = load_dqn(model_path)
+    states = collect_states() if states is None else states
+    with torch.no_grad():
+        reference_q = policy_net(torch.from_numpy(states)).numpy()
+    reference_actions = reference_q.argmax(axis=1)
+
+    base = os.path.splitext(model_path)[0]
+    if out_dir:
+        base = os.path.join(out_dir, os.path.basename(base))
+    rows = [{
+        "variant": "fp32-eager",
+        "path": model_path,
+        "agreement": 1.0,
+        "disagreements": 0,
+        "q_regret": 0.0,
+        "max_q_diff": 0.0,
+        "size_kb": os.path.getsize(model_path) / 1024,
+        **{f"latency_ms_{b}": latency_ms(load_policy(model_path), b) for b in LATENCY_BATCHES},
+    }]
+    for name in variants:
+        build, suffix = VARIANTS[name]
+        out_path = base + suffix
+        build(policy_net, out_path)
+        policy = load_policy(out_path)
+        q = policy.q_values(states)
+        actions = q.argmax(axis=1)
+        differs = actions != reference_actions
+        regret = reference_q.max(axis=1) - reference_q[np.arange(len(q)), actions]
+        rows.append({
+            "variant": name,
+            "path": out_path,
+            "agreement": float(1.0 - differs.mean()),
+            "disagreements": int(differs.sum()),
+            # Medelförlust i float32-Q över de states där varianten väljer annan action; nära
+            # noll betyder att avvikelserna bara gäller nästan lika bra actions.
+            "q_regret": float(regret[differs].mean()) if differs.any() else 0.0,
+            "max_q_diff": float(np.abs(q - reference_q).max()),
+            "size_kb": os.path.getsize(out_path) / 1024,
+            **{f"latency_ms_{b}": latency_ms(policy, b) for b in LATENCY_BATCHES},
+        })
+    return rows, len(states)
+
+def main():
+    parser = argparse.ArgumentParser(description="Bygger int8/float16-varianter och jämför dem mot float32-modellen.")
+    parser.add_argument("model", help=".pth-fil, t.ex. ../models/dqn_api_multi_map_finetuned2.pth")
+    parser.add_argument("--variants", nargs="+", choices=list(VARIANTS), default=list(VARIANTS))
+    parser.add_argument("--out-dir", help="katalog för varianterna (standard: bredvid modellen)")
+    parser.add_argument("--min-agreement", type=float, default=MIN_AGREEMENT)
+    parser.add_argument("--report", help="skriv rapporten som JSON")
+    args = parser.parse_args()
+
+    rows, num_states = compare_variants(args.model, args.variants, args.out_dir)
+    fastest = min(rows, key=lambda r: r[f"latency_ms_{LATENCY_BATCHES[0]}"])
+    print(f"Jämförelse på {num_states} states från {', '.join(MAP_NAMES)}:")
+    header = f"{'variant':<12} {'samma action':>12} {'olika':>6} {'Q-regret':>9} {'max |dQ|':>9} {'fil kB':>7}"
+    header += "".join(f" {'ms @' + str(b):>10}" for b in LATENCY_BATCHES)
+    print(header)
+    for r in rows:
+        line = f"{r['variant']:<12} {r['agreement']:>12.2%} {r['disagreements']:>6} {r['q_regret']:>9.5f} {r['max_q_diff']:>9.4f} {r['size_kb']:>7.0f}"
+        line += "".join(f" {r[f'latency_ms_{b}']:>10.3f}" for b in LATENCY_BATCHES)
+        print(line)
+
+    candidates = [
+        r for r in rows
+        if not r["variant"].startswith("fp32") and r["agreement"] >= args.min_agreement
+    ]
+    if candidates:
+        best = min(candidates, key=lambda r: r[f"latency_ms_{LATENCY_BATCHES[0]}"])
+        print(f"Rekommenderad: {best['variant']} ({best['path']}), {best['agreement']:.2%} samma action")
+    else:
+        print(f"Ingen billigare variant når {args.min_agreement:.0%} samma action; behåll float32.")
+    print(f"Snabbast: {fastest['variant']}")
+
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"states": num_states, "variants": rows}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Förberäknade kortaste vägar och nästa-hopp-tabeller per karta.
+
+import hashlib
+import heapq
+import json
+import os
+import numpy as np
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "routes")
+
+_loaded = {}  # kartans hash -> RouteTable, så upprepade reset inte läser disken igen
+
+def map_hash(node_ids, edges):
+    """Stabil hash över nodernas ordning och kanterna (från, till, längd)."""
+    payload = json.dumps([list(node_ids), [list(e) for e in edges]], separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+def shortest_paths(num_nodes, edges):
+    """
+    Dijkstra från varje nod över (från, till, längd)-kanterna.
+    Returnerar (dist[n, n], next_hop[n, n]) där next_hop[a, b] är första noden efter a på vägen
+    till b. Onåbara par har dist inf och next_hop -1.
+    """
+    adj = [[] for _ in range(num_nodes)]
+    for a, b, length in edges:
+        adj[a].append((b, length))
+    dist = np.full((num_nodes, num_nodes), np.inf, dtype=np.float64)
+    next_hop = np.full((num_nodes, num_nodes), -1, dtype=np.int32)
+    for src in range(num_nodes):
+        d = dist[src]
+        first = next_hop[src]
+        d[src] = 0.0
+        first[src] = src
+        heap = [(0.0, src)]
+        while heap:
+            du, u = heapq.heappop(heap)
+            if du > d[u]:
+                continue
+            for v, length in adj[u]:
+                nd = du + length
+                if nd < d[v]:
+                    d[v] = nd
+                    first[v] = v if u == src else first[u]
+                    heapq.heappush(heap, (nd, v))
+    # Kompakt lagring: float32-avstånd och int16-index när kartan är liten nog.
+    if num_nodes < 2 ** 15:
+        next_hop = next_hop.astype(np.int16)
+    return dist.astype(np.float32), next_hop
+
+class RouteTable:
+    """
+    All-pairs kortaste avstånd och nästa hopp för en kartas kantgraf:
+    - distance(a, b) är ett O(1) tabelluppslag
+    - path(a, b) följer next_hop-tabellen och cachas per nodpar
+    Tabellerna sparas på disk som .npz, nycklade på kartans hash.
+    """
+
+    def __init__(self, node_ids, dist, next_hop):
+        self.node_ids = list(node_ids)
+        self.node_index = {nid: i for i, nid in enumerate(self.node_ids)}
+        self.dist = dist
+        self.next_hop = next_hop
+        self._paths = {}
+
+    @classmethod
+    def for_map(cls, map_obj, cache_dir=CACHE_DIR):
+        """
+        Hämtar tabellerna för en karta: från minnet, från diskcachen eller genom att bygga dem.
+        """
+        node_ids = [n["id"] for n in map_obj.get("nodes", []) or []]
+        node_index = {nid: i for i, nid in enumerate(node_ids)}
+        edges = [
+            (node_index[e["fromNode"]], node_index[e["toNode"]], float(e.get("length", 0) or 0))
+            for e in map_obj.get("edges", []) or []
+            if e.get("fromNode") in node_index and e.get("toNode") in node_index
+        ]
+        return cls.for_graph(node_ids, edges, cache_dir)
+
+    @classmethod
+    def for_graph(cls, node_ids, edges, cache_dir=CACHE_DIR):
+        """
+        Som for_map men med nod-id:n och (från, till, längd)-kanter i nodindex, t.ex. från
+        kolumnformatet i map_columns.py.
+        """
+        key = map_hash(node_ids, edges)
+        if key in _loaded:
+            return _loaded[key]
+
+        path = os.path.join(cache_dir, f"{key}.npz") if cache_dir else None
+        if path and os.path.exists(path):
+            data = np.load(path)
+            table = cls(node_ids, data["dist"], data["next_hop"])
+        else:
+            dist, next_hop = shortest_paths(len(node_ids), edges)
+            table = cls(node_ids, dist, next_hop)
+            if path:
+                os.makedirs(cache_dir, exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp.npz"
+                np.savez(tmp, dist=dist, next_hop=next_hop)
+                os.replace(tmp, path)
+        _loaded[key] = table
+        return table
+
+    def distance(self, a, b):
+        """Grafavstånd mellan nod-id a och b (inf om okänd nod eller ingen väg)."""
+        i, j = self.node_index.get(a), self.node_index.get(b)
+        if i is None or j is None:
+            return float("inf")
+        return float(self.dist[i, j])
+
+    def path(self, a, b):
+        """
+        Nod-id:n efter a fram till och med b längs kortaste vägen.
+        Tom lista om a == b, None om det inte finns någon väg.
+        """
+        key = (a, b)
+        if key in self._paths:
+            return self._paths[key]
+        i, j = self.node_index.get(a), self.node_index.get(b)
+        route = None
+        if i is not None and j is not None and self.next_hop[i, j] >= 0:
+            route = []
+            while i != j:
+                i = int(self.next_hop[i, j])
+                route.append(self.node_ids[i])
+        self._paths[key] = route
+        return route
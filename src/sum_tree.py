@@ -0,0 +1,66 @@
+# Arraybaserat summaträd för prioriterad replay: batchad uppdatering och sampling i O(log n).
+
+import numpy as np
+
+class SumTree:
+    """
+    Binärt träd i en platt array: löven ligger på [size, 2 * size) och varje inre nod i
+    håller summan av sina barn 2i och 2i + 1, så roten (index 1) är totalsumman.
+    Ett parallellt minträd ger minsta prioriteten (för normering av IS-vikterna).
+    size avrundas uppåt till en tvåpotens så att alla löv ligger på samma djup;
+    tomma löv har prioritet 0 (och +inf i minträdet).
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.size = 1 << max(0, int(capacity - 1).bit_length())
+        self.depth = self.size.bit_length() - 1
+        self.sums = np.zeros(2 * self.size)
+        self.mins = np.full(2 * self.size, np.inf)
+
+    @property
+    def total(self):
+        return float(self.sums[1])
+
+    @property
+    def min(self):
+        return float(self.mins[1])
+
+    @property
+    def leaves(self):
+        return self.sums[self.size:self.size + self.capacity]
+
+    def update(self, idx, priorities):
+        """
+        Sätter prioriteten för löven idx (array) och räknar om föräldrarna nivå för nivå,
+        en gång per unik förälder. Vid dubbletter i idx gäller den sista.
+        """
+        node = np.asarray(idx, dtype=np.int64) + self.size
+        self.sums[node] = priorities
+        self.mins[node] = priorities
+        for _ in range(self.depth):
+            node = np.unique(node >> 1)
+            self.sums[node] = self.sums[2 * node] + self.sums[2 * node + 1]
+            self.mins[node] = np.minimum(self.mins[2 * node], self.mins[2 * node + 1])
+
+    def find(self, values):
+        """
+        Lövindex för varje kumulativ summa i values (array i [0, total)), nedstigning
+        för hela batchen samtidigt.
+        """
+        values = np.array(values, dtype=np.float64)
+        node = np.ones(len(values), dtype=np.int64)
+        for _ in range(self.depth):
+            left = self.sums[2 * node]
+            # Till höger bara om högra delträdet har vikt (skyddar mot avrundning vid total).
+            right = (values >= left) & (self.sums[2 * node + 1] > 0)
+            values -= left * right
+            node = 2 * node + right
+        return np.minimum(node - self.size, self.capacity - 1)
+
+    def reset(self, priorities=None):
+        """Tömmer trädet, eller bygger om det från en array med en prioritet per löv."""
+        self.sums[:] = 0.0
+        self.mins[:] = np.inf
+        if priorities is not None:
+            self.update(np.arange(len(priorities)), priorities)
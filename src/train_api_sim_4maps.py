@@ -2,11 +2,20 @@
 
 import torch
 import torch.nn as nn
-import torch.optim as optim
+import numpy as np
 import random
-from collections import deque
+import json
+import os
+import argparse
 from tqdm import trange
-from env_api_simulated import ConsiditionEnv
+from env_api_simulated import NUM_CUSTOMERS, ConsiditionEnv
+from vector_env import VectorEnv
+import env_map_simulated
+import checkpoint
+import instrumentation
+import learner
+from sum_tree import SumTree
+from context_dqn import CONTEXT_BATCH, CONTEXT_MEMORY, ContextDQN, TickReplayBuffer, optimize_context
 
 # Hyperparametrar
 BATCH_SIZE = 64
@@ -18,12 +27,22 @@ EPS_DECAY = 0.995
 TARGET_UPDATE = 20
 MEMORY_SIZE = 20000
 NUM_EPISODES = 1000
+NUM_ENVS = 1  # >1 kör parallella simulerade episoder i en VectorEnv
+TRAIN_PHASES = ("act", "env_step", "push", "optimize")
+TRAIN_COUNTERS = ("env_steps", "transitions", "updates")
 MODEL_PATH = "dqn_api_multi_map.pth"
+BUFFER_PATH = "replay_api_multi_map"  # Sparad replay buffer för warm start vid finetuning
+CONTEXT_MODEL_PATH = "dqn_context_multi_map.pth"
+PER_ALPHA = 0.6          # hur mycket TD-felet styr samplingen (0 = likformig)
+PER_BETA_START = 0.4     # IS-korrektionen börjar svag ...
+PER_BETA_STEPS = 100000  # ... och når 1.0 efter så många samplade minibatcher
+PER_EPS = 1e-3           # minsta prioritet, så att inga transitioner svälts ut
 
 # DQN Nätverk
 class DQN(nn.Module):
     def __init__(self, input_dim, output_dim):
         super().__init__()
+        self.output_dim = output_dim
         self.net = nn.Sequential(
             nn.Linear(input_dim, 256),
             nn.ReLU(),
@@ -34,28 +53,307 @@ class DQN(nn.Module):
     def forward(self, x):
         return self.net(x)
 
+    @torch.no_grad()
+    def act(self, states, epsilon=0.0, generator=None):
+        """
+        Väljer actions för alla kunder i ett tick med ett enda forward-pass.
+        states är en (N, input_dim) lista, array eller tensor. Med epsilon > 0 dras
+        utforskningsmasken och de slumpade actions vektoriserat, ur generator om den ges.
+        Returnerar en int64-tensor med N actions.
+        """
+        if len(states) == 0:
+            return torch.zeros(0, dtype=torch.int64)
+        x = torch.as_tensor(states, dtype=torch.float32)
+        actions = self.forward(x).argmax(dim=1)
+        if epsilon > 0:
+            explore = torch.rand(actions.shape[0], generator=generator) < epsilon
+            actions[explore] = torch.randint(0, self.output_dim, (int(explore.sum()),), generator=generator)
+        return actions
+
 # Replay Buffer
 class ReplayBuffer:
-    def __init__(self, capacity):
-        self.buffer = deque(maxlen=capacity)
+    """
+    Ringbuffert med förallokerade float32/int64-arrayer för s, a, r, s2 och done.
+    push_batch lägger in ett helt ticks transitioner med slice-tilldelning och sample
+    indexerar direkt i tensorvyer över arrayerna (som även kan vara np.memmap).
+    """
+    FIELDS = ("s", "a", "r", "s2", "d")
+
+    def __init__(self, capacity, state_dim=5, arrays=None):
+        self.capacity = capacity
+        self.state_dim = state_dim
+        if arrays is None:
+            arrays = {
+                "s": np.zeros((capacity, state_dim), dtype=np.float32),
+                "a": np.zeros(capacity, dtype=np.int64),
+                "r": np.zeros(capacity, dtype=np.float32),
+                "s2": np.zeros((capacity, state_dim), dtype=np.float32),
+                "d": np.zeros(capacity, dtype=np.float32),
+            }
+        self.arrays = arrays
+        # Tensorvyerna delar minne med arrayerna, så push syns direkt vid sample.
+        self.tensors = {k: torch.from_numpy(v) for k, v in arrays.items()}
+        self.pos = 0
+        self.size = 0
+
     def push(self, s, a, r, s2, d):
-        self.buffer.append((s, a, r, s2, d))
+        self.push_batch([s], [a], r, [s2], d)
+
+    def push_batch(self, s, a, r, s2, d):
+        """
+        Lägger in n transitioner på en gång. r och d får vara skalärer (samma för alla).
+        """
+        n = len(a)
+        if n == 0:
+            return
+        batch = {
+            "s": np.asarray(s, dtype=np.float32).reshape(n, self.state_dim),
+            "a": np.asarray(a, dtype=np.int64),
+            "r": np.broadcast_to(np.asarray(r, dtype=np.float32), (n,)),
+            "s2": np.asarray(s2, dtype=np.float32).reshape(n, self.state_dim),
+            "d": np.broadcast_to(np.asarray(d, dtype=np.float32), (n,)),
+        }
+        if n > self.capacity:
+            batch = {k: v[-self.capacity:] for k, v in batch.items()}
+            n = self.capacity
+        first = min(n, self.capacity - self.pos)
+        for k, v in batch.items():
+            self.arrays[k][self.pos:self.pos + first] = v[:first]
+            self.arrays[k][:n - first] = v[first:]
+        self.pos = (self.pos + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def sample_indices(self, batch_size):
+        """Index för en minibatch och IS-vikter (None vid likformig sampling)."""
+        return torch.randint(0, self.size, (batch_size,)), None
+
     def sample(self, batch_size):
-        batch = random.sample(self.buffer, batch_size)
-        s, a, r, s2, d = zip(*batch)
-        return (
-            torch.tensor(s, dtype=torch.float32),
-            torch.tensor(a, dtype=torch.int64),
-            torch.tensor(r, dtype=torch.float32),
-            torch.tensor(s2, dtype=torch.float32),
-            torch.tensor(d, dtype=torch.float32),
-        )
+        idx, _ = self.sample_indices(batch_size)
+        return tuple(self.tensors[k][idx] for k in self.FIELDS)
+
     def __len__(self):
-        return len(self.buffer)
+        return self.size
+
+    def _ordered(self):
+        """Innehållet i insättningsordning (äldst först)."""
+        if self.size < self.capacity:
+            return {k: v[:self.size] for k, v in self.arrays.items()}
+        return {k: np.concatenate([v[self.pos:], v[:self.pos]]) for k, v in self.arrays.items()}
+
+    def state_dict(self):
+        """
+        Kopia av hela tillståndet (arrayer, pos och size) för checkpoints, så att träningen
+        kan fortsätta skriva i bufferten medan kopian sparas.
+        """
+        return {
+            "capacity": self.capacity,
+            "state_dim": self.state_dim,
+            "pos": self.pos,
+            "size": self.size,
+            "arrays": {k: np.array(v) for k, v in self.arrays.items()},
+        }
+
+    def load_state_dict(self, state):
+        """Återställer ett tillstånd från state_dict; kapaciteten måste vara densamma."""
+        if state["capacity"] != self.capacity or state["state_dim"] != self.state_dim:
+            raise ValueError(
+                f"replay buffer har capacity {self.capacity}, checkpointen {state['capacity']}"
+            )
+        for k, v in state["arrays"].items():
+            self.arrays[k][:] = v
+        self.pos = int(state["pos"])
+        self.size = int(state["size"])
+
+    def save(self, path):
+        """
+        Sparar bufferten som en katalog med .npy-filer (läsbara med np.memmap) och meta.json.
+        """
+        os.makedirs(path, exist_ok=True)
+        for k, v in self._ordered().items():
+            out = np.lib.format.open_memmap(os.path.join(path, f"{k}.npy"), mode="w+", dtype=v.dtype, shape=v.shape)
+            out[:] = v
+            out.flush()
+            del out
+        with open(os.path.join(path, "meta.json"), "w") as f:
+            json.dump({"capacity": self.capacity, "state_dim": self.state_dim, "size": self.size}, f)
+
+    @classmethod
+    def load(cls, path, capacity=None, mmap=True):
+        """
+        Läser in en sparad buffert. Med mmap=True mappas filerna copy-on-write, så nya
+        push påverkar inte filerna på disk. Med en annan capacity behålls de senaste transitionerna.
+        """
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        saved = {k: np.load(os.path.join(path, f"{k}.npy"), mmap_mode="c" if mmap else None) for k in cls.FIELDS}
+        size = meta["size"]
+        capacity = capacity or meta["capacity"]
+        if mmap and capacity == size:
+            buf = cls(capacity, meta["state_dim"], arrays=saved)
+            buf.size = size
+            return buf
+        buf = cls(capacity, meta["state_dim"])
+        buf.push_batch(saved["s"], saved["a"], saved["r"], saved["s2"], saved["d"])
+        return buf
+
+class PrioritizedReplayBuffer(ReplayBuffer):
+    """
+    Prioriterad replay (proportionell) ovanpå ReplayBuffer, med ett SumTree över positionerna:
+    - nya transitioner får den högsta prioriteten hittills, så att de samplas minst en gång
+    - sample drar stratifierat ur summaträdet och returnerar även IS-vikter och index;
+      beta går linjärt från beta_start till 1 över beta_steps anrop
+    - update_priorities sätter (|TD-fel| + eps) ** alpha för en hel minibatch på en gång
+    """
+
+    def __init__(self, capacity, state_dim=5, arrays=None, alpha=PER_ALPHA, beta_start=PER_BETA_START,
+                 beta_steps=PER_BETA_STEPS, eps=PER_EPS):
+        super().__init__(capacity, state_dim, arrays)
+        self.alpha = alpha
+        self.beta_start = beta_start
+        self.beta_steps = beta_steps
+        self.eps = eps
+        self.tree = SumTree(capacity)
+        self.max_priority = 1.0
+        self.samples = 0
+
+    @property
+    def beta(self):
+        return min(1.0, self.beta_start + (1.0 - self.beta_start) * self.samples / max(1, self.beta_steps))
+
+    def push_batch(self, s, a, r, s2, d):
+        n = min(len(a), self.capacity)
+        idx = (self.pos + np.arange(n)) % self.capacity
+        super().push_batch(s, a, r, s2, d)
+        if n:
+            self.tree.update(idx, np.full(n, self.max_priority ** self.alpha))
+
+    def sample_indices(self, batch_size):
+        """Stratifierad dragning ur summaträdet: (index, IS-vikter) som tensorer."""
+        total = self.tree.total
+        segment = total / batch_size
+        values = (np.arange(batch_size) + np.random.random(batch_size)) * segment
+        idx = np.minimum(self.tree.find(values), self.size - 1)
+        # w_i = (N * P(i)) ** -beta, normerat med den största vikten (minsta prioriteten).
+        beta = self.beta
+        probs = self.tree.leaves[idx] / total
+        weights = (probs / (self.tree.min / total)) ** -beta
+        self.samples += 1
+        return torch.from_numpy(idx), torch.from_numpy(weights.astype(np.float32))
+
+    def sample(self, batch_size):
+        """Som ReplayBuffer.sample, plus (IS-vikter, index) att skicka till update_priorities."""
+        idx, weights = self.sample_indices(batch_size)
+        batch = tuple(self.tensors[k][idx] for k in self.FIELDS)
+        return (*batch, weights, idx.numpy())
+
+    def update_priorities(self, idx, td_errors):
+        priorities = np.abs(np.asarray(td_errors, dtype=np.float64)) + self.eps
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+        self.tree.update(idx, priorities ** self.alpha)
+
+    def state_dict(self):
+        state = super().state_dict()
+        state.update({
+            "priorities": self.tree.leaves.copy(),
+            "max_priority": self.max_priority,
+            "samples": self.samples,
+        })
+        return state
+
+    def load_state_dict(self, state):
+        """Som ReplayBuffer.load_state_dict; en checkpoint utan prioriteter får max-prioritet överallt."""
+        super().load_state_dict(state)
+        if "priorities" in state:
+            self.tree.reset(state["priorities"])
+            self.max_priority = float(state["max_priority"])
+            self.samples = int(state["samples"])
+        else:
+            self._reset_priorities()
+
+    def _reset_priorities(self):
+        self.tree.reset(np.full(self.size, self.max_priority ** self.alpha))
+
+    @classmethod
+    def load(cls, path, capacity=None, mmap=True):
+        """Som ReplayBuffer.load; prioriteterna sparas inte, så alla transitioner börjar på max."""
+        buf = super().load(path, capacity, mmap)
+        buf._reset_priorities()
+        return buf
+
+def tick_transitions(state, actions, reward, next_state, done):
+    """
+    Bygger ett ticks transitioner som arrayer (s, a, r, s2, d), eller None om ticket saknar kunder.
+    Tick-rewarden delas lika mellan kunderna och varje state paras med ett slumpat state ur next_state.
+    """
+    n = len(actions)
+    if n == 0:
+        return None
+    s = np.asarray(state, dtype=np.float32)
+    if len(next_state) > 0:
+        next_arr = np.asarray(next_state, dtype=np.float32)
+        s2 = next_arr[np.random.randint(len(next_arr), size=n)]
+    else:
+        s2 = s
+    r = np.full(n, reward / n, dtype=np.float32)
+    d = np.full(n, float(done), dtype=np.float32)
+    return s, np.asarray(actions, dtype=np.int64), r, s2, d
+
+def push_tick(memory, state, actions, reward, next_state, done):
+    """
+    Lägger in ett ticks transitioner i replay buffern.
+    """
+    transitions = tick_transitions(state, actions, reward, next_state, done)
+    if transitions is not None:
+        memory.push_batch(*transitions)
+
+def optimize_model(policy_net, target_net, optimizer, memory, batch_size=BATCH_SIZE, gamma=GAMMA):
+    """
+    Ett gradientsteg på en minibatch ur replay buffern (hoppas över tills bufferten räcker).
+    Med en PrioritizedReplayBuffer viktas felen med IS-vikterna och minibatchens
+    prioriteter uppdateras med de nya TD-felen.
+    Returnerar lossen, eller None om inget steg togs.
+    """
+    if len(memory) < batch_size:
+        return None
+    prioritized = isinstance(memory, PrioritizedReplayBuffer)
+    batch = memory.sample(batch_size)
+    s_b, a_b, r_b, s2_b, d_b = batch[:5]
+    q_vals = policy_net(s_b)
+    q_val = q_vals.gather(1, a_b.unsqueeze(1)).squeeze(1)
+    with torch.no_grad():
+        next_q = target_net(s2_b).max(1)[0]
+        target = r_b + gamma * next_q * (1 - d_b)
+    if prioritized:
+        weights, idx = batch[5:]
+        td = q_val - target
+        loss = (weights * td.pow(2)).mean()
+    else:
+        loss = nn.functional.mse_loss(q_val, target)
+    optimizer.zero_grad()
+    loss.backward()
+    optimizer.step()
+    if prioritized:
+        memory.update_priorities(idx, td.detach().numpy())
+    return loss
 
 # Träningsloop Multi-Map
-def train_multi_map():
+def train_multi_map(map_sim=False, metrics=None, checkpointer=None, resume=None, prioritized=False,
+                    learner_options=None):
+    """
+    Tränar på den simulerade miljön. Med map_sim=True körs i stället den kartbaserade
+    simuleringen (env_map_simulated) på de dumpade kartorna i maps/.
+    metrics (instrumentation.Metrics) mäter tid per fas och skriver en rad per episod.
+    checkpointer (checkpoint.Checkpointer) sparar hela träningstillståndet i bakgrunden och
+    resume (en inläst checkpoint) fortsätter därifrån.
+    prioritized=True samplar ur en PrioritizedReplayBuffer i stället för likformigt.
+    learner_options (se learner.from_args) styr batchstorlek, uppdateringar per tick och kompilering.
+    """
+    metrics = metrics or instrumentation.Metrics(phases=TRAIN_PHASES, counters=TRAIN_COUNTERS)
+    checkpointer = checkpointer or checkpoint.Checkpointer(model_path=MODEL_PATH)
     maps = ["Batterytown", "Turbohill", "Clutchfield", "Thunderroad"]  # alla fyra träningskartor
+    if map_sim:
+        maps = env_map_simulated.available_maps()
+        map_envs = {m: env_map_simulated.ConsiditionEnv(m) for m in maps}
     input_dim = 5
     num_actions = 4
 
@@ -63,55 +361,53 @@ def train_multi_map():
     target_net = DQN(input_dim, num_actions)
     target_net.load_state_dict(policy_net.state_dict())
 
-    optimizer = optim.Adam(policy_net.parameters(), lr=LR)
-    memory = ReplayBuffer(MEMORY_SIZE)
+    optimizer = learner.adam(policy_net.parameters(), LR)
+    memory = (PrioritizedReplayBuffer if prioritized else ReplayBuffer)(MEMORY_SIZE, input_dim)
+    trainer = learner.Learner(
+        policy_net, target_net, optimizer, memory, **{"batch_size": BATCH_SIZE, "gamma": GAMMA, **(learner_options or {})}
+    )
     epsilon = EPS_START
     rewards_per_ep = []
+    start_episode = 0
+    if resume is not None:
+        start_episode, epsilon, rewards_per_ep = checkpoint.restore_training_state(
+            resume, policy_net, target_net, optimizer, memory
+        )
 
     # Progressionsindikator
-    progress = trange(NUM_EPISODES, desc="Tränar DQN Multi-Map", ncols=100)
+    progress = trange(start_episode, NUM_EPISODES, desc="Tränar DQN Multi-Map", ncols=100)
 
     for episode in progress:
+        metrics.begin(episode)
         # Välj slumpmässig karta
         map_name = random.choice(maps)
-        env = ConsiditionEnv()
+        env = map_envs[map_name] if map_sim else ConsiditionEnv()
         state = env.reset()
         total_reward = 0
         done = False
 
         while not done:
-            actions = []
-            for s in state:
-                if random.random() < epsilon:
-                    actions.append(random.randint(0, num_actions - 1))
-                else:
-                    with torch.no_grad():
-                        q_vals = policy_net(torch.tensor(s, dtype=torch.float32))
-                        actions.append(int(torch.argmax(q_vals).item()))
-
-            next_state, reward, done = env.step(actions)
+            with metrics.phase("act"):
+                actions = policy_net.act(state, epsilon).tolist()
+
+            with metrics.phase("env_step"):
+                next_state, reward, done = env.step(actions)
             total_reward += reward
 
-            for s, a in zip(state, actions):
-                s2 = random.choice(next_state) if len(next_state) > 0 else s
-                memory.push(s, a, reward / len(actions), s2, done)
+            with metrics.phase("push"):
+                push_tick(memory, state, actions, reward, next_state, done)
 
             state = next_state
 
-            if len(memory) >= BATCH_SIZE:
-                s_b, a_b, r_b, s2_b, d_b = memory.sample(BATCH_SIZE)
-                q_vals = policy_net(s_b)
-                q_val = q_vals.gather(1, a_b.unsqueeze(1)).squeeze(1)
-                with torch.no_grad():
-                    next_q = target_net(s2_b).max(1)[0]
-                    target = r_b + GAMMA * next_q * (1 - d_b)
-                loss = nn.functional.mse_loss(q_val, target)
-                optimizer.zero_grad()
-                loss.backward()
-                optimizer.step()
+            with metrics.phase("optimize"):
+                loss = trainer.step()
+            metrics.count("env_steps")
+            metrics.count("transitions", len(actions))
+            metrics.count("updates", trainer.updates_per_tick if loss is not None else 0)
 
         epsilon = max(EPS_END, epsilon * EPS_DECAY)
         rewards_per_ep.append(total_reward)
+        metrics.record(episode, map=map_name, reward=total_reward, epsilon=epsilon)
 
         if episode % TARGET_UPDATE == 0:
             target_net.load_state_dict(policy_net.state_dict())
@@ -119,15 +415,243 @@ def train_multi_map():
         progress.set_postfix({
             "map": map_name,
             "reward": f"{total_reward:.2f}",
-            "eps": f"{epsilon:.2f}"
+            "eps": f"{epsilon:.2f}",
+            "upd/s": f"{trainer.updates_per_sec:.0f}"
         })
 
-        if (episode + 1) % 25 == 0:
-            torch.save(policy_net.state_dict(), MODEL_PATH)
+        if checkpointer.due(episode):
+            checkpointer.save(episode, checkpoint.training_state(
+                episode, policy_net, target_net, optimizer, memory, epsilon, rewards_per_ep
+            ))
 
     # Spara slutmodell
+    checkpointer.close()
+    torch.save(policy_net.state_dict(), MODEL_PATH)
+    memory.save(BUFFER_PATH)
+    metrics.close()
+    print(f"\nTräning färdig! Modell sparad till {MODEL_PATH}")
+    print(trainer.summary())
+
+# Träningsloop med VectorEnv
+def train_multi_map_vec(num_envs=NUM_ENVS, metrics=None, checkpointer=None, resume=None, prioritized=False,
+                        learner_options=None):
+    """
+    Som train_multi_map, men kör num_envs simulerade episoder i lockstep med ett
+    batchat forward-pass per tick för alla delmiljöer. Epsilon, target-nätet och
+    sparning räknas per avslutad episod precis som i den sekventiella loopen.
+    Vid resume startar delmiljöerna om; episoder som pågick vid checkpointen spelas om.
+    """
+    metrics = metrics or instrumentation.Metrics(phases=TRAIN_PHASES, counters=TRAIN_COUNTERS)
+    checkpointer = checkpointer or checkpoint.Checkpointer(model_path=MODEL_PATH)
+    input_dim = 5
+    num_actions = 4
+
+    policy_net = DQN(input_dim, num_actions)
+    target_net = DQN(input_dim, num_actions)
+    target_net.load_state_dict(policy_net.state_dict())
+
+    optimizer = learner.adam(policy_net.parameters(), LR)
+    memory = (PrioritizedReplayBuffer if prioritized else ReplayBuffer)(MEMORY_SIZE, input_dim)
+    trainer = learner.Learner(
+        policy_net, target_net, optimizer, memory, **{"batch_size": BATCH_SIZE, "gamma": GAMMA, **(learner_options or {})}
+    )
+    epsilon = EPS_START
+    rewards_per_ep = []
+    episode = 0
+    if resume is not None:
+        episode, epsilon, rewards_per_ep = checkpoint.restore_training_state(
+            resume, policy_net, target_net, optimizer, memory
+        )
+
+    venv = VectorEnv(num_envs)
+    states, mask = venv.reset()
+
+    progress = trange(NUM_EPISODES, initial=episode, desc=f"Tränar DQN Multi-Map x{num_envs}", ncols=100)
+
+    metrics.begin(episode)
+    while episode < NUM_EPISODES:
+        with metrics.phase("act"):
+            actions = policy_net.act(states.reshape(-1, input_dim), epsilon).numpy().reshape(num_envs, -1)
+
+        with metrics.phase("env_step"):
+            next_states, next_mask, rewards, dones, info = venv.step(actions)
+
+        with metrics.phase("push"):
+            for k in range(num_envs):
+                push_tick(
+                    memory, states[k][mask[k]], actions[k][mask[k]], rewards[k],
+                    next_states[k][next_mask[k]], bool(dones[k]),
+                )
+        metrics.count("env_steps", num_envs)
+        metrics.count("transitions", int(mask.sum()))
+
+        states, mask = next_states, next_mask
+
+        with metrics.phase("optimize"):
+            loss = trainer.step()
+        metrics.count("updates", trainer.updates_per_tick if loss is not None else 0)
+
+        for _, map_name, total_reward in info["episodes"]:
+            if episode >= NUM_EPISODES:
+                break
+            epsilon = max(EPS_END, epsilon * EPS_DECAY)
+            rewards_per_ep.append(total_reward)
+            metrics.record(episode, map=map_name, reward=total_reward, epsilon=epsilon)
+            metrics.begin(episode + 1)
+
+            if episode % TARGET_UPDATE == 0:
+                target_net.load_state_dict(policy_net.state_dict())
+
+            progress.update(1)
+            progress.set_postfix({
+                "map": map_name,
+                "reward": f"{total_reward:.2f}",
+                "eps": f"{epsilon:.2f}",
+                "upd/s": f"{trainer.updates_per_sec:.0f}"
+            })
+
+            if checkpointer.due(episode):
+                checkpointer.save(episode, checkpoint.training_state(
+                    episode, policy_net, target_net, optimizer, memory, epsilon, rewards_per_ep
+                ))
+            episode += 1
+
+    progress.close()
+    checkpointer.close()
     torch.save(policy_net.state_dict(), MODEL_PATH)
+    memory.save(BUFFER_PATH)
+    metrics.close()
     print(f"\nTräning färdig! Modell sparad till {MODEL_PATH}")
+    print(trainer.summary())
+
+# Träningsloop med ContextDQN
+def train_context(map_sim=False, metrics=None, checkpointer=None, resume=None, learner_options=None):
+    """
+    Som train_multi_map, men med ContextDQN: varje tick behandlas som en (N, F)-batch med
+    en poolad kontext av stationslasten (env.station_load()) och kunderna, och replay buffern
+    sparar hela ticks. Actions skickas med kundernas
+    stabila id (env.active_ids()), rewarden tas per kund (env.customer_rewards) och varje
+    kund paras med sitt eget nästa state i stället för ett slumpat.
+    learner_options (se learner.from_args) ger batchstorlek (i ticks) och uppdateringar per tick;
+    kompilering stöds inte för ContextDQN.
+    """
+    options = learner_options or {}
+    if options.get("compile", "off") != "off":
+        raise ValueError("ContextDQN-träningen stöder inte compile")
+    batch_size = options.get("batch_size", CONTEXT_BATCH)
+    updates_per_tick = options.get("updates_per_tick", learner.UPDATES_PER_TICK)
+    metrics = metrics or instrumentation.Metrics(phases=TRAIN_PHASES, counters=TRAIN_COUNTERS)
+    checkpointer = checkpointer or checkpoint.Checkpointer(model_path=CONTEXT_MODEL_PATH)
+    maps = ["Batterytown", "Turbohill", "Clutchfield", "Thunderroad"]
+    max_customers = NUM_CUSTOMERS
+    max_stations = 0  # den kundbaserade simuleringen har inga stationer
+    if map_sim:
+        maps = env_map_simulated.available_maps()
+        map_envs = {m: env_map_simulated.ConsiditionEnv(m) for m in maps}
+        max_customers = max(len(e.customer_ids) for e in map_envs.values())
+        max_stations = max(len(e.station_nodes) for e in map_envs.values())
+    input_dim = 5
+    num_actions = 4
+
+    policy_net = ContextDQN(input_dim, num_actions)
+    target_net = ContextDQN(input_dim, num_actions)
+    target_net.load_state_dict(policy_net.state_dict())
+
+    optimizer = learner.adam(policy_net.parameters(), LR)
+    memory = TickReplayBuffer(CONTEXT_MEMORY, max_customers, input_dim, max_stations)
+    epsilon = EPS_START
+    rewards_per_ep = []
+    start_episode = 0
+    if resume is not None:
+        start_episode, epsilon, rewards_per_ep = checkpoint.restore_training_state(
+            resume, policy_net, target_net, optimizer, memory
+        )
+
+    progress = trange(start_episode, NUM_EPISODES, desc="Tränar ContextDQN Multi-Map", ncols=100)
+
+    for episode in progress:
+        metrics.begin(episode)
+        map_name = random.choice(maps)
+        env = map_envs[map_name] if map_sim else ConsiditionEnv()
+        state = env.reset()
+        ids = env.active_ids()
+        stations = env.station_load()
+        total_reward = 0
+        done = False
+
+        while not done:
+            with metrics.phase("act"):
+                actions = policy_net.act(state, epsilon, stations=stations).numpy()
+
+            with metrics.phase("env_step"):
+                next_state, reward, done = env.step(actions, ids)
+                next_ids = env.active_ids()
+                next_stations = env.station_load()
+            total_reward += reward
+
+            with metrics.phase("push"):
+                memory.push(state, ids, actions, env.customer_rewards[ids], next_state, next_ids, done,
+                            stations, next_stations)
+
+            state, ids, stations = next_state, next_ids, next_stations
+
+            with metrics.phase("optimize"):
+                loss = None
+                for _ in range(updates_per_tick):
+                    loss = optimize_context(policy_net, target_net, optimizer, memory, batch_size, GAMMA)
+            metrics.count("env_steps")
+            metrics.count("transitions", len(actions))
+            metrics.count("updates", updates_per_tick if loss is not None else 0)
+
+        epsilon = max(EPS_END, epsilon * EPS_DECAY)
+        rewards_per_ep.append(total_reward)
+        metrics.record(episode, map=map_name, reward=total_reward, epsilon=epsilon)
+
+        if episode % TARGET_UPDATE == 0:
+            target_net.load_state_dict(policy_net.state_dict())
+
+        progress.set_postfix({
+            "map": map_name,
+            "reward": f"{total_reward:.2f}",
+            "eps": f"{epsilon:.2f}"
+        })
+
+        if checkpointer.due(episode):
+            checkpointer.save(episode, checkpoint.training_state(
+                episode, policy_net, target_net, optimizer, memory, epsilon, rewards_per_ep
+            ))
+
+    checkpointer.close()
+    torch.save(policy_net.state_dict(), CONTEXT_MODEL_PATH)
+    metrics.close()
+    print(f"\nTräning färdig! Modell sparad till {CONTEXT_MODEL_PATH}")
 
 if __name__ == "__main__":
-    train_multi_map()
+    parser = argparse.ArgumentParser(description="Tränar DQN på de simulerade träningskartorna.")
+    parser.add_argument("--num-envs", type=int, default=NUM_ENVS, help="antal parallella simulerade episoder")
+    parser.add_argument("--map-sim", action="store_true", help="träna på den kartbaserade simuleringen av maps/")
+    parser.add_argument("--prioritized", action="store_true", help="prioriterad replay (summaträd, IS-vikter)")
+    parser.add_argument("--context", action="store_true",
+                        help="träna ContextDQN (delade vikter per kund, poolad tickkontext, reward per kund)")
+    instrumentation.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    learner.add_arguments(parser)
+    args = parser.parse_args()
+    if args.context and (args.num_envs > 1 or args.prioritized):
+        parser.error("--context går inte att kombinera med --num-envs eller --prioritized")
+    if args.context and args.compile != "off":
+        parser.error("--context går inte att kombinera med --compile")
+    if args.map_sim and args.num_envs > 1:
+        # VectorEnv vektoriserar bara den kundbaserade simuleringen, inte kartsimuleringen.
+        parser.error("--map-sim går inte att kombinera med --num-envs > 1")
+    metrics = instrumentation.from_args(args, TRAIN_PHASES, TRAIN_COUNTERS)
+    learner_options = learner.from_args(args)
+    checkpointer, resume = checkpoint.from_args(args, CONTEXT_MODEL_PATH if args.context else MODEL_PATH)
+    if args.context:
+        train_context(map_sim=args.map_sim, metrics=metrics, checkpointer=checkpointer, resume=resume,
+                      learner_options=learner_options)
+    elif args.num_envs > 1:
+        train_multi_map_vec(args.num_envs, metrics, checkpointer, resume, args.prioritized, learner_options)
+    else:
+        train_multi_map(map_sim=args.map_sim, metrics=metrics, checkpointer=checkpointer, resume=resume,
+                        prioritized=args.prioritized, learner_options=learner_options)
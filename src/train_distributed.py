@@ -0,0 +1,228 @@
+# Tränar DQN med flera actor-processer och en central learner.
+
+import argparse
+import os
+import queue
+import numpy as np
+import torch
+import torch.multiprocessing as mp
+from tqdm import tqdm
+from env_api_simulated import ConsiditionEnv
+from train_api_sim_4maps import (
+    BATCH_SIZE, BUFFER_PATH, EPS_DECAY, EPS_END, EPS_START, GAMMA, LR, MEMORY_SIZE, MODEL_PATH,
+    NUM_EPISODES, TARGET_UPDATE, TRAIN_COUNTERS, DQN, PrioritizedReplayBuffer, ReplayBuffer, tick_transitions,
+)
+import checkpoint
+import instrumentation
+import learner
+
+NUM_ACTORS = max(1, (os.cpu_count() or 2) - 1)
+SYNC_EVERY = 50        # learner-uppdateringar mellan varje publicering av vikterna
+TICKS_PER_MESSAGE = 10  # ticks som en actor samlar innan den skickar till learnern
+QUEUE_SIZE = 64
+DISTRIBUTED_PHASES = ("receive", "optimize", "sync")
+CHECKPOINT_DIR = "checkpoints_distributed"
+
+def _pack(transitions):
+    """Packar (s, a, r, s2, d) i en float32-tensor så att varje meddelande blir ett delat minnessegment."""
+    s, a, r, s2, d = transitions
+    return torch.from_numpy(np.concatenate([s, a[:, None].astype(np.float32), r[:, None], s2, d[:, None]], axis=1))
+
+def _unpack(packed, state_dim):
+    s = packed[:, :state_dim]
+    a = packed[:, state_dim].long()
+    r = packed[:, state_dim + 1]
+    s2 = packed[:, state_dim + 2:2 * state_dim + 2]
+    d = packed[:, 2 * state_dim + 2]
+    return s, a, r, s2, d
+
+def actor_loop(actor_id, shared_net, weights_lock, version, epsilon, out_queue, stop_event, seed):
+    """
+    Actor-process: kör den simulerade miljön med en lokal kopia av policy_net som synkas
+    från learnerns delade vikter när versionen ändrats, och strömmar transitioner till learnern.
+    """
+    torch.set_num_threads(1)
+    np.random.seed(seed)
+    env = ConsiditionEnv(seed=seed)
+    local_net = DQN(shared_net.net[0].in_features, shared_net.output_dim)
+    local_version = -1
+    pending = []
+
+    def send(item):
+        while not stop_event.is_set():
+            try:
+                out_queue.put(item, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+    while not stop_event.is_set():
+        state = env.reset()
+        total_reward = 0.0
+        done = False
+        while not done and not stop_event.is_set():
+            if version.value != local_version:
+                with weights_lock:
+                    local_net.load_state_dict(shared_net.state_dict())
+                    local_version = version.value
+
+            actions = local_net.act(state, epsilon.value).numpy()
+            next_state, reward, done = env.step(actions)
+            total_reward += reward
+
+            transitions = tick_transitions(state, actions, reward, next_state, done)
+            if transitions is not None:
+                pending.append(transitions)
+            if pending and (len(pending) >= TICKS_PER_MESSAGE or done):
+                merged = tuple(np.concatenate(parts) for parts in zip(*pending))
+                send(("transitions", actor_id, len(pending), _pack(merged)))
+                pending = []
+            state = next_state
+
+        if done:
+            send(("episode", actor_id, env.map_name, total_reward))
+
+def train_distributed(num_actors=NUM_ACTORS, metrics=None, checkpointer=None, resume=None, prioritized=False,
+                      learner_options=None):
+    """
+    Learnern äger replay buffern, optimizern och target_net. Den tömmer kön från actorerna,
+    gör gradientsteg (learner.Learner) så fort bufferten räcker och publicerar vikterna var
+    SYNC_EVERY:e uppdatering. Actorerna stegar i egen takt, så insamlingen skalar med antalet kärnor.
+    metrics, checkpointer, resume, prioritized och learner_options som i train_multi_map; faserna
+    är receive (tömma kön), optimize och sync. Vid resume startar actorerna om med de
+    återställda vikterna; episoder som pågick vid checkpointen spelas om.
+    """
+    metrics = metrics or instrumentation.Metrics(phases=DISTRIBUTED_PHASES, counters=TRAIN_COUNTERS)
+    checkpointer = checkpointer or checkpoint.Checkpointer(CHECKPOINT_DIR, model_path=MODEL_PATH)
+    input_dim = 5
+    num_actions = 4
+    ctx = mp.get_context("spawn")
+
+    policy_net = DQN(input_dim, num_actions)
+    target_net = DQN(input_dim, num_actions)
+    target_net.load_state_dict(policy_net.state_dict())
+
+    optimizer = learner.adam(policy_net.parameters(), LR)
+    memory = (PrioritizedReplayBuffer if prioritized else ReplayBuffer)(MEMORY_SIZE, input_dim)
+    trainer = learner.Learner(
+        policy_net, target_net, optimizer, memory, **{"batch_size": BATCH_SIZE, "gamma": GAMMA, **(learner_options or {})}
+    )
+    epsilon = EPS_START
+    rewards_per_ep = []
+    episode = 0
+    if resume is not None:
+        episode, epsilon, rewards_per_ep = checkpoint.restore_training_state(
+            resume, policy_net, target_net, optimizer, memory
+        )
+
+    shared_net = DQN(input_dim, num_actions)
+    shared_net.load_state_dict(policy_net.state_dict())
+    shared_net.share_memory()
+
+    weights_lock = ctx.Lock()
+    version = ctx.Value("l", 0)
+    shared_eps = ctx.Value("d", epsilon)
+    out_queue = ctx.Queue(maxsize=QUEUE_SIZE)
+    stop_event = ctx.Event()
+
+    actors = [
+        ctx.Process(
+            target=actor_loop,
+            args=(i, shared_net, weights_lock, version, shared_eps, out_queue, stop_event, 1000 + i),
+            daemon=True,
+        )
+        for i in range(num_actors)
+    ]
+    for p in actors:
+        p.start()
+
+    progress = tqdm(total=NUM_EPISODES, initial=episode, desc=f"Tränar DQN {num_actors} actors", ncols=100)
+    synced = 0
+
+    metrics.begin(episode)
+    try:
+        while episode < NUM_EPISODES:
+            # Läs högst ett meddelande per actor mellan gradientstegen; blockera bara när
+            # bufferten ännu inte räcker för en minibatch.
+            block = len(memory) < trainer.batch_size
+            finished = []
+            with metrics.phase("receive"):
+                for _ in range(num_actors):
+                    try:
+                        msg = out_queue.get(block=block, timeout=1.0 if block else None)
+                    except queue.Empty:
+                        break
+                    block = False
+                    if msg[0] == "transitions":
+                        packed = msg[3]
+                        memory.push_batch(*_unpack(packed, input_dim))
+                        metrics.count("env_steps", msg[2])
+                        metrics.count("transitions", len(packed))
+                        del packed
+                    elif msg[0] == "episode":
+                        finished.append(msg[2:])
+
+            for map_name, total_reward in finished:
+                if episode >= NUM_EPISODES:
+                    break
+                epsilon = max(EPS_END, epsilon * EPS_DECAY)
+                shared_eps.value = epsilon
+                rewards_per_ep.append(total_reward)
+                metrics.record(episode, map=map_name, reward=total_reward, epsilon=epsilon)
+                metrics.begin(episode + 1)
+                if episode % TARGET_UPDATE == 0:
+                    target_net.load_state_dict(policy_net.state_dict())
+                progress.update(1)
+                progress.set_postfix({
+                    "map": map_name,
+                    "reward": f"{total_reward:.2f}",
+                    "eps": f"{epsilon:.2f}",
+                    "upd/s": f"{trainer.updates_per_sec:.0f}",
+                })
+                if checkpointer.due(episode):
+                    checkpointer.save(episode, checkpoint.training_state(
+                        episode, policy_net, target_net, optimizer, memory, epsilon, rewards_per_ep
+                    ))
+                episode += 1
+
+            with metrics.phase("optimize"):
+                loss = trainer.step()
+            metrics.count("updates", trainer.updates_per_tick if loss is not None else 0)
+            if trainer.updates - synced >= SYNC_EVERY:
+                with metrics.phase("sync"), weights_lock:
+                    shared_net.load_state_dict(policy_net.state_dict())
+                    version.value += 1
+                synced = trainer.updates
+    finally:
+        stop_event.set()
+        # Töm kön så att inga actors hänger på put(). Meddelanden från en actor som redan
+        # avslutats kan inte längre öppnas (dess delade minne är borta) och kastas.
+        while any(p.is_alive() for p in actors):
+            try:
+                out_queue.get(timeout=0.1)
+            except (queue.Empty, OSError, EOFError):
+                pass
+        for p in actors:
+            p.join()
+        progress.close()
+        checkpointer.close()
+
+    torch.save(policy_net.state_dict(), MODEL_PATH)
+    memory.save(BUFFER_PATH)
+    metrics.close()
+    print(f"\nTräning färdig! Modell sparad till {MODEL_PATH}")
+    print(trainer.summary())
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tränar DQN med parallella actor-processer.")
+    parser.add_argument("--actors", type=int, default=NUM_ACTORS, help="antal actor-processer")
+    parser.add_argument("--prioritized", action="store_true", help="prioriterad replay (summaträd, IS-vikter)")
+    instrumentation.add_arguments(parser)
+    checkpoint.add_arguments(parser)
+    learner.add_arguments(parser)
+    parser.set_defaults(checkpoint_dir=CHECKPOINT_DIR)
+    args = parser.parse_args()
+    learner_options = learner.from_args(args)
+    checkpointer, resume = checkpoint.from_args(args, MODEL_PATH)
+    train_distributed(args.actors, instrumentation.from_args(args, DISTRIBUTED_PHASES, TRAIN_COUNTERS),
+                      checkpointer, resume, args.prioritized, learner_options)
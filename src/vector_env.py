@@ -0,0 +1,82 @@
+# Batchad vektormiljö som kör flera simulerade episoder i lockstep.
+
+import random
+import numpy as np
+from env_api_simulated import NUM_CUSTOMERS, generate_customers, simulate_step
+
+class VectorEnv:
+    """
+    K oberoende simulerade episoder, var och en med egen karta och seed, i ett gemensamt
+    (K, C)-tillstånd där C är antal kundplatser:
+    - step(actions[K, C]) stegar alla delmiljöer med ett anrop till simulate_step
+    - observationerna är en (K, C, 5) float32-array plus en mask över aktiva kunder
+    - delmiljöer som blir klara startas om automatiskt
+    """
+
+    def __init__(self, num_envs, map_names=None, max_ticks=300, seed=None):
+        self.num_envs = num_envs
+        self.map_names = map_names or ["Batterytown", "Clutchfield", "Turbohill", "Thunderroad", "Windcity"]
+        self.max_ticks = max_ticks
+        self.num_customers = NUM_CUSTOMERS
+        self.rngs = [random.Random(None if seed is None else seed + k) for k in range(num_envs)]
+
+        template = generate_customers(random.Random(0), 0, max_ticks)
+        self.customers = {
+            key: np.zeros((num_envs, self.num_customers), dtype=arr.dtype) for key, arr in template.items()
+        }
+        self.env_maps = [None] * num_envs
+        self.ticks = np.zeros(num_envs, dtype=np.int64)
+        self.episode_rewards = np.zeros(num_envs, dtype=np.float64)
+
+    def reset(self):
+        """
+        Startar om alla delmiljöer. Returnerar (states, mask).
+        """
+        for k in range(self.num_envs):
+            self._reset_env(k)
+        return self.observe()
+
+    def _reset_env(self, k):
+        rng = self.rngs[k]
+        self.env_maps[k] = rng.choice(self.map_names)
+        fresh = generate_customers(rng, self.num_customers, self.max_ticks)
+        for key, arr in fresh.items():
+            self.customers[key][k] = arr
+        self.ticks[k] = 0
+        self.episode_rewards[k] = 0.0
+
+    def observe(self):
+        """
+        Features för alla kundplatser som en (K, C, 5) float32-array samt masken över aktiva kunder.
+        Inaktiva platser innehåller inaktuella värden och ska filtreras bort med masken.
+        """
+        c = self.customers
+        states = np.empty((self.num_envs, self.num_customers, 5), dtype=np.float32)
+        states[..., 0] = c["charge"]
+        states[..., 1] = c["at_station"]
+        states[..., 2] = c["departureTick"] / self.max_ticks
+        states[..., 3] = c["dist_to_station"]
+        states[..., 4] = c["dist_to_goal"]
+        return states, c["active"].copy()
+
+    def step(self, actions):
+        """
+        Stegar alla delmiljöer. actions är en (K, C) array eller tensor med en action per kundplats.
+        Returnerar (states, mask, rewards[K], dones[K], info). För delmiljöer som blev klara är
+        states redan nästa episods startläge och info["episodes"] innehåller (k, karta, total reward).
+        """
+        acts = np.asarray(actions, dtype=np.int64).reshape(self.num_envs, self.num_customers)
+        processed = self.customers["active"].copy()
+        rewards = simulate_step(self.customers, acts, processed).sum(axis=1)
+
+        self.ticks += 1
+        self.episode_rewards += rewards
+        dones = (self.ticks >= self.max_ticks) | ~self.customers["active"].any(axis=1)
+
+        info = {"episodes": []}
+        for k in np.flatnonzero(dones):
+            info["episodes"].append((int(k), self.env_maps[k], float(self.episode_rewards[k])))
+            self._reset_env(k)
+
+        states, mask = self.observe()
+        return states, mask, rewards, dones, info